@@ -0,0 +1,126 @@
+# activity.py - Відкладений (write-behind) запис активності користувачів
+#
+# Кожне оновлення від користувача змінює лише username, full_name і
+# last_seen. Замість UPSERT і окремої транзакції на кожне повідомлення
+# зміни збираються в пам'яті (останнє значення на user_id) і пишуться
+# однією транзакцією executemany раз на ACTIVITY_FLUSH_INTERVAL секунд або
+# щойно в буфері набереться ACTIVITY_MAX_PENDING користувачів. Читання в
+# цьому процесі (overlay у user_context) накладає буфер на рядок з бази,
+# тож бачить свіжі дані ще до запису. При зупинці бота close() чекає
+# завершення run() і скидає буфер повністю.
+import asyncio
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import database as db
+import async_db as adb
+import metrics
+
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "5"))
+ACTIVITY_MAX_PENDING = int(os.getenv("ACTIVITY_MAX_PENDING", "1000"))
+
+def utc_timestamp() -> str:
+    # той самий формат, що й CURRENT_TIMESTAMP у SQLite
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+class ActivityBuffer:
+    def __init__(self, flush_interval: float = ACTIVITY_FLUSH_INTERVAL,
+                 max_pending: int = ACTIVITY_MAX_PENDING):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[int, Tuple[Optional[str], Optional[str], str]] = {}
+        self._lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopped: Optional[asyncio.Event] = None
+        self._closing = False
+        self.flushed = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record(self, user_id: int, username: str = None, full_name: str = None, at: str = None):
+        at = at or utc_timestamp()
+        with self._lock:
+            previous = self._pending.get(user_id)
+            if previous is not None:
+                # як COALESCE у запиті: порожнє значення не затирає відоме
+                username = username if username is not None else previous[0]
+                full_name = full_name if full_name is not None else previous[1]
+            self._pending[user_id] = (username, full_name, at)
+            full = len(self._pending) >= self.max_pending
+        if full and self._wakeup is not None:
+            self._wakeup.set()
+
+    def overlay(self, user_id: int, user: Optional[Dict]) -> Optional[Dict]:
+        pending = self._pending.get(user_id)
+        if pending is None:
+            return user
+        username, full_name, at = pending
+        if user is None:
+            # користувач ще не записаний у базу - значення за замовчуванням як у схемі users
+            user = {"user_id": user_id, "username": None, "full_name": None, "role": "user",
+                    "notifications_enabled": 1, "first_seen": at, "last_seen": at, "regions": ""}
+        else:
+            user = dict(user)
+        if username is not None:
+            user["username"] = username
+        if full_name is not None:
+            user["full_name"] = full_name
+        user["last_seen"] = at
+        return user
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        rows: List[Tuple] = [(user_id, *values) for user_id, values in pending.items()]
+        try:
+            db.touch_users(rows)
+        except Exception:
+            # повертаємо невдалу пачку в буфер під новішими записами
+            with self._lock:
+                for user_id, values in pending.items():
+                    self._pending.setdefault(user_id, values)
+            raise
+        self.flushed += len(rows)
+        return len(rows)
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        self._stopped = asyncio.Event()
+        try:
+            while not self._closing:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                if self._closing:
+                    break
+                try:
+                    await adb.run(self.flush)
+                except Exception as e:
+                    logging.error(f"Activity flush error: {e}")
+        finally:
+            self._wakeup = None
+            self._stopped.set()
+
+    async def close(self):
+        # Зупиняємо run() замість скасування: скасована корутина не зупиняє
+        # flush, що вже виконується в потоці пулу, і той перегнався б з
+        # останнім. Чекаємо, поки run() завершить поточний запис, і лише
+        # тоді скидаємо решту.
+        self._closing = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+            await self._stopped.wait()
+        await adb.run(self.flush)
+
+buffer = ActivityBuffer()
+
+ACTIVITY_PENDING = metrics.Gauge("activity_buffer_pending", "Users with unflushed activity",
+                                 function=lambda: len(buffer))
@@ -1,17 +1,37 @@
 # admin_panel.py - Веб-панель адміністратора
+import gzip
+import io
 import os
 import hashlib
-from datetime import datetime
+import hmac
+import threading
+from datetime import datetime, timedelta, timezone
 from functools import wraps
 
-from flask import Flask, render_template_string, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from jinja2 import DictLoader
+from werkzeug.http import http_date
 import database as db
+import metrics
+import shelter_import
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "super-secret-key-change-me")
+app.json.ensure_ascii = False
 
 ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "admin")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")
+USERS_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE", "50"))
+HISTORY_MAX_DAYS = int(os.getenv("HISTORY_MAX_DAYS", "3650"))
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_MIMETYPES = {"text/html", "application/json", "text/css", "text/plain"}
+# Bearer-токен для збору /metrics без входу в панель (Prometheus)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
@@ -52,8 +72,8 @@ BASE_TEMPLATE = """
         .btn:hover { background: #1a8cd8; }
         .btn-danger { background: #f4212e; }
         .btn-danger:hover { background: #dc1d28; }
-        input, textarea { width: 100%; padding: 1rem; border: 1px solid #2f3336; border-radius: 8px; background: #0f1419; color: #e7e9ea; margin-bottom: 1rem; font-size: 1rem; }
-        input:focus, textarea:focus { outline: none; border-color: #1d9bf0; }
+        input, textarea, select { width: 100%; padding: 1rem; border: 1px solid #2f3336; border-radius: 8px; background: #0f1419; color: #e7e9ea; margin-bottom: 1rem; font-size: 1rem; }
+        input:focus, textarea:focus, select:focus { outline: none; border-color: #1d9bf0; }
         .alert { padding: 1rem; border-radius: 8px; margin-bottom: 1rem; }
         .alert-success { background: #00ba7c20; border: 1px solid #00ba7c; color: #00ba7c; }
         .alert-error { background: #f4212e20; border: 1px solid #f4212e; color: #f4212e; }
@@ -73,6 +93,7 @@ BASE_TEMPLATE = """
             <a href="{{ url_for('users') }}">👥 Користувачі</a>
             <a href="{{ url_for('broadcast') }}">📢 Розсилка</a>
             <a href="{{ url_for('shelters') }}">🛡 Укриття</a>
+            <a href="{{ url_for('alert_history') }}">📜 Тривоги</a>
             <a href="{{ url_for('logout') }}">🚪 Вихід</a>
         </div>
     </nav>
@@ -89,7 +110,10 @@ BASE_TEMPLATE = """
 </html>
 """
 
-LOGIN_TEMPLATE = BASE_TEMPLATE.replace("{% block content %}{% endblock %}", """
+def page_template(content: str) -> str:
+    return '{% extends "base.html" %}{% block content %}' + content + '{% endblock %}'
+
+LOGIN_TEMPLATE = page_template("""
 <div class="login-container">
     <div class="card">
         <h2>🔐 Вхід в адмін-панель</h2>
@@ -102,7 +126,7 @@ LOGIN_TEMPLATE = BASE_TEMPLATE.replace("{% block content %}{% endblock %}", """
 </div>
 """)
 
-DASHBOARD_TEMPLATE = BASE_TEMPLATE.replace("{% block content %}{% endblock %}", """
+DASHBOARD_TEMPLATE = page_template("""
 <h2 style="margin-bottom: 1.5rem;">📊 Панель управління</h2>
 <div class="stats-grid">
     <div class="stat-card">
@@ -154,9 +178,24 @@ DASHBOARD_TEMPLATE = BASE_TEMPLATE.replace("{% block content %}{% endblock %}",
 </div>
 """)
 
-USERS_TEMPLATE = BASE_TEMPLATE.replace("{% block content %}{% endblock %}", """
+USERS_TEMPLATE = page_template("""
 <div class="card">
-    <h2>👥 Користувачі ({{ users|length }})</h2>
+    <h2>👥 Користувачі ({{ users_count }})</h2>
+    <form method="GET" style="display:flex; gap:1rem;">
+        <select name="role">
+            <option value="">Усі ролі</option>
+            {% for r in ['user', 'moderator'] %}
+            <option value="{{ r }}" {{ 'selected' if r == role }}>{{ r }}</option>
+            {% endfor %}
+        </select>
+        <select name="region">
+            <option value="">Усі області</option>
+            {% for r in regions %}
+            <option value="{{ r.uid }}" {{ 'selected' if r.uid == region }}>{{ r.name }}</option>
+            {% endfor %}
+        </select>
+        <button type="submit" class="btn">Фільтрувати</button>
+    </form>
     <table>
         <tr><th>ID</th><th>Ім'я</th><th>Username</th><th>Області</th><th>Роль</th><th>Останній візит</th></tr>
         {% for user in users %}
@@ -170,10 +209,14 @@ USERS_TEMPLATE = BASE_TEMPLATE.replace("{% block content %}{% endblock %}", """
         </tr>
         {% endfor %}
     </table>
+    <div style="margin-top: 1rem;">
+        {% if cursor %}<a class="btn" href="{{ url_for('users', role=role, region=region) }}">⏮ На початок</a>{% endif %}
+        {% if next_cursor %}<a class="btn" href="{{ url_for('users', role=role, region=region, cursor=next_cursor) }}">Далі ▶</a>{% endif %}
+    </div>
 </div>
 """)
 
-BROADCAST_TEMPLATE = BASE_TEMPLATE.replace("{% block content %}{% endblock %}", """
+BROADCAST_TEMPLATE = page_template("""
 <div class="card">
     <h2>📢 Розсилка повідомлень</h2>
     <form method="POST">
@@ -198,7 +241,7 @@ BROADCAST_TEMPLATE = BASE_TEMPLATE.replace("{% block content %}{% endblock %}",
 </div>
 """)
 
-SHELTERS_TEMPLATE = BASE_TEMPLATE.replace("{% block content %}{% endblock %}", """
+SHELTERS_TEMPLATE = page_template("""
 <div class="card">
     <h2>🛡 Додати укриття</h2>
     <form method="POST">
@@ -211,8 +254,21 @@ SHELTERS_TEMPLATE = BASE_TEMPLATE.replace("{% block content %}{% endblock %}", "
     </form>
 </div>
 
+<div class="card">
+    <h2>📥 Імпорт реєстру укриттів</h2>
+    <p>CSV (роздільник , ; або табуляція) або GeoJSON з точками. Колонки: область, місто, адреса, тип, місткість, широта, довгота, опис. Укриття з тими ж областю, містом, адресою і координатами оновлюються.</p>
+    <form method="POST" action="{{ url_for('import_shelters') }}" enctype="multipart/form-data">
+        <input type="file" name="file" accept=".csv,.geojson,.json" required>
+        <button type="submit" class="btn">📥 Імпортувати</button>
+    </form>
+</div>
+
 <div class="card">
     <h2>📍 Укриття ({{ shelters|length }})</h2>
+    <form method="GET">
+        <input type="text" name="q" placeholder="Пошук: місто, адреса, тип" value="{{ q }}">
+        <button type="submit" class="btn">🔎 Знайти</button>
+    </form>
     <table>
         <tr><th>Область</th><th>Місто</th><th>Адреса</th><th>Тип</th><th>Місткість</th></tr>
         {% for s in shelters %}
@@ -228,6 +284,95 @@ SHELTERS_TEMPLATE = BASE_TEMPLATE.replace("{% block content %}{% endblock %}", "
 </div>
 """)
 
+HISTORY_TEMPLATE = page_template("""
+<style>
+    .chart { display: flex; align-items: flex-end; gap: 2px; height: 200px; margin-top: 1.5rem; }
+    .chart .bar { flex: 1; background: #f4212e; border-radius: 2px 2px 0 0; min-height: 1px; }
+    .chart-axis { display: flex; justify-content: space-between; color: #71767b; font-size: 0.75rem; margin-top: 0.5rem; }
+</style>
+<div class="card">
+    <h2>📜 Історія тривог</h2>
+    <form method="GET" style="display:flex; gap:1rem;">
+        <select name="region">
+            {% for r in regions %}
+            <option value="{{ r.uid }}" {{ 'selected' if r.uid == region.uid }}>{{ r.name }}</option>
+            {% endfor %}
+        </select>
+        <select name="days">
+            {% for d in [7, 30, 90, 365] %}
+            <option value="{{ d }}" {{ 'selected' if d == days }}>{{ d }} діб</option>
+            {% endfor %}
+        </select>
+        <button type="submit" class="btn">Показати</button>
+    </form>
+    <div class="stats-grid">
+        <div class="stat-card"><h3>{{ region.alerts }}</h3><p>Тривог за {{ days }} діб</p></div>
+        <div class="stat-card"><h3>{{ region.seconds | duration }}</h3><p>Загальна тривалість</p></div>
+        <div class="stat-card"><h3>{{ region.avg_seconds | duration }}</h3><p>Середня тривалість</p></div>
+    </div>
+    <div class="chart">
+        {% for d in daily %}
+        <div class="bar" style="height: {{ (100 * d.seconds / max_seconds) | round(1) }}%"
+             title="{{ d.day }}: {{ d.alerts }} тривог, {{ d.seconds | duration }}"></div>
+        {% endfor %}
+    </div>
+    <div class="chart-axis"><span>{{ daily[0].day }}</span><span>тривалість тривог за добу</span><span>{{ daily[-1].day }}</span></div>
+</div>
+<div class="card">
+    <h2>🗺 По областях</h2>
+    <table>
+        <tr><th>Область</th><th>Тривог</th><th>Загальна тривалість</th><th>Середня тривалість</th></tr>
+        {% for r in summary %}
+        <tr>
+            <td><a href="{{ url_for('alert_history', region=r.uid, days=days) }}" style="color: inherit;">{{ r.name }}</a></td>
+            <td>{{ r.alerts }}</td>
+            <td>{{ r.seconds | duration }}</td>
+            <td>{{ r.avg_seconds | duration }}</td>
+        </tr>
+        {% endfor %}
+    </table>
+</div>
+""")
+
+# Шаблони компілюються один раз: Jinja кешує їх за назвою в app.jinja_env,
+# а не розбирає рядок заново на кожен запит, як render_template_string
+app.jinja_env.loader = DictLoader({
+    "base.html": BASE_TEMPLATE,
+    "login.html": LOGIN_TEMPLATE,
+    "dashboard.html": DASHBOARD_TEMPLATE,
+    "users.html": USERS_TEMPLATE,
+    "broadcast.html": BROADCAST_TEMPLATE,
+    "shelters.html": SHELTERS_TEMPLATE,
+    "history.html": HISTORY_TEMPLATE,
+})
+
+@app.template_filter("duration")
+def format_duration(seconds):
+    if seconds is None:
+        return "-"
+    minutes = int(seconds) // 60
+    if minutes < 60:
+        return f"{minutes} хв"
+    return f"{minutes // 60} год {minutes % 60} хв"
+
+@app.after_request
+def compress_response(response):
+    # brotli (якщо встановлений) або gzip для великих текстових відповідей
+    if (response.status_code != 200 or response.direct_passthrough
+            or response.mimetype not in COMPRESS_MIMETYPES or "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    if brotli and request.accept_encodings["br"]:
+        response.set_data(brotli.compress(data, quality=5))
+        response.headers["Content-Encoding"] = "br"
+    elif request.accept_encodings["gzip"]:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
 @app.route('/')
 def index():
     if 'logged_in' in session:
@@ -248,7 +393,7 @@ def login():
         else:
             flash('Невірний логін або пароль', 'error')
     
-    return render_template_string(LOGIN_TEMPLATE, title="Вхід")
+    return render_template("login.html", title="Вхід")
 
 @app.route('/logout')
 def logout():
@@ -258,52 +403,60 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    db.init_db()
-    users = db.get_all_users()
-    regions = db.get_all_regions()
+    recent_users, _ = db.get_users_page(limit=10)
+    stats = db.get_stats()
     broadcasts = db.get_broadcast_history()
     
-    from database import get_db
-    with get_db() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) as count FROM shelters")
-        shelters_count = cur.fetchone()["count"]
-    
-    return render_template_string(
-        DASHBOARD_TEMPLATE,
+    return render_template(
+        "dashboard.html",
         title="Дашборд",
-        users_count=len(users),
-        regions_count=len(regions),
-        shelters_count=shelters_count,
-        broadcasts_count=len(broadcasts),
-        recent_users=users[:10],
+        users_count=stats["users"],
+        regions_count=stats["regions"],
+        shelters_count=stats["shelters"],
+        broadcasts_count=stats["broadcasts"],
+        recent_users=recent_users,
         broadcasts=broadcasts[:5]
     )
 
 @app.route('/users')
 @login_required
 def users():
-    db.init_db()
-    all_users = db.get_all_users()
-    return render_template_string(USERS_TEMPLATE, title="Користувачі", users=all_users)
+    role = request.args.get('role') or None
+    region = request.args.get('region') or None
+    # курсор сторінки: "<last_seen>,<user_id>" останнього рядка попередньої
+    cursor = request.args.get('cursor')
+    after = None
+    if cursor:
+        last_seen, _, user_id = cursor.rpartition(',')
+        after = (last_seen, int(user_id)) if user_id.isdigit() else None
+    
+    page, next_after = db.get_users_page(USERS_PAGE_SIZE, after, role=role, region_uid=region)
+    return render_template(
+        "users.html",
+        title="Користувачі",
+        users=page,
+        users_count=db.get_users_count(),
+        regions=db.get_all_regions(),
+        role=role,
+        region=region,
+        cursor=cursor,
+        next_cursor=f"{next_after[0]},{next_after[1]}" if next_after else None
+    )
 
 @app.route('/broadcast', methods=['GET', 'POST'])
 @login_required
 def broadcast():
-    db.init_db()
-    
     if request.method == 'POST':
         message = request.form.get('message')
         if message:
-            users = db.get_all_users()
-            db.add_broadcast(message, session.get('username', 'admin'), len(users))
-            flash(f'Розсилка запланована для {len(users)} користувачів! Використайте /broadcast в боті.', 'success')
+            queued = db.enqueue_broadcast(message, session.get('username', 'admin'))
+            flash(f'Розсилку поставлено в чергу для {queued["recipients"]} користувачів. Бот доставить її автоматично.', 'success')
         return redirect(url_for('broadcast'))
     
     users_count = db.get_users_count()
     broadcasts = db.get_broadcast_history()
-    return render_template_string(
-        BROADCAST_TEMPLATE,
+    return render_template(
+        "broadcast.html",
         title="Розсилка",
         users_count=users_count,
         broadcasts=broadcasts
@@ -312,8 +465,6 @@ def broadcast():
 @app.route('/shelters', methods=['GET', 'POST'])
 @login_required
 def shelters():
-    db.init_db()
-    
     if request.method == 'POST':
         region = request.form.get('region')
         city = request.form.get('city')
@@ -326,24 +477,133 @@ def shelters():
             flash('Укриття додано!', 'success')
         return redirect(url_for('shelters'))
     
-    from database import get_db
-    with get_db() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM shelters ORDER BY region, city")
-        all_shelters = [dict(row) for row in cur.fetchall()]
+    q = request.args.get('q', '').strip()
+    if q:
+        all_shelters = db.search_shelters(q, limit=200)
+    else:
+        from database import get_db
+        with get_db() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT * FROM shelters ORDER BY region, city")
+            all_shelters = [dict(row) for row in cur.fetchall()]
+    
+    return render_template("shelters.html", title="Укриття", shelters=all_shelters, q=q)
+
+@app.route('/shelters/import', methods=['POST'])
+@login_required
+def import_shelters():
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Оберіть файл для імпорту', 'error')
+        return redirect(url_for('shelters'))
     
-    return render_template_string(SHELTERS_TEMPLATE, title="Укриття", shelters=all_shelters)
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    report = shelter_import.import_shelters(stream, shelter_import.detect_format(upload.filename))
+    flash(report.summary(), 'success' if report.imported else 'error')
+    for row_number, message in report.errors[:10]:
+        flash(f'Рядок {row_number}: {message}', 'error')
+    if report.failed > 10:
+        flash(f'... і ще {report.failed - 10} помилок', 'error')
+    return redirect(url_for('shelters'))
+
+def history_params():
+    # ?region=<uid або назва>&days=N; без області - найтривожніша за період
+    days = max(1, min(request.args.get('days', 30, type=int), HISTORY_MAX_DAYS))
+    summary = db.get_alert_summary(days)
+    wanted = request.args.get('region')
+    region = next((r for r in summary if wanted in (r['uid'], r['name'])), None) if wanted else None
+    return days, summary, region
+
+@app.route('/history')
+@login_required
+def alert_history():
+    days, summary, region = history_params()
+    region = region or summary[0]
+    daily = db.get_alert_daily(region['uid'], days)
+    return render_template(
+        "history.html",
+        title="Історія тривог",
+        regions=sorted(summary, key=lambda r: r['name']),
+        region=region,
+        days=days,
+        daily=daily,
+        max_seconds=max([d['seconds'] for d in daily] + [1]),
+        summary=summary
+    )
+
+@app.route('/api/alert-history')
+@login_required
+def api_alert_history():
+    # Підсумки по всіх областях; з ?region= - ще й ряд по добах для графіка,
+    # з ?since=&until= (unix-час) - окремі тривоги області в цьому діапазоні
+    days, summary, region = history_params()
+    result = {'days': days, 'regions': summary}
+    if request.args.get('region') and region is None:
+        return jsonify({'error': 'unknown region'}), 404
+    if region:
+        result['region'] = region
+        result['daily'] = db.get_alert_daily(region['uid'], days)
+        since = request.args.get('since', type=int)
+        if since is not None:
+            result['events'] = db.get_alert_events(region['uid'], since, request.args.get('until', type=int),
+                                                   limit=1000)
+    return jsonify(result)
+
+# Версія відповіді /api/stats. Flask обробляє запити в потоках, тож
+# перевірка і заміна йдуть під блокуванням, а запит працює з власним
+# знімком - ETag і Last-Modified завжди з однієї версії
+_stats_version = {"etag": None, "modified": None, "headers": {}}
+_stats_lock = threading.Lock()
 
 @app.route('/api/stats')
 @login_required
 def api_stats():
-    db.init_db()
-    return jsonify({
-        'users': db.get_users_count(),
-        'regions': len(db.get_all_regions()),
-        'broadcasts': len(db.get_broadcast_history())
+    stats = db.get_stats()
+    response = jsonify({
+        'users': stats['users'],
+        'regions': stats['regions'],
+        'shelters': stats['shelters'],
+        'broadcasts': stats['broadcasts'],
+        'subscribers': {r['name']: r['count'] for r in db.get_region_subscriber_counts()}
     })
+    # Умовний GET: ETag - хеш тіла (слабкий, бо тіло може бути стиснене),
+    # Last-Modified - момент, коли цей процес уперше побачив такий ETag
+    global _stats_version
+    etag = hashlib.sha1(response.get_data()).hexdigest()
+    with _stats_lock:
+        if etag != _stats_version["etag"]:
+            # Last-Modified має секундну точність: версія, що змінилась у ту ж
+            # секунду, отримує наступну, інакше клієнт лише з If-Modified-Since
+            # отримав би 304 на попереднє тіло
+            modified = datetime.now(timezone.utc).replace(microsecond=0)
+            if _stats_version["modified"] is not None and modified <= _stats_version["modified"]:
+                modified = _stats_version["modified"] + timedelta(seconds=1)
+            _stats_version = {"etag": etag, "modified": modified, "headers": {
+                "ETag": f'W/"{etag}"',
+                "Last-Modified": http_date(modified),
+                "Cache-Control": "private, no-cache",
+            }}
+        version = _stats_version
+    # ETag точніший за дату: If-Modified-Since лише для клієнтів без ETag
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        not_modified = bool(request.if_modified_since) and request.if_modified_since >= version["modified"]
+    if not_modified:
+        response = app.response_class(status=304)
+    response.headers.extend(version["headers"])
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    token = request.headers.get("Authorization", "")
+    authorized = METRICS_TOKEN and hmac.compare_digest(token, f"Bearer {METRICS_TOKEN}")
+    if not authorized and 'logged_in' not in session:
+        return app.response_class(status=401)
+    return app.response_class(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+# Міграції схеми - один раз при старті процесу, а не в кожному запиті
+db.init_db()
 
 if __name__ == '__main__':
-    db.init_db()
     app.run(host='0.0.0.0', port=5000, debug=False)
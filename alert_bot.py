@@ -2,35 +2,66 @@
 # Творець: Артем Процко
 
 import asyncio
+import html
 import logging
 import os
+import time
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
-from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import CommandStart, Command
+from aiogram import Dispatcher, types, F
+from aiogram.filters import CommandStart, Command, CommandObject
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.enums import ParseMode
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from aiogram.client.default import DefaultBotProperties
+from aiogram.exceptions import TelegramAPIError
 
 import database as db
+import async_db as adb
+import activity
+import metrics
+from user_context import UserContextMiddleware, cache as user_cache
+from subscription_index import index as subscriptions
+from shelter_index import index as shelter_index
+from alert_engine import engine as alert_engine, format_event
+from sender import Sender, OutboxWorker, BroadcastProgress, create_bot
+from alert_feed import AlertFeed
+from alert_timeline import TimelineRecorder, ALERTS_RECORD_FILE
+from render_cache import SnapshotRenderCache
+from webhook import run_webhook
+from fanout_workers import FanoutPool, FANOUT_WORKERS
 
 TOKEN = os.getenv("BOT_TOKEN")
 if not TOKEN:
     raise ValueError("BOT_TOKEN environment variable is required")
 
 ALERTS_TOKEN = os.getenv("ALERTS_API_TOKEN")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# У webhook-режимі з кількома репліками тривоги обробляє лише одна з них
+ALERTS_POLLER = os.getenv("ALERTS_POLLER", "1") == "1"
+SUBSCRIPTIONS_RELOAD_INTERVAL = float(os.getenv("SUBSCRIPTIONS_RELOAD_INTERVAL", "60"))
 CREATOR = "Артем Процко"
 MODERATOR_PASSWORD = os.getenv("MODERATOR_PASSWORD", "QazMlp123")
 
 logging.basicConfig(level=logging.INFO)
 
-bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+bot = create_bot(TOKEN, TELEGRAM_API_URL)
 dp = Dispatcher()
-
-db.init_db()
-db.seed_shelters()
+dp.update.outer_middleware(UserContextMiddleware(user_cache))
+dp.message.middleware(metrics.HandlerMetricsMiddleware("message"))
+dp.callback_query.middleware(metrics.HandlerMetricsMiddleware("callback_query"))
+sender = Sender(bot)
+# Доставка з outbox: у цьому процесі або в пулі процесів-шардів
+outbox = FanoutPool(TOKEN, TELEGRAM_API_URL) if FANOUT_WORKERS else OutboxWorker(sender)
+alert_feed = AlertFeed(ALERTS_TOKEN)
+status_cache = SnapshotRenderCache()
+# Історія знімків для відтворення офлайн (benchmarks/bench_replay.py)
+recorder = TimelineRecorder(ALERTS_RECORD_FILE) if ALERTS_RECORD_FILE else None
+MAX_LOCATION_BUTTONS = 60
+HISTORY_DAYS = 30
+HISTORY_MAX_DAYS = 365
+# /broadcast перестає оновлювати статус, якщо розсилка стільки секунд не просувається
+BROADCAST_STALL_TIMEOUT = float(os.getenv("BROADCAST_STALL_TIMEOUT", "120"))
 
 REGIONS = [
     "Київська область", "Сумська область", "Харківська область", "Чернігівська область",
@@ -58,33 +89,28 @@ main_menu = ReplyKeyboardMarkup(
     resize_keyboard=True
 )
 
-async def get_alerts_status():
-    if not ALERTS_TOKEN:
-        return None
-    try:
-        from alerts_in_ua import AsyncClient as AlertsClient
-        client = AlertsClient(token=ALERTS_TOKEN)
-        alerts = await client.get_active_alerts()
-        return alerts
-    except Exception as e:
-        logging.error(f"Error fetching alerts: {e}")
-        return None
-
-def format_alert_status(alerts, user_regions: list = None):
-    if alerts is None:
-        return "⚠️ Не вдалося отримати дані про тривоги. Перевірте API токен."
-    
+location_menu = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="📍 Надіслати геолокацію", request_location=True)],
+        [KeyboardButton(text="⬅️ Меню")]
+    ],
+    resize_keyboard=True
+)
+
+def format_data_age(snapshot) -> str:
+    age = int(snapshot.age)
+    if age < 60:
+        return f"🕐 Дані оновлено {age} с тому"
+    return f"🕐 Дані оновлено {age // 60} хв тому"
+
+def render_alert_status(snapshot, user_regions: tuple) -> str:
+    # Зіставлення за UID області з API: тривога в районі чи громаді належить
+    # своїй області, а "м. Київ" і "Київська область" не плутаються
+    region_uids = {alert_engine.uids_by_name.get(region) for region in user_regions}
     active_alerts = []
-    try:
-        air_raid_alerts = alerts.get_air_raid_alerts()
-        for alert in air_raid_alerts:
-            if user_regions:
-                if any(region in alert.location_title for region in user_regions):
-                    active_alerts.append(alert)
-            else:
-                active_alerts.append(alert)
-    except:
-        pass
+    for alert in snapshot.get_air_raid_alerts():
+        if not user_regions or alert_engine.resolve_region(alert) in region_uids:
+            active_alerts.append(alert)
     
     if not active_alerts:
         if user_regions:
@@ -94,21 +120,26 @@ def format_alert_status(alerts, user_regions: list = None):
     text = "🔴 <b>УВАГА! Повітряна тривога:</b>\n\n"
     for alert in active_alerts[:10]:
         text += f"🚨 {alert.location_title}\n"
-        if hasattr(alert, 'started_at') and alert.started_at:
+        if alert.started_at:
             text += f"   ⏰ Початок: {alert.started_at}\n"
     
     text += f"\n📊 Всього активних тривог: {len(active_alerts)}"
     text += "\n\n⚠️ <b>Прямуйте до укриття!</b>"
     return text
 
+def format_alert_status(snapshot, user_regions: list = None):
+    if snapshot is None:
+        return "⚠️ Не вдалося отримати дані про тривоги. Перевірте API токен."
+    
+    # Текст залежить лише від знімка і набору областей - рендеримо його раз
+    # на набір, а рядок "дані оновлено N с тому" додаємо до кожної відповіді
+    key = tuple(user_regions) if user_regions else ()
+    text = status_cache.get(snapshot, key, lambda: render_alert_status(snapshot, key))
+    return f"{text}\n\n{format_data_age(snapshot)}"
+
 @dp.message(CommandStart())
 async def start(message: types.Message):
-    user = db.add_or_update_user(
-        message.from_user.id,
-        message.from_user.username,
-        message.from_user.full_name
-    )
-    
+    # користувача записує UserContextMiddleware (через activity.buffer)
     await message.answer(
         f"🇺🇦 <b>Карта Тривог України</b>\n\n"
         f"Отримуйте сповіщення про тривоги в реальному часі.\n"
@@ -119,13 +150,12 @@ async def start(message: types.Message):
     )
 
 @dp.callback_query(F.data.startswith("region:"))
-async def choose_region(callback: types.CallbackQuery):
+async def choose_region(callback: types.CallbackQuery, user_regions: list):
     region = callback.data.split(":", 1)[1]
-    user_regions = db.get_user_regions(callback.from_user.id)
     
     if region not in user_regions:
         user_regions.append(region)
-        db.update_user_regions(callback.from_user.id, user_regions)
+        await adb.update_user_regions(callback.from_user.id, user_regions)
 
     await callback.answer("✅ Область додано")
     await callback.message.answer(
@@ -135,8 +165,7 @@ async def choose_region(callback: types.CallbackQuery):
     )
 
 @dp.message(F.text == "🗺 Моя область")
-async def my_region(message: types.Message):
-    user_regions = db.get_user_regions(message.from_user.id)
+async def my_region(message: types.Message, user_regions: list):
     if user_regions:
         kb = InlineKeyboardBuilder()
         kb.button(text="➕ Додати область", callback_data="add_region")
@@ -160,24 +189,89 @@ async def add_region_callback(callback: types.CallbackQuery):
 
 @dp.callback_query(F.data == "clear_regions")
 async def clear_regions_callback(callback: types.CallbackQuery):
-    db.update_user_regions(callback.from_user.id, [])
+    await adb.update_user_regions(callback.from_user.id, [])
     await callback.answer("✅ Всі області очищено")
     await callback.message.answer("Області очищено. Оберіть нові:", reply_markup=regions_keyboard())
 
 @dp.message(F.text == "🚨 Статус тривоги")
-async def alarm_status(message: types.Message):
-    await message.answer("⏳ Отримую дані про тривоги...")
-    
-    user_regions = db.get_user_regions(message.from_user.id)
-    alerts = await get_alerts_status()
-    status_text = format_alert_status(alerts, user_regions if user_regions else None)
+async def alarm_status(message: types.Message, user_regions: list):
+    snapshot = await alert_feed.get()
+    status_text = format_alert_status(snapshot, user_regions if user_regions else None)
     
     await message.answer(status_text)
 
-@dp.message(F.text == "🛡 Укриття поруч")
-async def shelter(message: types.Message):
-    user_regions = db.get_user_regions(message.from_user.id)
+def format_duration(seconds: int) -> str:
+    minutes = seconds // 60
+    if minutes < 1:
+        return "<1 хв"
+    if minutes < 60:
+        return f"{minutes} хв"
+    return f"{minutes // 60} год {minutes % 60} хв"
+
+def format_alert_time(ts: int) -> str:
+    return datetime.fromtimestamp(ts, db.HISTORY_TZ).strftime("%d.%m %H:%M")
+
+def find_region(query: str) -> list:
+    # Точний збіг з назвою чи короткою назвою ("Київ" - м. Київ, "Київська" -
+    # область), далі - початок назви, і лише потім входження підрядка
+    query = query.lower()
+    short = lambda r: r.lower().removeprefix("м. ").removesuffix(" область")
+    for match in (lambda r: query in (r.lower(), short(r)),
+                  lambda r: r.lower().startswith(query) or short(r).startswith(query),
+                  lambda r: query in r.lower()):
+        found = [r for r in REGIONS if match(r)]
+        if found:
+            return found[:1]
+    return []
+
+def parse_history_args(args: str) -> tuple:
+    # "/history", "/history 7", "/history Харків", "/history Харків 7"
+    days, words = HISTORY_DAYS, []
+    for word in (args or "").split():
+        if word.isdecimal():
+            days = max(1, min(int(word), HISTORY_MAX_DAYS))
+        else:
+            words.append(word)
+    query = " ".join(words)
+    return days, find_region(query) if query else None
+
+def format_history(days: int, summary: list, last: dict) -> str:
+    text = f"📜 <b>Історія тривог за {days} діб</b>\n"
+    for row in summary:
+        text += f"\n<b>{row['name']}</b>\n🚨 Тривог: {row['alerts']}\n"
+        if row["finished"]:
+            text += f"⏱ Разом: {format_duration(row['seconds'])} · в середньому {format_duration(row['avg_seconds'])}\n"
+        alert = last.get(row["uid"])
+        if alert and alert["ended_at"] is None:
+            text += f"🔴 Триває з {format_alert_time(alert['started_at'])}\n"
+        elif alert:
+            duration = format_duration(alert["ended_at"] - alert["started_at"])
+            text += f"🕒 Остання: {format_alert_time(alert['started_at'])} ({duration})\n"
+    return text
+
+@dp.message(Command("history"))
+async def history(message: types.Message, command: CommandObject, user_regions: list):
+    days, regions = parse_history_args(command.args)
+    if regions == []:
+        await message.answer("😔 Не знайшов такої області. Приклад: <code>/history Харків</code>")
+        return
+    if regions is None:
+        regions = user_regions
+    if not regions:
+        await message.answer(
+            "📜 Історія тривог за вашими областями: /history\n"
+            "За інший період чи область: <code>/history 7</code>, <code>/history Харків 90</code>\n\n"
+            "Спершу оберіть область: 🗺 Моя область"
+        )
+        return
     
+    region_uids = [alert_engine.uids_by_name[r] for r in regions if r in alert_engine.uids_by_name]
+    summary = await adb.get_alert_summary(days, region_uids)
+    last = await adb.get_last_alerts(region_uids)
+    await message.answer(format_history(days, summary, last))
+
+@dp.message(F.text == "🛡 Укриття поруч")
+async def shelter(message: types.Message, user_regions: list):
     kb = InlineKeyboardBuilder()
     for region in (user_regions if user_regions else REGIONS[:8]):
         kb.button(text=region, callback_data=f"shelter:{region}")
@@ -188,21 +282,52 @@ async def shelter(message: types.Message):
         "Оберіть область для пошуку укриттів:",
         reply_markup=kb.as_markup()
     )
+    await message.answer(
+        "📍 Або надішліть свою геолокацію - покажу найближчі укриття.",
+        reply_markup=location_menu
+    )
+
+def format_distance(km: float) -> str:
+    return f"{int(km * 1000)} м" if km < 1 else f"{km:.1f} км"
+
+def format_shelter(s: dict) -> str:
+    emoji = "🚇" if s["shelter_type"] == "метро" else "🏠"
+    distance = f" - {format_distance(s['distance_km'])}" if "distance_km" in s else ""
+    text = f"{emoji} <b>{html.escape(s['city'], quote=False)}</b>{distance}\n"
+    text += f"   📍 {html.escape(s['address'], quote=False)}\n"
+    if s["capacity"]:
+        text += f"   👥 Місткість: ~{s['capacity']} осіб\n"
+    return text + "\n"
+
+@dp.message(Command("shelter"))
+async def search_shelters(message: types.Message, command: CommandObject):
+    if not command.args:
+        await message.answer(
+            "🔎 Пошук укриття за містом, адресою чи типом:\n"
+            "<code>/shelter Хрещатик</code>\n<code>/shelter Львів підвал</code>"
+        )
+        return
+    
+    shelters = await adb.search_shelters(command.args, limit=10)
+    
+    if shelters:
+        text = f"🔎 <b>Знайдено укриттів: {len(shelters)}</b>\n\n"
+        for s in shelters:
+            text += format_shelter(s)
+    else:
+        text = f"😔 За запитом «{html.escape(command.args, quote=False)}» укриттів не знайдено."
+    
+    await message.answer(text)
 
 @dp.callback_query(F.data.startswith("shelter:"))
 async def show_shelters(callback: types.CallbackQuery):
     region = callback.data.split(":", 1)[1]
-    shelters = db.get_shelters_by_region(region)
+    shelters = await adb.get_shelters_by_region(region, limit=10)
     
     if shelters:
         text = f"🛡 <b>Укриття в {region}:</b>\n\n"
-        for s in shelters[:10]:
-            emoji = "🚇" if s["shelter_type"] == "метро" else "🏠"
-            text += f"{emoji} <b>{s['city']}</b>\n"
-            text += f"   📍 {s['address']}\n"
-            if s["capacity"]:
-                text += f"   👥 Місткість: ~{s['capacity']} осіб\n"
-            text += "\n"
+        for s in shelters:
+            text += format_shelter(s)
     else:
         text = f"😔 На жаль, укриття для {region} ще не додано в базу.\n\n"
         text += "Рекомендуємо:\n• Станції метро\n• Підземні паркінги\n• Підвали будинків"
@@ -210,33 +335,99 @@ async def show_shelters(callback: types.CallbackQuery):
     await callback.message.answer(text)
     await callback.answer()
 
+@dp.message(F.location)
+async def nearest_shelters(message: types.Message):
+    shelters = await adb.run(
+        shelter_index.nearest_shelters, message.location.latitude, message.location.longitude
+    )
+    
+    if shelters:
+        text = "🛡 <b>Найближчі укриття:</b>\n\n"
+        for s in shelters:
+            text += format_shelter(s)
+    else:
+        text = "😔 Поруч з вами укриттів у базі не знайдено.\n\n"
+        text += "Рекомендуємо:\n• Станції метро\n• Підземні паркінги\n• Підвали будинків"
+    
+    await message.answer(text, reply_markup=main_menu)
+
+@dp.message(F.text == "⬅️ Меню")
+async def back_to_menu(message: types.Message):
+    await message.answer("Головне меню", reply_markup=main_menu)
+
 @dp.message(F.text == "🔔 Налаштування")
-async def settings(message: types.Message):
-    user = db.get_user(message.from_user.id)
+async def settings(message: types.Message, user: dict, user_regions: list):
     notifications = "увімкнено" if user and user.get("notifications_enabled", 1) else "вимкнено"
     
     kb = InlineKeyboardBuilder()
     kb.button(text="🔕 Вимкнути сповіщення" if notifications == "увімкнено" else "🔔 Увімкнути сповіщення", 
               callback_data="toggle_notifications")
     kb.button(text="🗺 Змінити області", callback_data="add_region")
+    kb.button(text="📍 Райони та громади", callback_data="locations")
     kb.adjust(1)
     
     await message.answer(
         f"⚙️ <b>Налаштування</b>\n\n"
         f"🔔 Сповіщення: <b>{notifications}</b>\n"
-        f"🗺 Обрані області: {len(db.get_user_regions(message.from_user.id))}",
+        f"🗺 Обрані області: {len(user_regions)}",
         reply_markup=kb.as_markup()
     )
 
+async def locations_keyboard(user_id: int, user_regions: list):
+    # Лише локації з обраних областей, про які вже були тривоги (довідник
+    # поповнюється з потоку API); спершу райони, потім громади
+    region_uids = {alert_engine.uids_by_name.get(r) for r in user_regions}
+    subscribed = {l["uid"] for l in await adb.get_user_locations(user_id)}
+    known = sorted(
+        (l for l in await adb.get_locations() if l["region_uid"] in region_uids),
+        key=lambda l: (l["location_type"] != "raion", l["title"])
+    )
+    kb = InlineKeyboardBuilder()
+    for l in known[:MAX_LOCATION_BUTTONS]:
+        mark = "✅ " if l["uid"] in subscribed else ""
+        kb.button(text=f"{mark}{l['title']}", callback_data=f"loc:{l['uid']}")
+    kb.adjust(2)
+    return kb.as_markup() if known else None
+
+async def send_locations(message: types.Message, user_id: int, user_regions: list):
+    markup = await locations_keyboard(user_id, user_regions)
+    if markup is None:
+        await message.answer(
+            "📍 Для ваших областей ще немає відомих районів і громад.\n\n"
+            "Вони з'являються після першої тривоги на їх рівні. Спершу оберіть область: 🗺 Моя область"
+        )
+        return
+    await message.answer(
+        "📍 <b>Райони та громади</b>\n\n"
+        "Оберіть, щоб отримувати тривоги саме для них (✅ - підписано):",
+        reply_markup=markup
+    )
+
+@dp.message(Command("locations"))
+async def locations(message: types.Message, user_regions: list):
+    await send_locations(message, message.from_user.id, user_regions)
+
+@dp.callback_query(F.data == "locations")
+async def locations_callback(callback: types.CallbackQuery, user_regions: list):
+    await send_locations(callback.message, callback.from_user.id, user_regions)
+    await callback.answer()
+
+@dp.callback_query(F.data.startswith("loc:"))
+async def toggle_location(callback: types.CallbackQuery, user_regions: list):
+    added = await adb.toggle_user_location(callback.from_user.id, callback.data.split(":", 1)[1])
+    await callback.answer("✅ Підписку додано" if added else "Підписку знято")
+    markup = await locations_keyboard(callback.from_user.id, user_regions)
+    if markup is not None:
+        await callback.message.edit_reply_markup(reply_markup=markup)
+
 @dp.callback_query(F.data == "toggle_notifications")
 async def toggle_notifications(callback: types.CallbackQuery):
     await callback.answer("✅ Налаштування змінено")
     await callback.message.answer("Налаштування сповіщень змінено.")
 
 @dp.message(F.text == "👤 Мій профіль")
-async def profile(message: types.Message):
-    user = db.get_user(message.from_user.id)
-    user_regions = db.get_user_regions(message.from_user.id)
+async def profile(message: types.Message, user: dict, user_regions: list):
+    user_locations = await adb.get_user_locations(message.from_user.id)
     
     await message.answer(
         f"👤 <b>Ваш профіль</b>\n\n"
@@ -244,33 +435,35 @@ async def profile(message: types.Message):
         f"👤 Ім'я: {message.from_user.full_name}\n"
         f"📛 Username: @{message.from_user.username or 'не вказано'}\n"
         f"🎭 Роль: {user['role'] if user else 'user'}\n"
-        f"🗺 Області: {len(user_regions)}\n\n"
+        f"🗺 Області: {len(user_regions)}\n"
+        f"📍 Райони та громади: {len(user_locations)}\n\n"
         f"📅 Перший візит: {user['first_seen'][:10] if user else 'сьогодні'}"
     )
 
 @dp.message(F.text == "ℹ️ Про бота")
 async def about(message: types.Message):
-    users_count = db.get_users_count()
+    users_count = await adb.get_users_count()
     await message.answer(
         f"🇺🇦 <b>Карта Тривог v2.0</b>\n\n"
         f"Бот для сповіщень про повітряні тривоги в Україні.\n\n"
         f"📊 Джерело: alerts.in.ua\n"
         f"👥 Користувачів: {users_count}\n\n"
         f"👤 Творець: {CREATOR}\n\n"
+        f"🔎 Пошук укриттів: /shelter назва\n"
+        f"📜 Історія тривог: /history\n"
         f"🔗 Адмін-панель: /admin"
     )
 
 @dp.message(F.text == MODERATOR_PASSWORD)
 async def moderator_login(message: types.Message):
-    db.update_user_role(message.from_user.id, "moderator")
+    await adb.update_user_role(message.from_user.id, "moderator")
     await message.delete()
     await message.answer("✅ Ви отримали статус <b>МОДЕРАТОР</b>")
 
 @dp.message(Command("admin"))
-async def admin_info(message: types.Message):
-    user = db.get_user(message.from_user.id)
+async def admin_info(message: types.Message, user: dict):
     if user and user.get("role") in ["moderator", "admin"]:
-        users_count = db.get_users_count()
+        users_count = await adb.get_users_count()
         await message.answer(
             f"🔧 <b>Адмін панель</b>\n\n"
             f"👥 Всього користувачів: {users_count}\n\n"
@@ -283,8 +476,7 @@ async def admin_info(message: types.Message):
         await message.answer("⛔ У вас немає доступу до адмін-панелі")
 
 @dp.message(Command("broadcast"))
-async def broadcast_command(message: types.Message):
-    user = db.get_user(message.from_user.id)
+async def broadcast_command(message: types.Message, user: dict):
     if not user or user.get("role") not in ["moderator", "admin"]:
         return await message.answer("⛔ У вас немає доступу")
     
@@ -292,75 +484,161 @@ async def broadcast_command(message: types.Message):
     if not text:
         return await message.answer("Використання: /broadcast [текст повідомлення]")
     
-    users = db.get_all_users()
-    sent = 0
-    for u in users:
+    queued = await adb.enqueue_broadcast(text, str(message.from_user.id))
+    outbox.notify()
+    status = await message.answer(f"📤 Розсилка поставлена в чергу: {queued['recipients']} отримувачів")
+    
+    progress = BroadcastProgress(queued["recipients"])
+    last_done, last_change = 0, time.monotonic()
+    while progress.remaining > 0:
+        await asyncio.sleep(3)
+        counts = await adb.get_outbox_progress(queued["message_id"])
+        progress.sent, progress.failed = counts[db.OUTBOX_SENT], counts[db.OUTBOX_FAILED]
+        if progress.done != last_done:
+            last_done, last_change = progress.done, time.monotonic()
+        elif time.monotonic() - last_change > BROADCAST_STALL_TIMEOUT:
+            # воркер упав або рядки чекають на кінець оренди - доставку
+            # завершить outbox, а хендлер перестає стежити за нею
+            return await message.answer(
+                f"⚠️ Розсилка не просувається {int(BROADCAST_STALL_TIMEOUT)} с. "
+                f"Надіслано {progress.sent} з {progress.total}, решту буде доставлено у фоні."
+            )
+        eta = f"{int(progress.eta)} с" if progress.eta is not None else "—"
         try:
-            await bot.send_message(u["user_id"], f"📢 <b>Оголошення:</b>\n\n{text}")
-            sent += 1
-            await asyncio.sleep(0.05)
-        except:
+            await status.edit_text(
+                f"📤 <b>Розсилка</b>\n\n"
+                f"✅ Надіслано: {progress.sent}\n"
+                f"❌ Помилок: {progress.failed}\n"
+                f"⏳ Залишилось: {progress.remaining}\n"
+                f"🕐 Орієнтовно: {eta}"
+            )
+        except TelegramAPIError:
             pass
     
-    db.add_broadcast(text, str(message.from_user.id), sent)
-    await message.answer(f"✅ Повідомлення надіслано {sent} користувачам")
+    await message.answer(f"✅ Повідомлення надіслано {progress.sent} користувачам")
 
 @dp.message(Command("stats"))
-async def stats_command(message: types.Message):
-    user = db.get_user(message.from_user.id)
+async def stats_command(message: types.Message, user: dict):
     if not user or user.get("role") not in ["moderator", "admin"]:
         return await message.answer("⛔ У вас немає доступу")
     
-    users = db.get_all_users()
-    regions = db.get_all_regions()
-    
-    region_stats = {}
-    for u in users:
-        for r in u.get("regions", "").split(","):
-            if r:
-                region_stats[r] = region_stats.get(r, 0) + 1
-    
-    top_regions = sorted(region_stats.items(), key=lambda x: x[1], reverse=True)[:5]
+    stats = await adb.get_stats()
+    top_regions = (await adb.get_region_subscriber_counts())[:5]
     
     text = f"📊 <b>Статистика бота</b>\n\n"
-    text += f"👥 Всього користувачів: {len(users)}\n"
+    text += f"👥 Всього користувачів: {stats['users']}\n"
+    text += f"🛡 Укриттів: {stats['shelters']}\n"
+    text += f"📢 Розсилок: {stats['broadcasts']}\n"
     text += f"🗺 Топ областей:\n"
-    for region, count in top_regions:
-        text += f"  • {region}: {count}\n"
+    for region in top_regions:
+        text += f"  • {region['name']}: {region['count']}\n"
     
     await message.answer(text)
 
+def alert_recipients(event) -> list:
+    if event.location_uid is None:
+        # тривога на всю область стосується і підписників її районів/громад
+        recipients = set(subscriptions.users_for_regions([event.region_uid]))
+        recipients.update(db.get_location_subscribers(region_uid=event.region_uid))
+        return sorted(recipients)
+    # тривога в районі/громаді - її підписникам і підписникам усієї області;
+    # поки в області діє тривога на всю область, ті вже сповіщені
+    recipients = set(db.get_location_subscribers(alert_engine.location_subtree(event.location_uid)))
+    if event.region_uid not in alert_engine.active:
+        recipients.update(subscriptions.users_for_regions([event.region_uid]))
+    return sorted(recipients)
+
+def alert_message_key(event) -> str:
+    target = event.region_uid if event.location_uid is None else f"loc:{event.location_uid}"
+    return f"alert:{target}:{event.kind}:{event.at.isoformat()}"
+
+def enqueue_alert_events(air_raid_alerts) -> list:
+    # Переходи станів і черга доставки зберігаються однією транзакцією:
+    # після збою або все вже в outbox, або подію буде виявлено повторно
+    with db.get_db():
+        events = alert_engine.process(air_raid_alerts)
+        for event in events:
+            recipients = alert_recipients(event)
+            if not recipients:
+                continue
+            db.enqueue_message(
+                alert_message_key(event),
+                "alert",
+                format_event(event),
+                recipients
+            )
+    return events
+
+async def process_snapshot(snapshot):
+    try:
+        events = await adb.run(enqueue_alert_events, snapshot.get_air_raid_alerts())
+    except Exception:
+        await adb.run(alert_engine.load)
+        raise
+    if events:
+        outbox.notify()
+
+async def on_snapshot(snapshot):
+    # Спершу тривоги, потім запис історії: збій необов'язкового запису
+    # (диск заповнений, немає прав) не має зупиняти сповіщення
+    try:
+        if ALERTS_POLLER:
+            await process_snapshot(snapshot)
+    finally:
+        if recorder:
+            try:
+                recorder.record(snapshot)
+            except Exception as e:
+                logging.error(f"Alert timeline record error: {e}")
+
 async def check_alerts_loop():
+    await alert_feed.run(on_snapshot if ALERTS_POLLER or recorder else None)
+
+async def reload_subscriptions_loop():
+    # Підписки, змінені іншими репліками, не проходять через слухача БД
+    # цього процесу, тож індекс періодично перечитується з бази
     while True:
+        await asyncio.sleep(SUBSCRIPTIONS_RELOAD_INTERVAL)
         try:
-            if ALERTS_TOKEN:
-                alerts = await get_alerts_status()
-                if alerts:
-                    try:
-                        air_raids = alerts.get_air_raid_alerts()
-                        for alert in air_raids:
-                            region_name = alert.location_title
-                            users = db.get_users_by_region(region_name)
-                            for user in users[:5]:
-                                try:
-                                    await bot.send_message(
-                                        user["user_id"],
-                                        f"🚨 <b>ТРИВОГА!</b>\n\n{region_name}\n\n⚠️ Прямуйте до укриття!"
-                                    )
-                                except:
-                                    pass
-                    except:
-                        pass
+            await adb.run(subscriptions.load)
         except Exception as e:
-            logging.error(f"Alert check error: {e}")
-        
-        await asyncio.sleep(240)
+            logging.error(f"Subscriptions reload error: {e}")
 
 async def main():
-    asyncio.create_task(check_alerts_loop())
-    await bot.delete_webhook(drop_pending_updates=True)
-    print("✅ Бот 'Карта Тривог' v2.0 запущено!")
-    await dp.start_polling(bot)
+    await adb.run(db.init_db)
+    await adb.run(subscriptions.load)
+    await adb.run(alert_engine.load)
+    db.add_listener(subscriptions.on_db_event)
+    db.add_listener(user_cache.on_db_event)
+    outbox_task = asyncio.create_task(outbox.run())
+    activity_task = asyncio.create_task(activity.buffer.run())
+    metrics_server = await metrics.start_server() if metrics.METRICS_PORT else None
+    alerts_task = asyncio.create_task(check_alerts_loop()) if ALERTS_TOKEN else None
+    reload_task = None
+    try:
+        if BOT_MODE == "webhook":
+            if ALERTS_POLLER:
+                reload_task = asyncio.create_task(reload_subscriptions_loop())
+            print("✅ Бот 'Карта Тривог' v2.0 запущено (webhook)!")
+            await run_webhook(dp, bot)
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            print("✅ Бот 'Карта Тривог' v2.0 запущено!")
+            await dp.start_polling(bot)
+    finally:
+        await activity.buffer.close()
+        await activity_task
+        if metrics_server:
+            await metrics_server.cleanup()
+        if alerts_task:
+            alerts_task.cancel()
+        if reload_task:
+            reload_task.cancel()
+        outbox_task.cancel()
+        await alert_feed.close()
+        if recorder:
+            recorder.close()
+        adb.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
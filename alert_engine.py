@@ -0,0 +1,179 @@
+# alert_engine.py - Автомат станів тривог: сповіщення лише про початок і відбій
+#
+# Кожен отриманий знімок активних тривог порівнюється зі станом областей,
+# збереженим у regions.alert_status ('A' - тривога, 'N' - немає). Назовні
+# віддаються тільки переходи, тож розсилка пропорційна змінам, а не
+# кількості активних тривог × опитувань. Після перезапуску стан читається з
+# бази, і вже відомі тривоги повторно не розсилаються.
+#
+# Тривоги зіставляються з областями за UID з API, а не за назвою: кожна
+# тривога (область, район, громада чи місто) несе location_oblast_uid, який
+# через таблицю region_by_api_uid за O(1) дає regions.uid. Тривоги на рівні
+# районів і громад ведуться окремо (таблиця locations) для підписок на
+# частину області; довідник локацій поповнюється з самого потоку тривог.
+#
+# Кожен перехід також записується в історію (alert_events) з денними
+# підсумками по областях (alert_daily) - для /history і графіка в адмінці.
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import database as db
+
+STATUS_ACTIVE = "A"
+STATUS_NONE = "N"
+
+EVENT_START = "start"
+EVENT_END = "end"
+
+LOCATION_OBLAST = "oblast"
+LOCATION_RAION = "raion"
+
+@dataclass(frozen=True)
+class AlertEvent:
+    kind: str
+    region_uid: str
+    region_name: str
+    at: datetime = field(default_factory=datetime.now)
+    # None - тривога на всю область, інакше UID району/громади з API
+    location_uid: Optional[str] = None
+
+class AlertEngine:
+    def __init__(self):
+        self.active: Set[str] = set()
+        self.names: Dict[str, str] = {}
+        self.uids_by_name: Dict[str, str] = {}
+        self.region_by_api_uid: Dict[str, str] = {}
+        self.locations: Dict[str, Dict] = {}
+        self.children: Dict[str, List[str]] = {}
+        self.active_locations: Set[str] = set()
+        self._raions: Dict[Tuple[str, str], str] = {}
+        self._new_locations: List[Tuple[str, str, str, str, Optional[str]]] = []
+
+    def load(self):
+        regions = db.get_all_regions()
+        self.names = {r["uid"]: r["name"] for r in regions}
+        self.uids_by_name = {r["name"]: r["uid"] for r in regions}
+        self.region_by_api_uid = {r["api_uid"]: r["uid"] for r in regions if r["api_uid"]}
+        self.active = {r["uid"] for r in regions if r["alert_status"] == STATUS_ACTIVE}
+        self.locations, self.children, self._raions = {}, {}, {}
+        for location in db.get_locations():
+            self._add_location(location)
+        self.active_locations = {
+            uid for uid, location in self.locations.items() if location["alert_status"] == STATUS_ACTIVE
+        }
+        self._new_locations = []
+
+    def _add_location(self, location: Dict):
+        self.locations[location["uid"]] = location
+        if location["parent_uid"]:
+            self.children.setdefault(location["parent_uid"], []).append(location["uid"])
+        if location["location_type"] == LOCATION_RAION:
+            self._raions[(location["region_uid"], location["title"])] = location["uid"]
+
+    def resolve_region(self, alert) -> Optional[str]:
+        # UID області з API; назва - лише запасний варіант для тривог без UID
+        return (self.region_by_api_uid.get(alert.location_oblast_uid)
+                or self.region_by_api_uid.get(alert.location_uid)
+                or self.uids_by_name.get(alert.location_title))
+
+    def is_region_wide(self, alert) -> bool:
+        if alert.location_uid:
+            return alert.location_type == LOCATION_OBLAST or alert.location_uid in self.region_by_api_uid
+        return alert.location_title in self.uids_by_name
+
+    def _learn(self, alert, region_uid: str):
+        # Нова локація: районна прив'язка громади - за назвою району в межах області
+        parent_uid = None
+        if alert.location_type != LOCATION_RAION and alert.location_raion:
+            parent_uid = self._raions.get((region_uid, alert.location_raion))
+        location = {
+            "uid": alert.location_uid, "title": alert.location_title,
+            "location_type": alert.location_type or "hromada", "region_uid": region_uid,
+            "parent_uid": parent_uid, "alert_status": STATUS_NONE,
+        }
+        self._add_location(location)
+        self._new_locations.append((location["uid"], location["title"], location["location_type"],
+                                    region_uid, parent_uid))
+
+    def active_uids(self, alerts: Iterable) -> Tuple[Set[str], Set[str]]:
+        regions: Set[str] = set()
+        locations: Set[str] = set()
+        for alert in alerts:
+            region_uid = self.resolve_region(alert)
+            if region_uid is None:
+                continue
+            if self.is_region_wide(alert):
+                regions.add(region_uid)
+            elif alert.location_uid:
+                if alert.location_uid not in self.locations:
+                    self._learn(alert, region_uid)
+                locations.add(alert.location_uid)
+        return regions, locations
+
+    def location_name(self, uid: str) -> str:
+        location = self.locations[uid]
+        return f"{location['title']} ({self.names.get(location['region_uid'], '')})"
+
+    def location_subtree(self, uid: str) -> List[str]:
+        # Локація і всі вкладені (район -> громади)
+        uids, stack = [], [uid]
+        while stack:
+            current = stack.pop()
+            uids.append(current)
+            stack.extend(self.children.get(current, ()))
+        return uids
+
+    def diff(self, active: Set[str], active_locations: Optional[Set[str]] = None) -> List[AlertEvent]:
+        now = datetime.now()
+        events = [AlertEvent(EVENT_START, uid, self.names[uid], now) for uid in sorted(active - self.active)]
+        events += [AlertEvent(EVENT_END, uid, self.names[uid], now) for uid in sorted(self.active - active)]
+        if active_locations is not None:
+            for kind, uids in ((EVENT_START, active_locations - self.active_locations),
+                               (EVENT_END, self.active_locations - active_locations)):
+                events += [
+                    AlertEvent(kind, self.locations[uid]["region_uid"], self.location_name(uid), now, uid)
+                    for uid in sorted(uids)
+                ]
+        return events
+
+    def apply(self, events: List[AlertEvent]):
+        # Зберігаємо всі переходи однією транзакцією і лише потім оновлюємо
+        # стан у пам'яті, щоб збій запису не розсинхронізував їх
+        new_locations = self._new_locations
+        with db.get_db():
+            if new_locations:
+                db.upsert_locations(new_locations)
+            for event in events:
+                status = STATUS_ACTIVE if event.kind == EVENT_START else STATUS_NONE
+                if event.location_uid is None:
+                    db.update_region_status(event.region_uid, status)
+                else:
+                    db.update_location_status(event.location_uid, status)
+                # Історія тривог (alert_events, alert_daily) - в тій самій транзакції
+                at = int(event.at.timestamp())
+                if event.kind == EVENT_START:
+                    db.open_alert_event(event.region_uid, event.location_uid, at)
+                else:
+                    db.close_alert_event(event.region_uid, event.location_uid, at)
+        self._new_locations = []
+        for event in events:
+            target = self.active if event.location_uid is None else self.active_locations
+            uid = event.region_uid if event.location_uid is None else event.location_uid
+            if event.kind == EVENT_START:
+                target.add(uid)
+            else:
+                target.discard(uid)
+
+    def process(self, alerts: Iterable) -> List[AlertEvent]:
+        events = self.diff(*self.active_uids(alerts))
+        if events or self._new_locations:
+            self.apply(events)
+        return events
+
+def format_event(event: AlertEvent) -> str:
+    if event.kind == EVENT_START:
+        return f"🚨 <b>ТРИВОГА!</b>\n\n{event.region_name}\n\n⚠️ Прямуйте до укриття!"
+    return f"🟢 <b>Відбій тривоги</b>\n\n{event.region_name}\n\nБудьте обережні!"
+
+engine = AlertEngine()
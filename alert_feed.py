@@ -0,0 +1,141 @@
+# alert_feed.py - Спільний знімок активних тривог в пам'яті
+#
+# Один фоновий поллер ходить в API alerts.in.ua і тримає незмінний знімок
+# з часом отримання. Хендлери читають знімок без мережевих запитів, а
+# одночасні оновлення зливаються в один запит до API.
+#
+# ALERTS_API_URL перемикає поллер з клієнта alerts_in_ua на прямий запит
+# {ALERTS_API_URL}/v1/alerts/active.json через aiohttp - для власного
+# проксі/дзеркала API або заглушки в навантажувальних тестах.
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Awaitable, Callable, Optional, Tuple
+
+import metrics
+
+ALERTS_POLL_INTERVAL = float(os.getenv("ALERTS_POLL_INTERVAL", "30"))
+ALERTS_API_URL = os.getenv("ALERTS_API_URL")
+
+@dataclass(frozen=True)
+class ActiveAlert:
+    location_title: str
+    location_type: str = ""
+    location_uid: str = ""
+    location_oblast: str = ""
+    location_oblast_uid: str = ""
+    location_raion: str = ""
+    alert_type: str = "air_raid"
+    started_at: Optional[datetime] = None
+
+    @classmethod
+    def from_api(cls, alert) -> "ActiveAlert":
+        return cls(
+            location_title=alert.location_title,
+            location_type=getattr(alert, "location_type", "") or "",
+            location_uid=str(getattr(alert, "location_uid", "") or ""),
+            location_oblast=getattr(alert, "location_oblast", "") or "",
+            location_oblast_uid=str(getattr(alert, "location_oblast_uid", "") or ""),
+            location_raion=getattr(alert, "location_raion", "") or "",
+            alert_type=getattr(alert, "alert_type", "air_raid") or "air_raid",
+            started_at=getattr(alert, "started_at", None),
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ActiveAlert":
+        # сирий JSON API: started_at - рядок ISO 8601
+        started_at = data.get("started_at")
+        if isinstance(started_at, str):
+            try:
+                started_at = datetime.fromisoformat(started_at.replace("Z", "+00:00"))
+            except ValueError:
+                started_at = None
+        return cls.from_api(SimpleNamespace(**{**data, "started_at": started_at}))
+
+@dataclass(frozen=True)
+class AlertSnapshot:
+    alerts: Tuple[ActiveAlert, ...]
+    fetched_at: float = field(default_factory=time.time)
+
+    def get_air_raid_alerts(self) -> Tuple[ActiveAlert, ...]:
+        return tuple(alert for alert in self.alerts if alert.alert_type == "air_raid")
+
+    @property
+    def age(self) -> float:
+        return max(0.0, time.time() - self.fetched_at)
+
+class AlertFeed:
+    def __init__(self, token: Optional[str], interval: float = ALERTS_POLL_INTERVAL,
+                 api_url: Optional[str] = ALERTS_API_URL):
+        self.token = token
+        self.interval = interval
+        self.api_url = api_url.rstrip("/") if api_url else None
+        self.snapshot: Optional[AlertSnapshot] = None
+        self._client = None
+        self._inflight: Optional[asyncio.Task] = None
+
+    async def _fetch(self) -> AlertSnapshot:
+        if self.api_url:
+            return await self._fetch_raw()
+        if self._client is None:
+            from alerts_in_ua import AsyncClient as AlertsClient
+            self._client = AlertsClient(token=self.token)
+        alerts = await self._client.get_active_alerts()
+        return AlertSnapshot(tuple(ActiveAlert.from_api(alert) for alert in alerts))
+
+    async def _fetch_raw(self) -> AlertSnapshot:
+        import aiohttp
+
+        if self._client is None:
+            self._client = aiohttp.ClientSession(
+                headers={"Authorization": f"Bearer {self.token}"},
+                timeout=aiohttp.ClientTimeout(total=max(self.interval, 10)),
+            )
+        async with self._client.get(f"{self.api_url}/v1/alerts/active.json") as response:
+            response.raise_for_status()
+            data = await response.json()
+        return AlertSnapshot(tuple(ActiveAlert.from_dict(alert) for alert in data.get("alerts", ())))
+
+    async def close(self):
+        if self.api_url and self._client is not None:
+            await self._client.close()
+        self._client = None
+
+    async def _refresh(self) -> Optional[AlertSnapshot]:
+        started = time.perf_counter()
+        try:
+            self.snapshot = await self._fetch()
+        except Exception as e:
+            metrics.ALERTS_POLL_ERRORS.inc(error=type(e).__name__)
+            logging.error(f"Error fetching alerts: {e}")
+        finally:
+            metrics.ALERTS_POLL_SECONDS.observe(time.perf_counter() - started)
+        return self.snapshot
+
+    async def refresh(self) -> Optional[AlertSnapshot]:
+        # Усі, хто прийшов під час запиту, чекають на той самий результат
+        if not self.token:
+            return None
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.create_task(self._refresh())
+        return await asyncio.shield(self._inflight)
+
+    async def get(self) -> Optional[AlertSnapshot]:
+        if self.snapshot is None:
+            return await self.refresh()
+        return self.snapshot
+
+    async def run(self, on_snapshot: Optional[Callable[[AlertSnapshot], Awaitable]] = None):
+        while True:
+            previous = self.snapshot
+            snapshot = await self.refresh()
+            if on_snapshot and snapshot is not None and snapshot is not previous:
+                try:
+                    await on_snapshot(snapshot)
+                except Exception as e:
+                    logging.error(f"Alert check error: {e}")
+            await asyncio.sleep(self.interval)
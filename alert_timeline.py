@@ -0,0 +1,122 @@
+# alert_timeline.py - Запис і читання історії знімків тривог (JSONL з дельтами)
+#
+# Запуск: python alert_timeline.py info timeline.jsonl
+# Бот з ALERTS_RECORD_FILE дописує в файл кожну зміну знімка: рядок
+# {"t": час, "+": [нові/змінені тривоги], "-": [ключі знятих]}. Перший запис
+# після відкриття файлу - повний знімок {"t": ..., "=": [...]}, тож файл
+# можна дописувати після перезапуску без читання попереднього стану.
+# Тривога зберігається списком значень у порядку FIELDS, ключ - location_uid
+# (або назва, якщо UID немає). Незмінні опитування у файл не потрапляють.
+# read_timeline() відновлює послідовність знімків для відтворення
+# (benchmarks/bench_replay.py).
+import argparse
+import json
+import os
+from dataclasses import astuple
+from datetime import datetime
+from typing import Dict, Iterator, Optional, Tuple
+
+from alert_feed import ActiveAlert, AlertSnapshot
+
+ALERTS_RECORD_FILE = os.getenv("ALERTS_RECORD_FILE")
+
+FIELDS = ("location_title", "location_type", "location_uid", "location_oblast",
+          "location_oblast_uid", "location_raion", "alert_type", "started_at")
+
+def alert_key(alert: ActiveAlert) -> str:
+    return alert.location_uid or alert.location_title
+
+def _encode(alert: ActiveAlert) -> list:
+    values = list(astuple(alert))
+    started_at = values[-1]
+    values[-1] = started_at.isoformat() if isinstance(started_at, datetime) else started_at
+    return values
+
+def _decode(values: list) -> ActiveAlert:
+    alert = dict(zip(FIELDS, values))
+    started_at = alert.get("started_at")
+    if isinstance(started_at, str):
+        try:
+            alert["started_at"] = datetime.fromisoformat(started_at)
+        except ValueError:
+            pass
+    return ActiveAlert(**alert)
+
+class TimelineRecorder:
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._state: Optional[Dict[str, list]] = None
+        self.records = 0
+
+    def record(self, snapshot: AlertSnapshot) -> bool:
+        state = {alert_key(alert): _encode(alert) for alert in snapshot.alerts}
+        if state == self._state:
+            return False
+        if self._state is None:
+            entry = {"t": snapshot.fetched_at, "=": list(state.values())}
+        else:
+            entry = {"t": snapshot.fetched_at}
+            added = [values for key, values in state.items() if self._state.get(key) != values]
+            removed = [key for key in self._state if key not in state]
+            if added:
+                entry["+"] = added
+            if removed:
+                entry["-"] = removed
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        # рядок одразу на диск: після падіння втрачається щонайбільше остання зміна
+        self._file.flush()
+        self._state = state
+        self.records += 1
+        return True
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def read_timeline(path: str) -> Iterator[Tuple[float, AlertSnapshot]]:
+    state: Dict[str, ActiveAlert] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "=" in entry:
+                state = {}
+                added = entry["="]
+            else:
+                added = entry.get("+", ())
+            for key in entry.get("-", ()):
+                state.pop(key, None)
+            for values in added:
+                alert = _decode(values)
+                state[alert_key(alert)] = alert
+            yield entry["t"], AlertSnapshot(tuple(state.values()), fetched_at=entry["t"])
+
+def summarize(path: str) -> Dict:
+    snapshots, peak, first, last = 0, 0, None, None
+    for t, snapshot in read_timeline(path):
+        snapshots += 1
+        peak = max(peak, len(snapshot.alerts))
+        first = t if first is None else first
+        last = t
+    return {
+        "snapshots": snapshots,
+        "duration_s": (last - first) if snapshots else 0.0,
+        "peak_active_alerts": peak,
+        "bytes": os.path.getsize(path),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Історія знімків тривог")
+    sub = parser.add_subparsers(dest="command", required=True)
+    info = sub.add_parser("info", help="коротка статистика файлу")
+    info.add_argument("file")
+    args = parser.parse_args()
+    print(json.dumps(summarize(args.file), ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
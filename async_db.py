@@ -0,0 +1,40 @@
+# async_db.py - Асинхронний двійник database.py для хендлерів бота
+#
+# Кожна публічна функція database.py доступна тут як корутина з тим самим
+# іменем і сигнатурою. Виклик виконується у виділеному пулі потоків, тож
+# повільний запис чи очікування блокування SQLite не зупиняє event loop.
+# Синхронний API в database.py лишається без змін (його використовує admin_panel.py).
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+import database as db
+
+DB_WORKERS = int(os.getenv("DB_WORKERS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+_wrapped: Dict[str, Callable] = {}
+
+async def run(func: Callable, *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+def _make_async(func: Callable) -> Callable:
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run(func, *args, **kwargs)
+    return wrapper
+
+def __getattr__(name: str) -> Callable:
+    if name in _wrapped:
+        return _wrapped[name]
+    func = getattr(db, name, None)
+    if name.startswith("_") or not callable(func) or getattr(func, "__module__", None) != db.__name__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    _wrapped[name] = _make_async(func)
+    return _wrapped[name]
+
+def shutdown(wait: bool = True):
+    _executor.shutdown(wait=wait)
@@ -0,0 +1,97 @@
+# bench_activity.py - Запис активності користувачів: UPSERT на оновлення vs write-behind буфер
+#
+# Запуск: python benchmarks/bench_activity.py [--updates 50000] [--users 20000] [--concurrency 50]
+# Кожне синтетичне оновлення - повідомлення від випадкового користувача.
+# Порівнюється add_or_update_user на кожне оновлення (через пул потоків
+# async_db, як у хендлерах) і activity.ActivityBuffer з пакетним скиданням.
+# Працює на тимчасовій базі, alerts_bot.db не змінюється.
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(), "bench_activity.db"))
+
+import database as db
+import async_db as adb
+from activity import ActivityBuffer
+
+async def lag_monitor(samples: list, stop: asyncio.Event, interval: float = 0.005):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append((loop.time() - started - interval) * 1000)
+
+async def run_case(handler, user_ids, concurrency: int) -> dict:
+    samples = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(lag_monitor(samples, stop))
+    queue = iter(user_ids)
+
+    async def worker():
+        for user_id in queue:
+            await handler(user_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+    samples.sort()
+    return {
+        "rate": len(user_ids) / elapsed,
+        "elapsed": elapsed,
+        "lag_p50": statistics.median(samples) if samples else 0.0,
+        "lag_p99": samples[int(len(samples) * 0.99)] if samples else 0.0,
+    }
+
+async def main(updates: int, users: int, concurrency: int, max_pending: int):
+    db.init_db()
+    rnd = random.Random(5)
+    user_ids = [rnd.randint(1, users) for _ in range(updates)]
+
+    async def direct(user_id: int):
+        await adb.add_or_update_user(user_id, f"user{user_id}", f"User {user_id}")
+
+    buffer = ActivityBuffer(flush_interval=1.0, max_pending=max_pending)
+    flusher = asyncio.create_task(buffer.run())
+    await asyncio.sleep(0)
+
+    async def buffered(user_id: int):
+        # окремий діапазон user_id, щоб перевірити вставку нових рядків
+        user_id += users
+        buffer.record(user_id, f"user{user_id}", f"User {user_id}")
+        # хендлер віддає керування loop, як після відповіді користувачу
+        await asyncio.sleep(0)
+
+    results = {"per-update UPSERT": await run_case(direct, user_ids, concurrency)}
+    results["write-behind buffer"] = await run_case(buffered, user_ids, concurrency)
+    started = time.perf_counter()
+    await buffer.close()
+    await flusher
+    final_flush = time.perf_counter() - started
+
+    # буфер має записати ту саму кількість користувачів, що й прямий UPSERT
+    assert db.get_users_count() == 2 * len(set(user_ids))
+    print(f"updates: {updates:,}, distinct users: {len(set(user_ids)):,}, concurrency: {concurrency}")
+    for name, r in results.items():
+        print(f"{name:20} {r['rate']:>10,.0f} updates/s  ({r['elapsed']:.2f} s)  "
+              f"loop lag p50 {r['lag_p50']:.2f} ms, p99 {r['lag_p99']:.2f} ms")
+    print(f"buffer rows flushed: {buffer.flushed:,} (final flush {final_flush * 1000:.1f} ms)")
+    adb.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=50_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--max-pending", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.updates, args.users, args.concurrency, args.max_pending))
@@ -0,0 +1,73 @@
+# bench_admin_panel.py - Пропускна здатність адмін-панелі (Flask test_client)
+#
+# Запуск: python benchmarks/bench_admin_panel.py [--seconds 3] [--users 20000] [--shelters 2000]
+# Заповнює тимчасову базу і ганяє GET-запити до основних сторінок у циклі,
+# рахуючи запити за секунду і розмір відповіді з Accept-Encoding: gzip, br
+# та без нього. Для /api/stats також перевіряється умовний GET (If-None-Match).
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+PAGES = ["/dashboard", "/users", "/shelters", "/broadcast", "/api/stats"]
+
+def seed(db, users: int, shelters: int):
+    rnd = random.Random(5)
+    with db.get_db() as conn:
+        conn.executemany(
+            "INSERT INTO users (user_id, username, full_name, last_seen) VALUES (?, ?, ?, datetime('now', ?))",
+            [(i, f"user{i}", f"User {i}", f"-{rnd.randint(0, 10**6)} seconds") for i in range(1, users + 1)])
+        conn.executemany("INSERT INTO user_regions (user_id, region_uid) VALUES (?, ?)",
+                         [(i, str(rnd.randint(1, 25))) for i in range(1, users + 1)])
+    db.upsert_shelters([("Київська область", "Київ", f"вул. Тестова, {i}", "підвал", 100, None, None, None)
+                        for i in range(shelters)])
+
+def throughput(client, path: str, seconds: float, headers: dict) -> tuple:
+    count, size = 0, 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        response = client.get(path, headers=headers)
+        assert response.status_code in (200, 304), (path, response.status_code)
+        size = len(response.data)
+        count += 1
+    return count / seconds, size
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--shelters", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DB_FILE"] = str(Path(tmp) / "bench.db")
+        import database as db
+        import admin_panel
+        db.init_db()
+        seed(db, args.users, args.shelters)
+
+        client = admin_panel.app.test_client()
+        with client.session_transaction() as session:
+            session["logged_in"] = True
+            session["username"] = "bench"
+
+        print(f"{'page':12} {'req/s':>8} {'bytes':>9} {'req/s gz':>9} {'bytes gz':>9}")
+        for path in PAGES:
+            plain, plain_size = throughput(client, path, args.seconds, {})
+            packed, packed_size = throughput(client, path, args.seconds, {"Accept-Encoding": "gzip, br"})
+            print(f"{path:12} {plain:8.0f} {plain_size:9} {packed:9.0f} {packed_size:9}")
+
+        etag = client.get("/api/stats").headers.get("ETag")
+        if etag:
+            rate, _ = throughput(client, "/api/stats", args.seconds, {"If-None-Match": etag})
+            print(f"/api/stats If-None-Match: {client.get('/api/stats', headers={'If-None-Match': etag}).status_code}"
+                  f", {rate:.0f} req/s")
+        db.close_pool()
+
+if __name__ == "__main__":
+    main()
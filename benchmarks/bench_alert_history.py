@@ -0,0 +1,109 @@
+# bench_alert_history.py - Запити до історії тривог: денні підсумки vs сканування alert_events
+#
+# Запуск: python benchmarks/bench_alert_history.py [--years 3] [--per-day 4] [--raion-per-day 10]
+# Засіває тимчасову базу синтетичною історією: --per-day тривог на всю
+# область і --raion-per-day районних тривог на добу в кожній області.
+# Порівнюються підсумки за 30 діб і за весь період з alert_daily (як у
+# /history та адмінці) і той самий агрегат напряму з alert_events; окремо -
+# ряд по добах, тривоги області за місяць і запис початку/відбою.
+# Працює на тимчасовій базі, alerts_bot.db не змінюється.
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(), "bench_alert_history.db"))
+
+import database as db
+
+DAY = 86400
+
+def seed_history(years: float, per_day: float, raion_per_day: float, rnd: random.Random) -> int:
+    regions = [r["uid"] for r in db.get_all_regions()]
+    now = int(time.time())
+    start = now - int(years * 365 * DAY)
+    rows = []
+    for region_uid in regions:
+        for location_uid, rate in ((None, per_day), ("raion", raion_per_day)):
+            t = start
+            while True:
+                t += int(rnd.expovariate(rate / DAY))
+                if t >= now - DAY:
+                    break
+                uid = None if location_uid is None else f"{region_uid}-{rnd.randrange(6)}"
+                rows.append((region_uid, uid, t, t + int(rnd.expovariate(1 / 2400)) + 60))
+    with db.get_db() as conn:
+        conn.executemany(
+            "INSERT INTO alert_events (region_uid, location_uid, started_at, ended_at) VALUES (?, ?, ?, ?)",
+            rows)
+    return len(rows)
+
+def raw_summary(days: int) -> list:
+    # Той самий агрегат без підсумків: діапазон за started_at по всіх областях
+    since = int(time.time()) - days * DAY
+    with db.get_db() as conn:
+        return conn.execute("""
+            SELECT region_uid, COUNT(*) AS alerts, COUNT(ended_at) AS finished,
+                   COALESCE(SUM(ended_at - started_at), 0) AS seconds
+            FROM alert_events
+            WHERE location_uid IS NULL AND started_at >= ?
+            GROUP BY region_uid
+        """, (since,)).fetchall()
+
+def timed(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+def main(years: float, per_day: float, raion_per_day: float, repeat: int):
+    db.init_db()
+    rnd = random.Random(11)
+    started = time.perf_counter()
+    events = seed_history(years, per_day, raion_per_day, rnd)
+    seeded = time.perf_counter() - started
+    started = time.perf_counter()
+    db.rebuild_alert_daily()
+    rebuilt = time.perf_counter() - started
+    with db.get_db() as conn:
+        rollup_rows = conn.execute("SELECT COUNT(*) FROM alert_daily").fetchone()[0]
+    region_uid = db.get_all_regions()[0]["uid"]
+    all_days = int(years * 365)
+
+    print(f"alert_events: {events} рядків (засів {seeded:.1f} с), alert_daily: {rollup_rows} рядків "
+          f"(перерахунок {rebuilt:.2f} с)")
+    print(f"{'запит':<40} {'мс (медіана)':>14}")
+    cases = [
+        ("підсумки 30 діб, alert_daily", lambda: db.get_alert_summary(30)),
+        ("підсумки 30 діб, alert_events", lambda: raw_summary(30)),
+        (f"підсумки {all_days} діб, alert_daily", lambda: db.get_alert_summary(all_days)),
+        (f"підсумки {all_days} діб, alert_events", lambda: raw_summary(all_days)),
+        ("ряд 365 діб однієї області", lambda: db.get_alert_daily(region_uid, 365)),
+        ("тривоги області за 30 діб", lambda: db.get_alert_events(region_uid, int(time.time()) - 30 * DAY)),
+        ("остання тривога 25 областей", lambda: db.get_last_alerts([r["uid"] for r in db.get_all_regions()])),
+    ]
+    for name, func in cases:
+        print(f"{name:<40} {timed(func, repeat):>14.3f}")
+
+    def open_close():
+        at = int(time.time())
+        with db.get_db():
+            db.open_alert_event(region_uid, None, at)
+            db.close_alert_event(region_uid, None, at + 600)
+    print(f"{'початок + відбій (одна транзакція)':<40} {timed(open_close, repeat):>14.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=float, default=3)
+    parser.add_argument("--per-day", type=float, default=4, help="тривог на всю область на добу")
+    parser.add_argument("--raion-per-day", type=float, default=10, help="районних тривог на добу в області")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    main(args.years, args.per_day, args.raion_per_day, args.repeat)
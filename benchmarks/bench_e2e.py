@@ -0,0 +1,212 @@
+# bench_e2e.py - Наскрізне навантаження: тривога -> outbox -> доставка всім підписникам
+#
+# Запуск: python benchmarks/bench_e2e.py [--users 100000] [--alerted-regions 5] [--output result.json]
+# Піднімає заглушки Bot API (fake_telegram) і alerts.in.ua (fake_alerts),
+# засіває тимчасову базу синтетичними користувачами і запускає справжній
+# alert_bot.main(): Dispatcher у режимі polling, check_alerts_loop, outbox.
+# Після прогріву заглушка починає віддавати тривоги в --alerted-regions
+# областях, а в чергу оновлень кладеться --updates повідомлень від
+# користувачів. Результат - JSON (stdout і --output) для порівняння прогонів:
+# повідомлень/с, час від появи тривоги до останньої доставки, затримка
+# event loop і пікове RSS процесу.
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_telegram import FakeTelegramAPI, synthetic_message_update
+from fake_alerts import FakeAlertsAPI, oblast_alert
+
+ALERT_MARKER = "ТРИВОГА!"
+STATUS_TEXT = "🚨 Статус тривоги"
+SEED_BATCH = 50_000
+
+def peak_rss_mb() -> float:
+    # ru_maxrss у Linux - кілобайти
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def seed_users(db, users: int, regions: list, rnd: random.Random):
+    # 1-3 області на користувача, великі області популярніші
+    weights = [1 / (i + 1) for i in range(len(regions))]
+    with db.get_db() as conn:
+        uids = {row["name"]: row["uid"] for row in conn.execute("SELECT name, uid FROM regions")}
+    for start in range(1, users + 1, SEED_BATCH):
+        ids = range(start, min(start + SEED_BATCH, users + 1))
+        subscriptions = set()
+        for user_id in ids:
+            for region in rnd.choices(regions, weights, k=rnd.choice((1, 1, 2, 3))):
+                subscriptions.add((user_id, uids[region]))
+        with db.get_db() as conn:
+            conn.executemany("INSERT INTO users (user_id, username, full_name) VALUES (?, ?, ?)",
+                             [(user_id, f"user{user_id}", f"User {user_id}") for user_id in ids])
+            conn.executemany("INSERT INTO user_regions (user_id, region_uid) VALUES (?, ?)",
+                             sorted(subscriptions))
+
+async def lag_monitor(samples: list, stop: asyncio.Event, interval: float = 0.01):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append((loop.time() - started - interval) * 1000)
+
+def percentile(values: list, q: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+def alert_outbox_done(db) -> tuple:
+    # (рядків тривоги в outbox, з них ще не доставлено)
+    with db.get_db() as conn:
+        row = conn.execute("""
+            SELECT COUNT(*) AS total,
+                   COALESCE(SUM(o.status IN ('pending', 'sending')), 0) AS open
+            FROM outbox o JOIN outbox_messages m ON m.id = o.message_id
+            WHERE m.kind = 'alert'
+        """).fetchone()
+        return row["total"], row["open"]
+
+async def wait_until(predicate, timeout: float, interval: float = 0.05):
+    deadline = time.perf_counter() + timeout
+    while not await predicate():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("benchmark step did not finish in time")
+        await asyncio.sleep(interval)
+
+async def run(args) -> dict:
+    telegram = FakeTelegramAPI(latency=args.latency, rate_limit_ratio=args.rate_limit_ratio,
+                               blocked_ratio=args.blocked_ratio)
+    alerts = FakeAlertsAPI(error_ratio=args.alerts_error_ratio)
+    os.environ.update({
+        "BOT_TOKEN": "123456:BENCH",
+        "TELEGRAM_API_URL": await telegram.start(),
+        "ALERTS_API_TOKEN": "bench",
+        "ALERTS_API_URL": await alerts.start(),
+        "ALERTS_POLL_INTERVAL": str(args.poll_interval),
+        "SEND_RATE": str(args.send_rate),
+        "SEND_CONCURRENCY": str(args.send_concurrency),
+        "METRICS_PORT": "0",
+    })
+
+    import alert_bot
+    import metrics
+    db, adb = alert_bot.db, alert_bot.adb
+    logging.getLogger("aiogram").setLevel(logging.WARNING)
+
+    rnd = random.Random(args.seed)
+    started = time.perf_counter()
+    await adb.run(db.init_db)
+    await adb.run(seed_users, db, args.users, alert_bot.REGIONS, rnd)
+    seed_seconds = time.perf_counter() - started
+    rss_after_seed = peak_rss_mb()
+
+    bot_task = asyncio.create_task(alert_bot.main())
+    # бот готовий, коли поллер тривог уже зробив запит і polling отримав getUpdates
+    await wait_until(lambda: _ready(alerts, telegram), timeout=60)
+
+    alerted = alert_bot.REGIONS[:args.alerted_regions]
+    telegram.track(ALERT_MARKER)
+    samples = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(lag_monitor(samples, stop))
+    handled_before = metrics.HANDLER_SECONDS.count(event="message", handler="alarm_status")
+
+    t0 = time.perf_counter()
+    alerts.set_alerts(oblast_alert(region) for region in alerted)
+    # оновлення лише від тих, хто не блокував бота: 403 на відповідь - шум у лозі
+    senders = [user_id for user_id in range(1, args.users + 1) if not telegram.is_blocked(user_id)]
+    for _ in range(args.updates):
+        telegram.push_update(synthetic_message_update(rnd.choice(senders), STATUS_TEXT))
+
+    async def delivered() -> bool:
+        total, open_rows = await adb.run(alert_outbox_done, db)
+        return total > 0 and open_rows == 0
+
+    await wait_until(delivered, timeout=args.timeout)
+    handled = metrics.HANDLER_SECONDS.count(event="message", handler="alarm_status") - handled_before
+    await wait_until(lambda: _handled(metrics, handled_before, args.updates), timeout=args.timeout)
+    stop.set()
+    await monitor
+
+    recipients, _ = await adb.run(alert_outbox_done, db)
+    first, last = telegram.tracked_first_at, telegram.tracked_last_at
+    samples.sort()
+    result = {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "users": args.users,
+        "alerted_regions": alerted,
+        "recipients": recipients,
+        "delivered": telegram.tracked_delivered,
+        "blocked": telegram.counts.get("403", 0),
+        "retry_after": telegram.counts.get("429", 0),
+        "messages_per_s": telegram.tracked_delivered / (last - first) if first and last > first else None,
+        "alert_to_first_delivery_s": first - t0 if first else None,
+        "alert_to_last_delivery_s": last - t0 if last else None,
+        "updates": {
+            "sent": args.updates,
+            "handled_during_delivery": handled,
+            "handler_mean_ms": _handler_mean_ms(metrics),
+        },
+        "loop_lag_ms": {
+            "p50": percentile(samples, 0.5),
+            "p99": percentile(samples, 0.99),
+            "max": samples[-1] if samples else 0.0,
+        },
+        "seed_seconds": seed_seconds,
+        "rss_after_seed_mb": rss_after_seed,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    # штатна зупинка: polling завершується, main() скидає буфери і фонові задачі
+    await alert_bot.dp.stop_polling()
+    await bot_task
+    await alert_bot.bot.session.close()
+    await telegram.stop()
+    await alerts.stop()
+    return result
+
+async def _ready(alerts: FakeAlertsAPI, telegram: FakeTelegramAPI) -> bool:
+    return alerts.requests > 0 and telegram.counts.get("getUpdates", 0) > 0
+
+async def _handled(metrics, before: int, expected: int) -> bool:
+    return metrics.HANDLER_SECONDS.count(event="message", handler="alarm_status") - before >= expected
+
+def _handler_mean_ms(metrics):
+    count = metrics.HANDLER_SECONDS.count(event="message", handler="alarm_status")
+    total = metrics.HANDLER_SECONDS.total(event="message", handler="alarm_status")
+    return total / count * 1000 if count else None
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--alerted-regions", type=int, default=5)
+    parser.add_argument("--updates", type=int, default=500, help="повідомлень від користувачів під час розсилки")
+    parser.add_argument("--latency", type=float, default=0.0, help="затримка sendMessage у заглушці, с")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="частка відповідей 429")
+    parser.add_argument("--blocked-ratio", type=float, default=0.01, help="частка користувачів, що заблокували бота (403)")
+    parser.add_argument("--alerts-error-ratio", type=float, default=0.0, help="частка відповідей 500 від API тривог")
+    parser.add_argument("--send-rate", type=float, default=5000, help="SEND_RATE бота, повідомлень/с")
+    parser.add_argument("--send-concurrency", type=int, default=200)
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=3600)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DB_FILE"] = str(Path(tmp) / "bench_e2e.db")
+        result = asyncio.run(run(args))
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# bench_fanout.py - Масштабування доставки тривоги: 1..N процесів-шардів
+#
+# Запуск: python benchmarks/bench_fanout.py [--users 20000] [--workers 1,2,4] [--latency 0.05]
+# Заглушка Bot API працює в окремому процесі, база - тимчасова.
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import fake_telegram
+
+PORT = 18081
+
+def api_call(path: str, data: bytes = None) -> dict:
+    with urllib.request.urlopen(f"http://127.0.0.1:{PORT}{path}", data=data) as response:
+        return json.loads(response.read())
+
+def wait_delivered(expected: int, timeout: float = 600) -> float:
+    started = time.perf_counter()
+    while api_call("/stats")["delivered"] < expected:
+        if time.perf_counter() - started > timeout:
+            raise TimeoutError("delivery did not finish")
+        time.sleep(0.05)
+    return time.perf_counter() - started
+
+async def run_in_process(db, users: int, rate: float) -> float:
+    from sender import OutboxWorker, Sender, create_bot
+
+    bot = create_bot("123456:BENCH", f"http://127.0.0.1:{PORT}")
+    worker = OutboxWorker(Sender(bot, rate=rate))
+    task = asyncio.create_task(worker.run())
+    await asyncio.sleep(1)
+    db.enqueue_message(f"bench:inproc:{time.time()}", "alert", "🚨 ТРИВОГА!", range(1, users + 1))
+    worker.notify()
+    elapsed = await asyncio.get_running_loop().run_in_executor(None, wait_delivered, users)
+    task.cancel()
+    await bot.session.close()
+    return elapsed
+
+def run_pool(db, users: int, workers: int, rate: float) -> float:
+    from fanout_workers import FanoutPool
+
+    pool = FanoutPool("123456:BENCH", f"http://127.0.0.1:{PORT}", workers=workers, rate=rate)
+    pool.start()
+    pool.wait_ready(120)
+    db.enqueue_message(f"bench:{workers}:{time.time()}", "alert", "🚨 ТРИВОГА!", range(1, users + 1))
+    pool.notify()
+    elapsed = wait_delivered(users)
+    pool.stop()
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--latency", type=float, default=0.05, help="затримка sendMessage у заглушці, с")
+    parser.add_argument("--rate", type=float, default=1e6, help="глобальний бюджет повідомлень/с")
+    args = parser.parse_args()
+
+    server = mp.get_context("spawn").Process(
+        target=fake_telegram.serve, args=("127.0.0.1", PORT), kwargs={"latency": args.latency}, daemon=True)
+    server.start()
+    time.sleep(2)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DB_FILE"] = str(Path(tmp) / "bench.db")
+        import database as db
+        db.init_db()
+
+        api_call("/reset", b"")
+        elapsed = asyncio.run(run_in_process(db, args.users, args.rate))
+        print(f"in-process   {elapsed:7.2f} s   {args.users / elapsed:8.0f} msg/s")
+
+        for workers in (int(w) for w in args.workers.split(",")):
+            api_call("/reset", b"")
+            elapsed = run_pool(db, args.users, workers, args.rate)
+            print(f"{workers} worker(s)  {elapsed:7.2f} s   {args.users / elapsed:8.0f} msg/s")
+
+    server.terminate()
+
+if __name__ == "__main__":
+    main()
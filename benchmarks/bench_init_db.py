@@ -0,0 +1,61 @@
+# bench_init_db.py - Ціна init_db() на кожен запит адмінки: до і після міграцій
+#
+# Запуск: python benchmarks/bench_init_db.py [--requests 2000]
+# "до": кожен запит виконував повну ідемпотентну схему (CREATE ... IF NOT
+# EXISTS, INSERT OR IGNORE областей, тригери) - відтворюється викликом базової
+# міграції в транзакції. "після": init_db() при старті, у запитах - нічого.
+# Також порівнюється повний запит /api/stats через Flask test_client.
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+def per_call_ms(fn, n: int) -> float:
+    started = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - started) / n * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DB_FILE"] = str(Path(tmp) / "bench.db")
+        import database as db
+        import admin_panel
+
+        def legacy_init_db():
+            with db.get_db() as conn:
+                db._migration_base_schema(conn.cursor())
+
+        client = admin_panel.app.test_client()
+        with client.session_transaction() as session:
+            session["logged_in"] = True
+            session["username"] = "bench"
+
+        old_init = per_call_ms(legacy_init_db, args.requests)
+        new_init = per_call_ms(db.init_db, args.requests)
+        version_check = per_call_ms(db.get_schema_version, args.requests)
+
+        def legacy_request():
+            legacy_init_db()
+            client.get("/api/stats")
+
+        old_request = per_call_ms(legacy_request, args.requests)
+        new_request = per_call_ms(lambda: client.get("/api/stats"), args.requests)
+
+        print(f"schema version:          {db.get_schema_version()}")
+        print(f"init_db per request:     {old_init:.3f} ms -> {new_init:.4f} ms")
+        print(f"  (schema_version check: {version_check:.3f} ms, лише при старті процесу)")
+        print(f"/api/stats request:      {old_request:.3f} ms -> {new_request:.3f} ms "
+              f"({(1 - new_request / old_request) * 100:.0f}% менше)")
+        db.close_pool()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# bench_loop_lag.py - Затримка event loop під конкурентними оновленнями: sync vs async БД
+#
+# Запуск: python benchmarks/bench_loop_lag.py [--updates 2000] [--concurrency 50]
+# Працює на тимчасовій базі, alerts_bot.db не змінюється.
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database as db
+import async_db as adb
+
+REGIONS = ["Київська область", "Харківська область", "Львівська область", "м. Київ"]
+
+def handle_update_sync(user_id: int):
+    db.add_or_update_user(user_id, f"user{user_id}", f"User {user_id}")
+    regions = db.get_user_regions(user_id)
+    region = REGIONS[user_id % len(REGIONS)]
+    if region not in regions:
+        db.update_user_regions(user_id, regions + [region])
+    db.get_user(user_id)
+
+async def handle_update_async(user_id: int):
+    await adb.add_or_update_user(user_id, f"user{user_id}", f"User {user_id}")
+    regions = await adb.get_user_regions(user_id)
+    region = REGIONS[user_id % len(REGIONS)]
+    if region not in regions:
+        await adb.update_user_regions(user_id, regions + [region])
+    await adb.get_user(user_id)
+
+async def handle_update_blocking(user_id: int):
+    handle_update_sync(user_id)
+
+async def lag_monitor(samples: list, stop: asyncio.Event, interval: float = 0.005):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append((loop.time() - started - interval) * 1000)
+
+async def run_case(handler, updates: int, concurrency: int) -> dict:
+    samples = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(lag_monitor(samples, stop))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(user_id):
+        async with semaphore:
+            await handler(user_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(1, updates + 1)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+
+    samples.sort()
+    return {
+        "updates_per_s": updates / elapsed,
+        "lag_p50_ms": statistics.median(samples) if samples else 0.0,
+        "lag_p99_ms": samples[int(len(samples) * 0.99) - 1] if samples else 0.0,
+        "lag_max_ms": samples[-1] if samples else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, handler in (("sync (до)", handle_update_blocking), ("async_db (після)", handle_update_async)):
+            db.DB_FILE = Path(tmp) / f"bench_{handler.__name__}.db"
+            db.init_db()
+            result = asyncio.run(run_case(handler, args.updates, args.concurrency))
+            print(f"{name:18} {result['updates_per_s']:8.0f} upd/s   "
+                  f"lag p50 {result['lag_p50_ms']:7.2f} ms   p99 {result['lag_p99_ms']:7.2f} ms   "
+                  f"max {result['lag_max_ms']:7.2f} ms")
+    adb.shutdown()
+
+if __name__ == "__main__":
+    main()
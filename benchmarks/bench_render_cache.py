@@ -0,0 +1,80 @@
+# bench_render_cache.py - CPU на рендер статусу тривог для 100k отримувачів
+#
+# Запуск: python benchmarks/bench_render_cache.py [--recipients 100000] [--alerts 80]
+# Отримувачі мають 1-3 області з нерівномірним розподілом (великі області
+# популярніші). Порівнюється рендер тексту для кожного отримувача окремо і
+# через SnapshotRenderCache (один рендер на знімок і набір областей).
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from dataclasses import replace
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(), "bench_render.db"))
+
+def synthetic_snapshot(regions, alerts: int, rnd: random.Random):
+    from alert_feed import ActiveAlert, AlertSnapshot
+    from database import REGION_API_UIDS
+    active = []
+    for i in range(alerts):
+        region = rnd.choice(regions)
+        oblast_uid = REGION_API_UIDS[region]
+        if i % 4 == 0:
+            alert = ActiveAlert(location_title=region, location_type="oblast", location_uid=oblast_uid,
+                                location_oblast=region, location_oblast_uid=oblast_uid)
+        else:
+            alert = ActiveAlert(location_title=f"{region.split()[0][:-2]}ький район №{i}", location_type="raion",
+                                location_uid=str(100 + i), location_oblast=region, location_oblast_uid=oblast_uid)
+        active.append(replace(alert, started_at="2026-10-18T10:00:00Z"))
+    return AlertSnapshot(tuple(active))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipients", type=int, default=100_000)
+    parser.add_argument("--alerts", type=int, default=80)
+    args = parser.parse_args()
+
+    import alert_bot
+    from render_cache import SnapshotRenderCache
+
+    # UID областей для зіставлення тривог беруться з бази
+    alert_bot.db.init_db()
+    alert_bot.alert_engine.load()
+
+    rnd = random.Random(11)
+    regions = alert_bot.REGIONS
+    weights = [1 / (i + 1) for i in range(len(regions))]
+    recipients = []
+    for _ in range(args.recipients):
+        chosen = []
+        for _ in range(rnd.choice((1, 1, 1, 2, 2, 3))):
+            region = rnd.choices(regions, weights)[0]
+            if region not in chosen:
+                chosen.append(region)
+        recipients.append(chosen)
+    snapshot = synthetic_snapshot(regions, args.alerts, rnd)
+
+    started = time.process_time()
+    uncached = [f"{alert_bot.render_alert_status(snapshot, tuple(r))}\n\n{alert_bot.format_data_age(snapshot)}"
+                for r in recipients]
+    uncached_cpu = time.process_time() - started
+
+    alert_bot.status_cache = cache = SnapshotRenderCache()
+    started = time.process_time()
+    cached = [alert_bot.format_alert_status(snapshot, r) for r in recipients]
+    cached_cpu = time.process_time() - started
+    # рядок "дані оновлено N с тому" між проходами може відрізнятися
+    assert [t.rsplit("\n\n", 1)[0] for t in cached] == [t.rsplit("\n\n", 1)[0] for t in uncached]
+
+    print(f"recipients:        {args.recipients:,}, active alerts: {args.alerts}")
+    print(f"distinct sets:     {len(cache):,} (hits {cache.hits:,}, misses {cache.misses:,})")
+    print(f"per-recipient:     {uncached_cpu * 1000:8.1f} ms CPU")
+    print(f"render cache:      {cached_cpu * 1000:8.1f} ms CPU ({uncached_cpu / cached_cpu:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# bench_replay.py - Відтворення історії тривог: затримка від виявлення до доставки
+#
+# Запуск: python benchmarks/bench_replay.py --timeline timeline.jsonl [--speed 60] [--users 20000]
+#         python benchmarks/bench_replay.py --synthesize-hours 6 [--speed 600]
+# Знімки з файлу alert_timeline (запис ботом через ALERTS_RECORD_FILE або
+# синтетична історія) подаються в alert_bot.enqueue_alert_events у
+# реальному часі (--speed 1) чи прискорено в N разів (--speed 0 - без пауз).
+# Доставка йде справжнім OutboxWorker/Sender у заглушку Bot API. Для кожної
+# події з отримувачами міряється час від надходження знімка до останньої
+# доставки; окремо - час постановки в outbox і рендер статусу для наборів
+# областей. Результат - JSON для порівняння прогонів.
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_telegram import FakeTelegramAPI
+
+POLL_INTERVAL = 30.0
+
+def percentiles(values: list) -> dict:
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    pick = lambda q: values[min(len(values) - 1, int(len(values) * q))] * 1000
+    return {"count": len(values), "p50_ms": pick(0.5), "p90_ms": pick(0.9),
+            "p99_ms": pick(0.99), "max_ms": values[-1] * 1000}
+
+def synthesize_timeline(path: str, hours: float, rnd: random.Random):
+    # Синтетична історія: тривоги на всю область і в окремих районах,
+    # тривалість - експоненційна із середнім 50 хв, опитування раз на 30 с
+    from alert_feed import ActiveAlert, AlertSnapshot
+    from alert_timeline import TimelineRecorder
+    from database import REGION_API_UIDS
+
+    regions = list(REGION_API_UIDS.items())
+    active = {}
+    recorder = TimelineRecorder(path)
+    started = 1_760_000_000.0
+    for step in range(int(hours * 3600 / POLL_INTERVAL)):
+        now = started + step * POLL_INTERVAL
+        active = {key: (alert, until) for key, (alert, until) in active.items() if until > now}
+        for name, uid in regions:
+            if uid not in active and rnd.random() < 0.0015:
+                alert = ActiveAlert(name, "oblast", uid, name, uid)
+                active[uid] = (alert, now + rnd.expovariate(1 / 3000))
+            raion_uid = str(1000 + int(uid) * 10 + rnd.randrange(5))
+            if raion_uid not in active and rnd.random() < 0.002:
+                alert = ActiveAlert(f"Район {raion_uid}", "raion", raion_uid, name, uid)
+                active[raion_uid] = (alert, now + rnd.expovariate(1 / 3000))
+        alerts = tuple(alert for alert, _ in active.values())
+        recorder.record(AlertSnapshot(alerts, fetched_at=now))
+    recorder.close()
+
+async def run(args, timeline_path: str) -> dict:
+    from alert_timeline import read_timeline, summarize
+
+    telegram = FakeTelegramAPI(latency=args.latency, blocked_ratio=args.blocked_ratio)
+    os.environ.update({
+        "BOT_TOKEN": "123456:BENCH",
+        "TELEGRAM_API_URL": await telegram.start(),
+        "SEND_RATE": str(args.send_rate),
+        "SEND_CONCURRENCY": str(args.send_concurrency),
+        "METRICS_PORT": "0",
+    })
+
+    import alert_bot
+    from bench_e2e import seed_users
+    from sender import OutboxWorker
+    db, adb = alert_bot.db, alert_bot.adb
+    logging.getLogger("aiogram").setLevel(logging.WARNING)
+
+    rnd = random.Random(args.seed)
+    await adb.run(db.init_db)
+    await adb.run(seed_users, db, args.users, alert_bot.REGIONS, rnd)
+    await adb.run(alert_bot.subscriptions.load)
+    await adb.run(alert_bot.alert_engine.load)
+    db.add_listener(alert_bot.subscriptions.on_db_event)
+
+    completed = {}
+
+    class TimedOutboxWorker(OutboxWorker):
+        # повідомлення доставлено, коли завершилась остання пачка його рядків
+        async def _deliver(self, message_id: int, chat_ids: list, text: str):
+            await super()._deliver(message_id, chat_ids, text)
+            completed[message_id] = time.perf_counter()
+
+    worker = TimedOutboxWorker(alert_bot.sender)
+    worker_task = asyncio.create_task(worker.run())
+
+    # набори областей, для яких міряється рендер статусу (як у "🚨 Статус тривоги")
+    render_sets = [tuple(rnd.sample(alert_bot.REGIONS, rnd.choice((1, 2, 3)))) for _ in range(args.render_sets)]
+
+    def message_ids(events) -> list:
+        keys = [alert_bot.alert_message_key(event) for event in events]
+        with db.get_db() as conn:
+            rows = conn.execute(
+                f"SELECT id FROM outbox_messages WHERE idempotency_key IN ({','.join('?' * len(keys))})", keys
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    timeline = list(read_timeline(timeline_path))
+    detected, enqueue_times, render_times, events_total = {}, [], [], 0
+    replay_started = time.perf_counter()
+    first_t = timeline[0][0] if timeline else 0.0
+    for t, snapshot in timeline:
+        if args.speed:
+            delay = replay_started + (t - first_t) / args.speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        arrived = time.perf_counter()
+        events = await adb.run(alert_bot.enqueue_alert_events, snapshot.get_air_raid_alerts())
+        enqueue_times.append(time.perf_counter() - arrived)
+        if events:
+            events_total += len(events)
+            worker.notify()
+            for message_id in await adb.run(message_ids, events):
+                detected[message_id] = arrived
+        started = time.perf_counter()
+        for regions in render_sets:
+            alert_bot.render_alert_status(snapshot, regions)
+        render_times.append((time.perf_counter() - started) / max(len(render_sets), 1))
+
+    def open_rows() -> int:
+        with db.get_db() as conn:
+            return conn.execute("SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending')").fetchone()[0]
+
+    deadline = time.perf_counter() + args.timeout
+    while await adb.run(open_rows) or not set(detected) <= set(completed):
+        if time.perf_counter() > deadline:
+            raise TimeoutError("delivery did not finish in time")
+        await asyncio.sleep(0.05)
+    wall = time.perf_counter() - replay_started
+
+    worker_task.cancel()
+    await alert_bot.bot.session.close()
+    await telegram.stop()
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "timeline": summarize(timeline_path),
+        "events": events_total,
+        "messages": len(detected),
+        "delivered": sum(telegram.delivered.values()),
+        "detection_to_delivery": percentiles([completed[m] - detected[m] for m in detected]),
+        "enqueue": percentiles(enqueue_times),
+        "render_status_per_set": percentiles(render_times),
+        "wall_s": wall,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--timeline", help="файл alert_timeline (ALERTS_RECORD_FILE)")
+    parser.add_argument("--synthesize-hours", type=float, default=6.0,
+                        help="без --timeline: згенерувати синтетичну історію такої тривалості")
+    parser.add_argument("--speed", type=float, default=600, help="прискорення відтворення, 0 - без пауз")
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--latency", type=float, default=0.01, help="затримка sendMessage у заглушці, с")
+    parser.add_argument("--blocked-ratio", type=float, default=0.0)
+    parser.add_argument("--send-rate", type=float, default=5000)
+    parser.add_argument("--send-concurrency", type=int, default=200)
+    parser.add_argument("--render-sets", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=3600)
+    parser.add_argument("--seed", type=int, default=3)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DB_FILE"] = str(Path(tmp) / "bench_replay.db")
+        timeline = args.timeline
+        if not timeline:
+            timeline = str(Path(tmp) / "timeline.jsonl")
+            synthesize_timeline(timeline, args.synthesize_hours, random.Random(args.seed))
+        result = asyncio.run(run(args, timeline))
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# bench_shelter_index.py - k найближчих укриттів: сітковий індекс vs повний перебір
+#
+# Запуск: python benchmarks/bench_shelter_index.py [--shelters 300000] [--queries 2000]
+# Синтетичні укриття: частина в містах (щільні кластери), решта рівномірно
+# по прямокутнику України.
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from shelter_index import ShelterIndex, haversine_km
+
+LAT_RANGE = (44.4, 52.3)
+LON_RANGE = (22.2, 40.2)
+CITIES = [(50.45, 30.52), (49.99, 36.23), (48.46, 35.04), (46.48, 30.72), (49.84, 24.03),
+          (47.84, 35.14), (46.97, 31.99), (49.59, 34.55), (50.91, 34.80), (51.50, 31.29)]
+
+def synthetic_shelters(count: int, rnd: random.Random):
+    for shelter_id in range(1, count + 1):
+        if rnd.random() < 0.7:
+            lat, lon = rnd.choice(CITIES)
+            yield shelter_id, rnd.gauss(lat, 0.08), rnd.gauss(lon, 0.12)
+        else:
+            yield shelter_id, rnd.uniform(*LAT_RANGE), rnd.uniform(*LON_RANGE)
+
+def brute_force(points, lat, lon, k):
+    return sorted((haversine_km(lat, lon, plat, plon), sid) for sid, plat, plon in points)[:k]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shelters", type=int, default=300_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+    rnd = random.Random(7)
+
+    points = list(synthetic_shelters(args.shelters, rnd))
+    idx = ShelterIndex()
+    started = time.perf_counter()
+    idx.build(points)
+    print(f"shelters:        {len(idx):,}")
+    print(f"build:           {time.perf_counter() - started:.2f} s")
+
+    queries = []
+    for i in range(args.queries):
+        if i % 2:
+            lat, lon = rnd.choice(CITIES)
+            queries.append((rnd.gauss(lat, 0.1), rnd.gauss(lon, 0.15)))
+        else:
+            queries.append((rnd.uniform(*LAT_RANGE), rnd.uniform(*LON_RANGE)))
+
+    timings = []
+    for lat, lon in queries:
+        started = time.perf_counter()
+        idx.nearest(lat, lon, args.k)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    print(f"grid query:      p50 {statistics.median(timings):.3f} ms   "
+          f"p99 {timings[int(len(timings) * 0.99)]:.3f} ms   max {timings[-1]:.3f} ms")
+
+    checks = queries[:20]
+    started = time.perf_counter()
+    for lat, lon in checks:
+        expected = [sid for _, sid in brute_force(points, lat, lon, args.k)]
+        got = [sid for _, sid in idx.nearest(lat, lon, args.k, max_km=10_000)]
+        assert got == expected, (lat, lon, got, expected)
+    print(f"brute force:     {(time.perf_counter() - started) / len(checks) * 1000:.1f} ms/query "
+          f"(results match grid on {len(checks)} queries)")
+
+if __name__ == "__main__":
+    main()
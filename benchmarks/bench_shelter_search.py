@@ -0,0 +1,97 @@
+# bench_shelter_search.py - Пошук укриттів: LIKE '%...%' vs FTS5
+#
+# Запуск: python benchmarks/bench_shelter_search.py [--shelters 300000] [--repeat 20]
+# Створює тимчасову базу, заповнює shelters синтетичними адресами (FTS-індекс
+# наповнюють тригери) і порівнює старі LIKE-запити з database.search_shelters.
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+CITIES = ["Київ", "Харків", "Дніпро", "Одеса", "Львів", "Запоріжжя", "Вінниця", "Полтава",
+          "Чернігів", "Суми", "Житомир", "Рівне", "Івано-Франківськ", "Тернопіль", "Ужгород"]
+STREETS = ["Хрещатик", "Сумська", "Соборна", "Шевченка", "Франка", "Лесі Українки", "Грушевського",
+           "Пʼятницька", "Незалежності", "Миру", "Садова", "Зелена", "Київська", "Героїв УПА"]
+TYPES = ["метро", "підвал", "укриття", "паркінг", "бомбосховище"]
+
+# (опис, LIKE-колонка і шаблон, текст для FTS)
+QUERIES = [
+    ("місто", "city", "Одеса", "Одеса"),
+    ("вулиця", "address", "Хрещатик", "Хрещатик"),
+    ("префікс вулиці", "address", "Грушев", "Грушев"),
+    ("тип", "shelter_type", "паркінг", "паркінг"),
+    ("рідкісна адреса", "address", "Пʼятницька, 77", "пятницька 77"),
+]
+
+def seed(db, count: int, rnd: random.Random):
+    # Адреси повторюються (місто, вулиця, будинок), тож кожне укриття отримує
+    # власну точку сітки в межах України - ключ дедуплікації лишається унікальним
+    rows = []
+    for i in range(count):
+        city = rnd.choice(CITIES)
+        lat, lon = 44.4 + (i % 1000) * 0.007, 22.2 + (i // 1000) * 0.00006
+        rows.append((f"{city} область", city, f"вул. {rnd.choice(STREETS)}, {rnd.randint(1, 200)}",
+                     rnd.choice(TYPES), rnd.randint(0, 2000), round(lat, 5), round(lon, 5), f"Укриття №{i}"))
+    db.upsert_shelters(rows)
+
+def timed(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shelters", type=int, default=300_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DB_FILE"] = str(Path(tmp) / "bench.db")
+        import database as db
+        db.init_db()
+
+        started = time.perf_counter()
+        seed(db, args.shelters, random.Random(7))
+        print(f"seed {args.shelters:,} shelters (with FTS triggers): {time.perf_counter() - started:.1f} s\n")
+
+        def like(column: str, pattern: str):
+            with db.get_db() as conn:
+                return conn.execute(f"SELECT * FROM shelters WHERE {column} LIKE ? LIMIT ?",
+                                    (f"%{pattern}%", args.limit)).fetchall()
+
+        def like_all(column: str, pattern: str):
+            with db.get_db() as conn:
+                return conn.execute(f"SELECT COUNT(*) FROM shelters WHERE {column} LIKE ?",
+                                    (f"%{pattern}%",)).fetchone()[0]
+
+        def fts_all(text: str, column: str):
+            with db.get_db() as conn:
+                return conn.execute("SELECT COUNT(*) FROM shelters_fts WHERE shelters_fts MATCH ?",
+                                    (db.build_fts_query(text, (column,)),)).fetchone()[0]
+
+        # top-N: перші N рядків (як у боті); bm25: top-N за релевантністю;
+        # count: усі збіги (як старі get_shelters_by_region/city без LIMIT)
+        print(f"{'query':16} {'LIKE top-N':>11} {'FTS top-N':>11} {'FTS bm25':>11}"
+              f" {'LIKE count':>11} {'FTS count':>11}   matches")
+        for name, column, pattern, text in QUERIES:
+            like_ms, _ = timed(lambda: like(column, pattern), args.repeat)
+            fts_ms, _ = timed(lambda: db.search_shelters(text, args.limit, (column,), ranked=False), args.repeat)
+            bm25_ms, _ = timed(lambda: db.search_shelters(text, args.limit, (column,)), args.repeat)
+            like_count_ms, like_n = timed(lambda: like_all(column, pattern), args.repeat)
+            fts_count_ms, fts_n = timed(lambda: fts_all(text, column), args.repeat)
+            print(f"{name:16} {like_ms:9.2f}ms {fts_ms:9.2f}ms {bm25_ms:9.2f}ms"
+                  f" {like_count_ms:9.2f}ms {fts_count_ms:9.2f}ms   {like_n}/{fts_n}")
+        db.close_pool()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# bench_subscription_index.py - Пам'ять і латентність SubscriptionIndex на синтетичних користувачах
+#
+# Запуск: python benchmarks/bench_subscription_index.py [--users 1000000]
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import subscription_index
+from subscription_index import SubscriptionIndex
+
+REGION_UIDS = [str(i) for i in range(1, 26)]
+
+def synthetic_rows(users: int, seed: int = 42):
+    rnd = random.Random(seed)
+    for user_id in range(100_000_000, 100_000_000 + users):
+        for uid in sorted(rnd.sample(REGION_UIDS, rnd.choice((1, 1, 1, 2, 3)))):
+            yield user_id, uid
+
+def timeit(func, repeat: int = 20) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    idx = SubscriptionIndex()
+    idx.set_regions(REGION_UIDS)
+
+    rows = list(synthetic_rows(args.users))
+    started = time.perf_counter()
+    idx.bulk_load(rows)
+    build = time.perf_counter() - started
+    del rows
+
+    print(f"backend:            {'numpy' if subscription_index.np is not None else 'pure python'}")
+    print(f"users:              {len(idx):,}")
+    print(f"index memory:       {idx.memory_bytes() / 2**20:.1f} MiB "
+          f"({idx.memory_bytes() / max(len(idx), 1):.0f} B/user)")
+    print(f"build:              {build:.2f} s")
+
+    for regions in (["19"], ["9", "25"], REGION_UIDS[:5]):
+        found = len(idx.users_for_regions(regions))
+        seconds = timeit(lambda: idx.users_for_regions(regions), repeat=5)
+        print(f"match {len(regions)} region(s):  {seconds * 1000:8.2f} ms  -> {found:,} users")
+
+    existing = 100_000_000 + args.users // 2
+    print(f"update existing:    {timeit(lambda: idx.set_user(existing, ['1', '2'])) * 1e6:8.2f} µs")
+    new_ids = iter(range(1, 10_000))
+    print(f"insert new (head):  {timeit(lambda: idx.set_user(next(new_ids), ['3'])) * 1e6:8.2f} µs")
+
+if __name__ == "__main__":
+    main()
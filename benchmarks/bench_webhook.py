@@ -0,0 +1,121 @@
+# bench_webhook.py - Латентність "оновлення -> відповідь": polling vs webhook
+#
+# Запуск: python benchmarks/bench_webhook.py [--updates 2000] [--rate 200] [--concurrency 100]
+# Піднімає заглушку Bot API, імпортує справжній alert_bot.dp і проганяє
+# однакові синтетичні оновлення ("ℹ️ Про бота") через обидва режими.
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_telegram import FakeTelegramAPI, synthetic_message_update
+
+SECRET = "bench-secret"
+TEXT = "ℹ️ Про бота"
+
+def percentiles(samples: list) -> dict:
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(len(samples) * q))] * 1000
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "mean": statistics.mean(samples) * 1000}
+
+async def wait_replies(api: FakeTelegramAPI, user_ids: range, timeout: float = 120):
+    deadline = time.perf_counter() + timeout
+    while any(uid not in api.first_reply for uid in user_ids):
+        if time.perf_counter() > deadline:
+            raise TimeoutError("not all updates were answered")
+        await asyncio.sleep(0.01)
+
+async def paced(user_ids: range, rate: float):
+    # оновлення надходять рівномірно з заданою частотою, як від живих користувачів
+    started = time.perf_counter()
+    for i, uid in enumerate(user_ids):
+        delay = started + i / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        yield uid
+
+async def run_polling(alert_bot, api: FakeTelegramAPI, user_ids: range, rate: float) -> dict:
+    polling = asyncio.create_task(alert_bot.dp.start_polling(alert_bot.bot, handle_signals=False, polling_timeout=10))
+    await asyncio.sleep(0.5)
+    sent_at = {}
+    started = time.perf_counter()
+    async for uid in paced(user_ids, rate):
+        sent_at[uid] = time.perf_counter()
+        api.push_update(synthetic_message_update(uid, TEXT))
+    await wait_replies(api, user_ids)
+    elapsed = time.perf_counter() - started
+    await alert_bot.dp.stop_polling()
+    await polling
+    return {"updates_per_s": len(user_ids) / elapsed,
+            **percentiles([api.first_reply[uid] - sent_at[uid] for uid in user_ids])}
+
+async def run_webhook(alert_bot, api: FakeTelegramAPI, user_ids: range, rate: float, concurrency: int) -> dict:
+    import aiohttp
+    from webhook import WebhookServer
+
+    server = WebhookServer(alert_bot.dp, alert_bot.bot, secret=SECRET)
+    await server.start("127.0.0.1", 18080)
+    url = f"http://127.0.0.1:18080{server.path}"
+    semaphore = asyncio.Semaphore(concurrency)
+    sent_at = {}
+
+    async with aiohttp.ClientSession() as session:
+        async def post(uid: int):
+            async with semaphore:
+                update = {"update_id": uid, **synthetic_message_update(uid, TEXT)}
+                sent_at[uid] = time.perf_counter()
+                async with session.post(url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as r:
+                    assert r.status == 200, r.status
+
+        started = time.perf_counter()
+        await asyncio.gather(*[asyncio.create_task(post(uid)) async for uid in paced(user_ids, rate)])
+        await wait_replies(api, user_ids)
+        elapsed = time.perf_counter() - started
+    await server.stop()
+    return {"updates_per_s": len(user_ids) / elapsed,
+            **percentiles([api.first_reply[uid] - sent_at[uid] for uid in user_ids])}
+
+async def main_async(args):
+    api = FakeTelegramAPI(latency=args.latency)
+    base_url = await api.start()
+    os.environ["TELEGRAM_API_URL"] = base_url
+    os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+
+    import alert_bot
+    alert_bot.db.init_db()
+    logging.getLogger("aiogram").setLevel(logging.WARNING)
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+
+    results = {}
+    base = 1_000_000
+    results["polling"] = await run_polling(alert_bot, api, range(base, base + args.updates), args.rate)
+    base += args.updates
+    results["webhook"] = await run_webhook(alert_bot, api, range(base, base + args.updates), args.rate, args.concurrency)
+
+    for mode, r in results.items():
+        print(f"{mode:8} {r['updates_per_s']:8.0f} upd/s   p50 {r['p50']:7.1f} ms   "
+              f"p95 {r['p95']:7.1f} ms   p99 {r['p99']:7.1f} ms")
+    await alert_bot.bot.session.close()
+    await api.stop()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=200, help="оновлень за секунду")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.02, help="затримка sendMessage у заглушці, с")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DB_FILE"] = str(Path(tmp) / "bench.db")
+        asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
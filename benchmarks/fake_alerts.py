@@ -0,0 +1,75 @@
+# fake_alerts.py - Локальна заглушка API alerts.in.ua для бенчмарків
+#
+# Віддає /v1/alerts/active.json у форматі API (бот підключається через
+# ALERTS_API_URL). Набір активних тривог змінюється з коду бенчмарка
+# (set_alerts), частка запитів може завершуватися 500 для перевірки обробки
+# помилок поллера.
+import argparse
+import asyncio
+import random
+import sys
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+def oblast_alert(region: str, started_at: str = "2026-10-18T10:00:00.000Z") -> dict:
+    from database import REGION_API_UIDS
+    uid = REGION_API_UIDS[region]
+    return {
+        "id": int(uid), "location_title": region, "location_type": "oblast" if region != "м. Київ" else "city",
+        "location_uid": uid, "location_oblast": region, "location_oblast_uid": uid,
+        "alert_type": "air_raid", "started_at": started_at, "finished_at": None,
+    }
+
+class FakeAlertsAPI:
+    def __init__(self, error_ratio: float = 0.0, seed: int = 1):
+        self.error_ratio = error_ratio
+        self.random = random.Random(seed)
+        self.alerts: List[dict] = []
+        self.requests = 0
+        self.errors = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    def set_alerts(self, alerts: Iterable[dict]):
+        self.alerts = list(alerts)
+
+    async def handle_active(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.error_ratio and self.random.random() < self.error_ratio:
+            self.errors += 1
+            return web.json_response({"message": "Internal Server Error"}, status=500)
+        return web.json_response({"alerts": self.alerts, "meta": {"last_updated_at": None}})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_get("/v1/alerts/active.json", self.handle_active)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+def serve(host: str = "127.0.0.1", port: int = 8082, regions: Iterable[str] = (), **kwargs):
+    async def run():
+        api = FakeAlertsAPI(**kwargs)
+        api.set_alerts(oblast_alert(region) for region in regions)
+        print(f"Fake alerts API: {await api.start(host, port)}", flush=True)
+        await asyncio.Event().wait()
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--error-ratio", type=float, default=0.0)
+    parser.add_argument("--region", action="append", default=[], help="активна тривога в області (можна повторювати)")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.region, error_ratio=args.error_ratio)
@@ -0,0 +1,185 @@
+# fake_telegram.py - Локальна заглушка Telegram Bot API для бенчмарків
+#
+# Приймає виклики бота за адресою http://host:port/bot<token>/<method>
+# (бот підключається через TELEGRAM_API_URL). sendMessage відповідає з
+# налаштовуваною затримкою, частка запитів може отримувати 429 (retry_after)
+# або 403 (користувач заблокував бота). getUpdates віддає синтетичні
+# оновлення з черги для порівняння з режимом polling. track() рахує окремо
+# доставлені повідомлення, що містять заданий фрагмент (напр. текст тривоги).
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+class FakeTelegramAPI:
+    def __init__(self, latency: float = 0.0, rate_limit_ratio: float = 0.0,
+                 blocked_ratio: float = 0.0, retry_after: int = 1, seed: int = 1):
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.blocked_ratio = blocked_ratio
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.updates: List[dict] = []
+        self._updates_event = asyncio.Event()
+        self._next_update_id = 1
+        self._message_id = 0
+        self.first_reply: Dict[int, float] = {}
+        self.last_reply_at: Optional[float] = None
+        self.delivered: Dict[int, int] = defaultdict(int)
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.tracked: Optional[str] = None
+        self.tracked_delivered = 0
+        self.tracked_first_at: Optional[float] = None
+        self.tracked_last_at: Optional[float] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    def is_blocked(self, chat_id: int) -> bool:
+        # детерміновано: той самий користувач завжди "заблокував" бота
+        return (chat_id * 2654435761) % 10000 < self.blocked_ratio * 10000
+
+    def track(self, fragment: Optional[str]):
+        self.tracked = fragment
+        self.tracked_delivered = 0
+        self.tracked_first_at = self.tracked_last_at = None
+
+    def push_update(self, update: dict) -> int:
+        update_id = self._next_update_id
+        self._next_update_id += 1
+        self.updates.append({"update_id": update_id, **update})
+        self._updates_event.set()
+        return update_id
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    @staticmethod
+    def _error(code: int, description: str, **parameters) -> web.Response:
+        body = {"ok": False, "error_code": code, "description": description}
+        if parameters:
+            body["parameters"] = parameters
+        return web.json_response(body, status=code)
+
+    async def _params(self, request: web.Request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        params = dict(await request.post()) if request.can_read_body else {}
+        params.update(request.query)
+        return params
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await self._params(request)
+        self.counts[method] += 1
+
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        if method in ("sendMessage", "editMessageText"):
+            return await self._send_message(method, params)
+        if method == "getMe":
+            return self._ok({"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"})
+        return self._ok(True)
+
+    async def _get_updates(self, params: dict) -> web.Response:
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        if not self.updates and timeout:
+            self._updates_event.clear()
+            try:
+                await asyncio.wait_for(self._updates_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._ok(self.updates[:100])
+
+    async def _send_message(self, method: str, params: dict) -> web.Response:
+        chat_id = int(params["chat_id"])
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.rate_limit_ratio and self.random.random() < self.rate_limit_ratio:
+            self.counts["429"] += 1
+            return self._error(429, f"Too Many Requests: retry after {self.retry_after}",
+                               retry_after=self.retry_after)
+        if self.is_blocked(chat_id):
+            self.counts["403"] += 1
+            return self._error(403, "Forbidden: bot was blocked by the user")
+
+        now = time.perf_counter()
+        self.first_reply.setdefault(chat_id, now)
+        self.last_reply_at = now
+        self.delivered[chat_id] += 1
+        if self.tracked and self.tracked in str(params.get("text", "")):
+            self.tracked_delivered += 1
+            if self.tracked_first_at is None:
+                self.tracked_first_at = now
+            self.tracked_last_at = now
+        self._message_id += 1
+        return self._ok({
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": params.get("text", ""),
+        })
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "delivered": sum(self.delivered.values()),
+            "recipients": len(self.delivered),
+            "counts": dict(self.counts),
+        })
+
+    async def handle_reset(self, request: web.Request) -> web.Response:
+        self.first_reply.clear()
+        self.delivered.clear()
+        self.counts.clear()
+        self.last_reply_at = None
+        return self._ok(True)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application(client_max_size=16 * 2**20)
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        app.router.add_get("/stats", self.handle_stats)
+        app.router.add_post("/reset", self.handle_reset)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+def synthetic_message_update(user_id: int, text: str) -> dict:
+    return {
+        "message": {
+            "message_id": user_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+            "text": text,
+        }
+    }
+
+def serve(host: str = "127.0.0.1", port: int = 8081, **kwargs):
+    async def run():
+        api = FakeTelegramAPI(**kwargs)
+        print(f"Fake Bot API: {await api.start(host, port)}", flush=True)
+        await asyncio.Event().wait()
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0)
+    parser.add_argument("--blocked-ratio", type=float, default=0.0)
+    args = parser.parse_args()
+    serve(args.host, args.port, latency=args.latency,
+          rate_limit_ratio=args.rate_limit_ratio, blocked_ratio=args.blocked_ratio)
@@ -1,16 +1,133 @@
 # database.py - База даних для бота Карта Тривог
+import inspect
+import os
+import queue
 import sqlite3
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Callable, Iterable, Iterator, Tuple
 from contextlib import contextmanager
+from zoneinfo import ZoneInfo
 
-DB_FILE = Path("alerts_bot.db")
+import metrics
+
+DB_FILE = Path(os.getenv("DB_FILE", "alerts_bot.db"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "30"))
+# Межі доби для денних підсумків тривог (alert_daily) - за київським часом
+HISTORY_TZ = ZoneInfo(os.getenv("HISTORY_TZ", "Europe/Kyiv"))
+
+# Пул довгоживучих з'єднань. З'єднання береться з пулу на час get_db() і
+# повертається назад; вкладені get_db() в тому ж потоці отримують те саме
+# з'єднання і ту саму транзакцію. Пул прив'язаний до DB_FILE та PID процесу,
+# тож зміна шляху до бази чи fork() автоматично дають нові з'єднання.
+_pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+_pool_key = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+_initialized_key = None
+
+# Слухачі змін даних у цьому процесі (in-memory індекси, кеші).
+# Викликаються після коміту як callback(event, **payload).
+_listeners: List[Callable] = []
+
+# Повнотекстовий пошук укриттів (FTS5). Індексується "згорнутий" текст:
+# апострофи (' ’ ʼ `) викидаються, а ї/й/є/ґ зводяться до і/и/е/г, тож
+# "Пʼятницька", "П'ятницька" і "пятницька" знаходять те саме укриття.
+# Запит згортається так само в Python (_fold_search_text).
+SHELTER_FTS_COLUMNS = ("region", "city", "address", "shelter_type", "description")
+SHELTER_SEARCH_COLUMNS = ("city", "address", "shelter_type", "description")
+_SEARCH_FOLD = {
+    "ї": "і", "Ї": "І", "й": "и", "Й": "И", "є": "е", "Є": "Е", "ґ": "г", "Ґ": "Г",
+    "'": "", "’": "", "ʼ": "", "`": "",
+}
+
+# UID областей в API alerts.in.ua (location_oblast_uid) -> назва області в regions.
+# Райони і громади в API мають власні location_uid, але завжди несуть UID
+# своєї області, тож будь-яка тривога зводиться до regions.uid за O(1).
+REGION_API_UIDS = {
+    "Вінницька область": "4", "Волинська область": "8", "Дніпропетровська область": "9",
+    "Донецька область": "28", "Житомирська область": "10", "Закарпатська область": "11",
+    "Запорізька область": "12", "Івано-Франківська область": "13", "Київська область": "14",
+    "Кіровоградська область": "15", "Луганська область": "16", "Львівська область": "27",
+    "Миколаївська область": "17", "Одеська область": "18", "Полтавська область": "19",
+    "Рівненська область": "5", "Сумська область": "20", "Тернопільська область": "21",
+    "Харківська область": "22", "Херсонська область": "23", "Хмельницька область": "3",
+    "Черкаська область": "24", "Чернівецька область": "26", "Чернігівська область": "25",
+    "м. Київ": "31",
+}
+
+# Таблиці з лічильником рядків у counters (таблиця -> назва лічильника);
+# кількість підписників області - лічильник SUBSCRIBERS_PREFIX + uid
+# Ключ унікальності укриття (idx_shelters_dedup і ON CONFLICT в _SHELTER_UPSERT)
+_SHELTER_KEY = "region, city, address, ifnull(lat, ''), ifnull(lon, '')"
+
+_COUNTED_TABLES = {"users": "users", "shelters": "shelters", "broadcast_history": "broadcasts"}
+SUBSCRIBERS_PREFIX = "subscribers:"
+
+def _connect() -> sqlite3.Connection:
+    # IMMEDIATE: запис одразу бере RESERVED-блокування і чекає busy_timeout,
+    # замість SQLITE_BUSY при спробі підвищити читаючу транзакцію до запису
+    conn = sqlite3.connect(
+        DB_FILE,
+        timeout=DB_BUSY_TIMEOUT,
+        isolation_level="IMMEDIATE",
+        check_same_thread=False,
+        cached_statements=256,
+    )
+    conn.row_factory = sqlite3.Row
+    # WAL дозволяє читачам (admin_panel.py) не блокувати записувача (бот) і навпаки
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-16000")
+    conn.execute("PRAGMA mmap_size=134217728")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+def _acquire() -> sqlite3.Connection:
+    global _pool_key
+    key = (str(DB_FILE), os.getpid())
+    with _pool_lock:
+        if _pool_key != key:
+            if _pool_key is not None and _pool_key[1] == key[1]:
+                _drain_pool()
+            else:
+                # після fork() успадковані з'єднання не можна ні використовувати, ні закривати
+                while not _pool.empty():
+                    _pool.get_nowait()
+            _pool_key = key
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return _connect()
+
+def _release(conn: sqlite3.Connection):
+    if _pool_key == (str(DB_FILE), os.getpid()) and _pool.qsize() < DB_POOL_SIZE:
+        _pool.put(conn)
+    else:
+        conn.close()
+
+def _drain_pool():
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+def close_pool():
+    with _pool_lock:
+        _drain_pool()
 
 @contextmanager
 def get_db():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        yield conn
+        return
+
+    conn = _acquire()
+    _local.conn = conn
     try:
         yield conn
         conn.commit()
@@ -18,102 +135,516 @@ def get_db():
         conn.rollback()
         raise
     finally:
-        conn.close()
+        _local.conn = None
+        _release(conn)
 
-def init_db():
-    with get_db() as conn:
-        cur = conn.cursor()
-        
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                full_name TEXT,
-                regions TEXT DEFAULT '',
-                role TEXT DEFAULT 'user',
-                notifications_enabled INTEGER DEFAULT 1,
-                first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+def add_listener(callback: Callable):
+    _listeners.append(callback)
+
+def remove_listener(callback: Callable):
+    if callback in _listeners:
+        _listeners.remove(callback)
+
+def _notify(event: str, **payload):
+    for callback in list(_listeners):
+        callback(event, **payload)
+
+def _migration_base_schema(cur: sqlite3.Cursor):
+    # Базова схема. Бази, створені до появи schema_version, вже містять
+    # частину таблиць, тому кроки тут ідемпотентні (IF NOT EXISTS)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            full_name TEXT,
+            regions TEXT DEFAULT '',
+            role TEXT DEFAULT 'user',
+            notifications_enabled INTEGER DEFAULT 1,
+            first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS regions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            uid TEXT UNIQUE,
+            alert_status TEXT DEFAULT 'N',
+            last_updated TIMESTAMP
+        )
+    """)
+    
+    # Підписки користувачів на області. Замінює CSV-колонку users.regions,
+    # яка лишається в схемі лише як джерело для migrate_user_regions().
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_regions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            region_uid TEXT NOT NULL,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (user_id, region_uid)
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_regions_region
+        ON user_regions (region_uid, user_id)
+    """)
+    # Частковий індекс: після міграції перевірка "чи лишились CSV" не сканує users
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_users_legacy_regions
+        ON users (user_id) WHERE regions != ''
+    """)
+    
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS shelters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            region TEXT NOT NULL,
+            city TEXT NOT NULL,
+            address TEXT NOT NULL,
+            shelter_type TEXT DEFAULT 'укриття',
+            capacity INTEGER DEFAULT 0,
+            lat REAL,
+            lon REAL,
+            description TEXT
+        )
+    """)
+    
+    # Дублікати за (область, місто, адреса, координати) лишилися від ручного
+    # додавання - прибираємо їх один раз перед створенням унікального індексу.
+    # Місто входить у ключ: "вул. Шевченка, 1" без координат є в багатьох містах.
+    cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_shelters_dedup'")
+    if cur.fetchone() is None:
+        cur.execute(f"""
+            DELETE FROM shelters WHERE id NOT IN (
+                SELECT MIN(id) FROM shelters GROUP BY {_SHELTER_KEY}
             )
         """)
-        
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS regions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE NOT NULL,
-                uid TEXT UNIQUE,
-                alert_status TEXT DEFAULT 'N',
-                last_updated TIMESTAMP
-            )
+        if cur.rowcount:
+            print(f"✅ Видалено дублікатів укриттів: {cur.rowcount}")
+        cur.execute(f"CREATE UNIQUE INDEX idx_shelters_dedup ON shelters ({_SHELTER_KEY})")
+    
+    # Лічильник версій даних: тригери збільшують його при кожній зміні
+    # таблиці, а in-memory індекси (shelter_index) за ним перебудовуються
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute("INSERT OR IGNORE INTO data_versions (name) VALUES ('shelters')")
+    for action in ("INSERT", "UPDATE", "DELETE"):
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS shelters_version_{action.lower()}
+            AFTER {action} ON shelters
+            BEGIN
+                UPDATE data_versions SET version = version + 1 WHERE name = 'shelters';
+            END
         """)
-        
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS shelters (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                region TEXT NOT NULL,
-                city TEXT NOT NULL,
-                address TEXT NOT NULL,
-                shelter_type TEXT DEFAULT 'укриття',
-                capacity INTEGER DEFAULT 0,
-                lat REAL,
-                lon REAL,
-                description TEXT
-            )
+    
+    # FTS5-індекс над shelters (external content): тригери синхронізують
+    # його з таблицею, а при першому створенні індексуються наявні рядки
+    cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'shelters_fts'")
+    fts_exists = cur.fetchone() is not None
+    cur.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS shelters_fts USING fts5(
+            {", ".join(SHELTER_FTS_COLUMNS)},
+            content='shelters', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    fts_columns = ", ".join(SHELTER_FTS_COLUMNS)
+    new_values = ", ".join(_fold_sql(f"new.{c}") for c in SHELTER_FTS_COLUMNS)
+    old_values = ", ".join(_fold_sql(f"old.{c}") for c in SHELTER_FTS_COLUMNS)
+    fts_delete = f"INSERT INTO shelters_fts (shelters_fts, rowid, {fts_columns}) VALUES ('delete', old.id, {old_values});"
+    fts_insert = f"INSERT INTO shelters_fts (rowid, {fts_columns}) VALUES (new.id, {new_values});"
+    for action, body in (("INSERT", fts_insert), ("DELETE", fts_delete), ("UPDATE", fts_delete + fts_insert)):
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS shelters_fts_{action.lower()}
+            AFTER {action} ON shelters
+            BEGIN
+                {body}
+            END
         """)
-        
+    if not fts_exists:
+        cur.execute(f"""
+            INSERT INTO shelters_fts (rowid, {fts_columns})
+            SELECT id, {", ".join(_fold_sql(c) for c in SHELTER_FTS_COLUMNS)} FROM shelters
+        """)
+    
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS broadcast_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message TEXT NOT NULL,
+            sent_by TEXT,
+            sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            recipients_count INTEGER DEFAULT 0
+        )
+    """)
+    
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS admin_users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Надійна черга доставки (outbox). Текст зберігається один раз в
+    # outbox_messages, а outbox містить рядок на кожного отримувача.
+    # idempotency_key робить повторну постановку того самого повідомлення
+    # безпечною, а PK (message_id, chat_id) - повторне додавання отримувача.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS outbox_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT UNIQUE NOT NULL,
+            kind TEXT NOT NULL,
+            text TEXT NOT NULL,
+            broadcast_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            message_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (message_id, chat_id)
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_outbox_pending
+        ON outbox (message_id, chat_id) WHERE status = 'pending'
+    """)
+    
+    regions_data = [
+        ("Вінницька область", "1"),
+        ("Волинська область", "2"),
+        ("Дніпропетровська область", "3"),
+        ("Донецька область", "4"),
+        ("Житомирська область", "5"),
+        ("Закарпатська область", "6"),
+        ("Запорізька область", "7"),
+        ("Івано-Франківська область", "8"),
+        ("Київська область", "9"),
+        ("Кіровоградська область", "10"),
+        ("Луганська область", "11"),
+        ("Львівська область", "12"),
+        ("Миколаївська область", "13"),
+        ("Одеська область", "14"),
+        ("Полтавська область", "15"),
+        ("Рівненська область", "16"),
+        ("Сумська область", "17"),
+        ("Тернопільська область", "18"),
+        ("Харківська область", "19"),
+        ("Херсонська область", "20"),
+        ("Хмельницька область", "21"),
+        ("Черкаська область", "22"),
+        ("Чернівецька область", "23"),
+        ("Чернігівська область", "24"),
+        ("м. Київ", "25"),
+    ]
+    
+    for name, uid in regions_data:
         cur.execute("""
-            CREATE TABLE IF NOT EXISTS broadcast_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                message TEXT NOT NULL,
-                sent_by TEXT,
-                sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                recipients_count INTEGER DEFAULT 0
-            )
+            INSERT OR IGNORE INTO regions (name, uid) VALUES (?, ?)
+        """, (name, uid))
+    
+    # Агрегати для дашборду, /api/stats і /stats: тригери підтримують
+    # лічильники в тій самій транзакції, що й зміна даних, тож читання
+    # - це вибірка кількох рядків замість COUNT(*) по таблицях
+    cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'counters'")
+    counters_exist = cur.fetchone() is not None
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    for table, counter in _COUNTED_TABLES.items():
+        for action, delta in (("INSERT", "+ 1"), ("DELETE", "- 1")):
+            cur.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_count_{action.lower()}
+                AFTER {action} ON {table}
+                BEGIN
+                    UPDATE counters SET value = value {delta} WHERE name = '{counter}';
+                END
+            """)
+    for action, row, delta in (("INSERT", "new", "+ 1"), ("DELETE", "old", "- 1")):
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS user_regions_count_{action.lower()}
+            AFTER {action} ON user_regions
+            BEGIN
+                UPDATE counters SET value = value {delta}
+                WHERE name = '{SUBSCRIBERS_PREFIX}' || {row}.region_uid;
+            END
         """)
-        
+    if counters_exist:
+        cur.execute(f"""
+            INSERT OR IGNORE INTO counters (name, value)
+            SELECT '{SUBSCRIBERS_PREFIX}' || uid, 0 FROM regions
+        """)
+    else:
+        _rebuild_counters(cur)
+
+def _migration_indexes(cur: sqlite3.Cursor):
+    # Keyset-пагінація списку користувачів (get_users_page): сторінка -
+    # це діапазонний прохід індексу від курсора (last_seen, user_id)
+    cur.execute("UPDATE users SET last_seen = COALESCE(first_seen, CURRENT_TIMESTAMP) WHERE last_seen IS NULL")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_last_seen ON users (last_seen, user_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_role_last_seen ON users (role, last_seen, user_id)")
+    # Список укриттів в адмінці (ORDER BY region, city) та історія розсилок
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_shelters_region_city ON shelters (region, city)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_broadcast_history_sent_at ON broadcast_history (sent_at)")
+
+def _migration_seed_shelters(cur: sqlite3.Cursor):
+    seed_shelters()
+
+def _migration_alert_locations(cur: sqlite3.Cursor):
+    cur.execute("ALTER TABLE regions ADD COLUMN api_uid TEXT")
+    cur.executemany("UPDATE regions SET api_uid = ? WHERE name = ?",
+                    [(api_uid, name) for name, api_uid in REGION_API_UIDS.items()])
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_regions_api_uid ON regions (api_uid)")
+    # Райони, громади та міста з API (uid = location_uid). Довідник
+    # наповнюється з потоку тривог: кожна нова локація записується з
+    # областю (region_uid) і, для громад, батьківським районом.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS locations (
+            uid TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            location_type TEXT NOT NULL,
+            region_uid TEXT NOT NULL,
+            parent_uid TEXT,
+            alert_status TEXT DEFAULT 'N',
+            last_updated TIMESTAMP
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_locations_region ON locations (region_uid)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_locations_parent ON locations (parent_uid)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_locations (
+            user_id INTEGER NOT NULL,
+            location_uid TEXT NOT NULL,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, location_uid)
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_user_locations_location ON user_locations (location_uid, user_id)")
+
+def _migration_alert_history(cur: sqlite3.Cursor):
+    # Історія тривог: рядок на тривогу, початок і відбій - unix-час у
+    # секундах. location_uid NULL - тривога на всю область, інакше район чи
+    # громада. Незакрита тривога (ended_at IS NULL) для області/локації
+    # може бути лише одна, тож повторний початок після перезапуску не дублюється.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS alert_events (
+            id INTEGER PRIMARY KEY,
+            region_uid TEXT NOT NULL,
+            location_uid TEXT,
+            started_at INTEGER NOT NULL,
+            ended_at INTEGER
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_alert_events_region_started ON alert_events (region_uid, started_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_alert_events_started ON alert_events (started_at)")
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_alert_events_open
+        ON alert_events (region_uid, ifnull(location_uid, '')) WHERE ended_at IS NULL
+    """)
+    # Денні підсумки тривог на всю область: скільки почалося за добу,
+    # скільки з них завершилось і їхня сумарна тривалість (тривога цілком
+    # відноситься до доби початку). Запити за місяць чи роки читають
+    # кілька рядків на область замість сканування alert_events.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS alert_daily (
+            region_uid TEXT NOT NULL,
+            day TEXT NOT NULL,
+            alerts INTEGER NOT NULL DEFAULT 0,
+            finished INTEGER NOT NULL DEFAULT 0,
+            seconds INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (region_uid, day)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_alert_daily_day ON alert_daily (day)")
+    # Тривоги, активні на момент міграції, стають незакритими подіями
+    cur.execute("""
+        INSERT INTO alert_events (region_uid, started_at)
+        SELECT uid, CAST(strftime('%s', COALESCE(last_updated, CURRENT_TIMESTAMP)) AS INTEGER)
+        FROM regions WHERE alert_status = 'A'
+    """)
+    cur.execute("""
+        INSERT INTO alert_events (region_uid, location_uid, started_at)
+        SELECT region_uid, uid, CAST(strftime('%s', COALESCE(last_updated, CURRENT_TIMESTAMP)) AS INTEGER)
+        FROM locations WHERE alert_status = 'A'
+    """)
+    _rebuild_alert_daily(cur)
+
+def _migration_shelters_dedup_by_city(cur: sqlite3.Cursor):
+    # Раніше ключем була лише адреса з координатами, тож однакові адреси без
+    # координат у різних містах зливались в одне укриття. Новий ключ ширший,
+    # наявні рядки під нього підходять без чистки.
+    cur.execute("DROP INDEX IF EXISTS idx_shelters_dedup")
+    cur.execute(f"CREATE UNIQUE INDEX idx_shelters_dedup ON shelters ({_SHELTER_KEY})")
+
+def _migration_outbox_claims(cur: sqlite3.Cursor):
+    # Хто і коли взяв рядок у 'sending' (claim_outbox): requeue_outbox
+    # повертає лише власні рядки воркера або рядки з простроченою орендою
+    cur.execute("ALTER TABLE outbox ADD COLUMN claimed_by TEXT")
+    cur.execute("ALTER TABLE outbox ADD COLUMN claimed_at INTEGER")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_outbox_sending ON outbox (claimed_at) WHERE status = 'sending'")
+
+def _migration_user_regions_last_seen(cur: sqlite3.Cursor):
+    # Копія users.last_seen у user_regions для сторінок адмінки з фільтром за
+    # областю: прохід індексу (region_uid, last_seen, user_id) замість
+    # перевірки підписки для кожного користувача. Копію тримають тригери.
+    cur.execute("ALTER TABLE user_regions ADD COLUMN last_seen TIMESTAMP")
+    cur.execute("""
+        UPDATE user_regions SET last_seen = (
+            SELECT last_seen FROM users WHERE users.user_id = user_regions.user_id
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_regions_last_seen
+        ON user_regions (region_uid, last_seen, user_id)
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS user_regions_last_seen_insert AFTER INSERT ON user_regions
+        BEGIN
+            UPDATE user_regions SET last_seen = (SELECT last_seen FROM users WHERE user_id = NEW.user_id)
+            WHERE id = NEW.id;
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS users_last_seen_update AFTER UPDATE OF last_seen ON users
+        WHEN NEW.last_seen IS NOT OLD.last_seen
+        BEGIN
+            UPDATE user_regions SET last_seen = NEW.last_seen WHERE user_id = NEW.user_id;
+        END
+    """)
+
+def _migration_user_regions_last_seen_on_insert(cur: sqlite3.Cursor):
+    # Підписка може з'явитися раніше за рядок users (той вставляє буфер
+    # активності при першому скиданні) - тоді копія last_seen лишалась NULL,
+    # і курсор (last_seen, user_id) < (?, ?) ніколи не доходив до таких рядків
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS users_last_seen_insert AFTER INSERT ON users
+        BEGIN
+            UPDATE user_regions SET last_seen = NEW.last_seen WHERE user_id = NEW.user_id;
+        END
+    """)
+    cur.execute("""
+        UPDATE user_regions SET last_seen = (
+            SELECT last_seen FROM users WHERE users.user_id = user_regions.user_id
+        )
+        WHERE last_seen IS NULL
+    """)
+
+# Впорядковані міграції схеми: (версія, назва, функція). Кожна застосовується
+# рівно один раз і записується в schema_version; нові міграції - лише в кінець.
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, "base schema", _migration_base_schema),
+    (2, "users, shelters and broadcast_history indexes", _migration_indexes),
+    (3, "seed base shelters", _migration_seed_shelters),
+    (4, "alert locations and sub-oblast subscriptions", _migration_alert_locations),
+    (5, "alert history and daily rollups", _migration_alert_history),
+    (6, "shelters unique by region, city and address", _migration_shelters_dedup_by_city),
+    (7, "outbox claim owner and lease", _migration_outbox_claims),
+    (8, "user_regions.last_seen for region-filtered user pages", _migration_user_regions_last_seen),
+    (9, "user_regions.last_seen for subscriptions made before the users row", _migration_user_regions_last_seen_on_insert),
+]
+
+def get_schema_version() -> int:
+    with get_db() as conn:
+        cur = conn.cursor()
         cur.execute("""
-            CREATE TABLE IF NOT EXISTS admin_users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
-        
-        regions_data = [
-            ("Вінницька область", "1"),
-            ("Волинська область", "2"),
-            ("Дніпропетровська область", "3"),
-            ("Донецька область", "4"),
-            ("Житомирська область", "5"),
-            ("Закарпатська область", "6"),
-            ("Запорізька область", "7"),
-            ("Івано-Франківська область", "8"),
-            ("Київська область", "9"),
-            ("Кіровоградська область", "10"),
-            ("Луганська область", "11"),
-            ("Львівська область", "12"),
-            ("Миколаївська область", "13"),
-            ("Одеська область", "14"),
-            ("Полтавська область", "15"),
-            ("Рівненська область", "16"),
-            ("Сумська область", "17"),
-            ("Тернопільська область", "18"),
-            ("Харківська область", "19"),
-            ("Херсонська область", "20"),
-            ("Хмельницька область", "21"),
-            ("Черкаська область", "22"),
-            ("Чернівецька область", "23"),
-            ("Чернігівська область", "24"),
-            ("м. Київ", "25"),
-        ]
-        
-        for name, uid in regions_data:
+        cur.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_version")
+        return cur.fetchone()["version"]
+
+def migrate() -> List[int]:
+    # Кожна міграція - окрема транзакція. Рядок у schema_version вставляється
+    # першим: це бере блокування запису, тож якщо бот і адмінка стартують
+    # одночасно, другий процес дочекається коміту і пропустить міграцію.
+    applied = []
+    current = get_schema_version()
+    for version, name, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        with get_db() as conn:
+            cur = conn.cursor()
+            cur.execute("INSERT OR IGNORE INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+            if cur.rowcount == 0:
+                continue
+            migration(cur)
+        applied.append(version)
+        print(f"✅ Міграція {version}: {name}")
+    return applied
+
+def init_db():
+    # Викликається при старті процесу; повторні виклики в тому ж процесі
+    # (і з тим самим DB_FILE) нічого не роблять
+    global _initialized_key
+    key = (DB_FILE, os.getpid())
+    if _initialized_key == key:
+        return
+    migrate()
+    migrate_user_regions()
+    _initialized_key = key
+
+def migrate_user_regions(batch_size: int = 1000) -> int:
+    # Онлайн-міграція: переносить CSV із users.regions у user_regions
+    # невеликими транзакціями, щоб не тримати блокування запису довго.
+    migrated = 0
+    while True:
+        with get_db() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT name, uid FROM regions")
+            uids = {row["name"]: row["uid"] for row in cur.fetchall()}
             cur.execute("""
-                INSERT OR IGNORE INTO regions (name, uid) VALUES (?, ?)
-            """, (name, uid))
-        
-        conn.commit()
+                SELECT user_id, regions FROM users
+                WHERE regions != ''
+                LIMIT ?
+            """, (batch_size,))
+            batch = cur.fetchall()
+            if not batch:
+                return migrated
+            
+            cur.executemany("""
+                INSERT OR IGNORE INTO user_regions (user_id, region_uid) VALUES (?, ?)
+            """, [
+                (row["user_id"], uids[name])
+                for row in batch
+                for name in row["regions"].split(",")
+                if name in uids
+            ])
+            cur.executemany("UPDATE users SET regions = '' WHERE user_id = ?",
+                            [(row["user_id"],) for row in batch])
+            migrated += len(batch)
+
+# users.regions віддається у вигляді CSV назв областей з user_regions,
+# щоб словник користувача мав ту саму форму, що й до нормалізації
+_USER_COLUMNS = """
+    SELECT u.user_id, u.username, u.full_name, u.role, u.notifications_enabled,
+           u.first_seen, u.last_seen,
+           COALESCE((
+               SELECT group_concat(name, ',') FROM (
+                   SELECT r.name FROM user_regions ur
+                   JOIN regions r ON r.uid = ur.region_uid
+                   WHERE ur.user_id = u.user_id
+                   ORDER BY ur.id
+               )
+           ), '') AS regions
+"""
+_USER_SELECT = _USER_COLUMNS + "FROM users u\n"
 
 def add_or_update_user(user_id: int, username: str = None, full_name: str = None) -> Dict:
     with get_db() as conn:
@@ -127,52 +658,164 @@ def add_or_update_user(user_id: int, username: str = None, full_name: str = None
                 last_seen = CURRENT_TIMESTAMP
         """, (user_id, username, full_name, username, full_name))
         
-        cur.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
+        cur.execute(_USER_SELECT + "WHERE u.user_id = ?", (user_id,))
         return dict(cur.fetchone())
 
+def touch_users(rows: List[Tuple[int, Optional[str], Optional[str], str]]) -> int:
+    # Пакетний запис активності (activity.ActivityBuffer): rows - кортежі
+    # (user_id, username, full_name, last_seen), одна транзакція на пачку
+    with get_db() as conn:
+        conn.executemany("""
+            INSERT INTO users (user_id, username, full_name, first_seen, last_seen)
+            VALUES (?1, ?2, ?3, ?4, ?4)
+            ON CONFLICT(user_id) DO UPDATE SET
+                username = COALESCE(excluded.username, username),
+                full_name = COALESCE(excluded.full_name, full_name),
+                last_seen = excluded.last_seen
+        """, rows)
+    return len(rows)
+
 def get_user(user_id: int) -> Optional[Dict]:
     with get_db() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
+        cur.execute(_USER_SELECT + "WHERE u.user_id = ?", (user_id,))
         row = cur.fetchone()
         return dict(row) if row else None
 
 def update_user_regions(user_id: int, regions: List[str]):
     with get_db() as conn:
         cur = conn.cursor()
-        cur.execute("""
-            UPDATE users SET regions = ? WHERE user_id = ?
-        """, (",".join(regions), user_id))
+        placeholders = ",".join("?" * len(regions))
+        cur.execute(f"SELECT name, uid FROM regions WHERE name IN ({placeholders})", regions)
+        uids = {row["name"]: row["uid"] for row in cur.fetchall()}
+        wanted = [uids[name] for name in regions if name in uids]
+        
+        cur.execute(f"""
+            DELETE FROM user_regions
+            WHERE user_id = ? AND region_uid NOT IN ({",".join("?" * len(wanted))})
+        """, (user_id, *wanted))
+        cur.executemany("""
+            INSERT OR IGNORE INTO user_regions (user_id, region_uid) VALUES (?, ?)
+        """, [(user_id, uid) for uid in wanted])
+    
+    _notify("user_regions", user_id=user_id, region_uids=wanted)
 
 def get_user_regions(user_id: int) -> List[str]:
-    user = get_user(user_id)
-    if user and user.get("regions"):
-        return user["regions"].split(",")
-    return []
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT r.name FROM user_regions ur
+            JOIN regions r ON r.uid = ur.region_uid
+            WHERE ur.user_id = ?
+            ORDER BY ur.id
+        """, (user_id,))
+        return [row["name"] for row in cur.fetchall()]
 
 def update_user_role(user_id: int, role: str):
     with get_db() as conn:
         cur = conn.cursor()
         cur.execute("UPDATE users SET role = ? WHERE user_id = ?", (role, user_id))
+    
+    _notify("user_role", user_id=user_id, role=role)
 
 def get_all_users() -> List[Dict]:
     with get_db() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT * FROM users ORDER BY last_seen DESC")
+        cur.execute(_USER_SELECT + "ORDER BY u.last_seen DESC")
         return [dict(row) for row in cur.fetchall()]
 
+def get_users_page(limit: int = 50, cursor: Optional[Tuple[str, int]] = None,
+                   role: Optional[str] = None, region_uid: Optional[str] = None
+                   ) -> Tuple[List[Dict], Optional[Tuple[str, int]]]:
+    # Сторінка користувачів від найсвіжіших до найстаріших. cursor - пара
+    # (last_seen, user_id) останнього рядка попередньої сторінки; повертає
+    # рядки сторінки і курсор наступної (None, якщо це остання сторінка).
+    # З фільтром за областю сторінка йде індексом idx_user_regions_last_seen
+    # (копія last_seen у user_regions, тригери), тож час не залежить від
+    # того, скільки в області підписників; без нього - idx_users_last_seen.
+    where, params = [], []
+    if region_uid:
+        sql = _USER_COLUMNS + "FROM user_regions sub CROSS JOIN users u ON u.user_id = sub.user_id "
+        order = "sub"
+        where.append("sub.region_uid = ?")
+        params.append(region_uid)
+    else:
+        sql, order = _USER_SELECT, "u"
+    if cursor is not None:
+        where.append(f"({order}.last_seen, {order}.user_id) < (?, ?)")
+        params.extend(cursor)
+    if role:
+        where.append("u.role = ?")
+        params.append(role)
+    if where:
+        sql += "WHERE " + " AND ".join(where) + " "
+    sql += f"ORDER BY {order}.last_seen DESC, {order}.user_id DESC LIMIT ?"
+    
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, (*params, limit + 1))
+        users = [dict(row) for row in cur.fetchall()]
+    if len(users) > limit:
+        users = users[:limit]
+        return users, (users[-1]["last_seen"], users[-1]["user_id"])
+    return users, None
+
 def get_users_count() -> int:
+    return get_counter("users")
+
+def iter_user_region_uids() -> Iterator[Tuple[int, str]]:
     with get_db() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) as count FROM users")
-        return cur.fetchone()["count"]
+        cur.execute("SELECT user_id, region_uid FROM user_regions ORDER BY user_id")
+        for row in cur:
+            yield row["user_id"], row["region_uid"]
 
-def get_users_by_region(region: str) -> List[Dict]:
+def get_region_subscriber_counts() -> List[Dict]:
     with get_db() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT * FROM users WHERE regions LIKE ?", (f"%{region}%",))
+        cur.execute(f"""
+            SELECT r.name, r.uid, c.value AS count FROM regions r
+            JOIN counters c ON c.name = '{SUBSCRIBERS_PREFIX}' || r.uid
+            WHERE c.value > 0
+            ORDER BY count DESC
+        """)
         return [dict(row) for row in cur.fetchall()]
 
+def _rebuild_counters(cur: sqlite3.Cursor):
+    for table, counter in _COUNTED_TABLES.items():
+        cur.execute(f"""
+            INSERT INTO counters (name, value) SELECT '{counter}', COUNT(*) FROM {table} WHERE true
+            ON CONFLICT (name) DO UPDATE SET value = excluded.value
+        """)
+    cur.execute(f"""
+        INSERT INTO counters (name, value)
+        SELECT '{SUBSCRIBERS_PREFIX}' || r.uid,
+               (SELECT COUNT(*) FROM user_regions ur WHERE ur.region_uid = r.uid)
+        FROM regions r WHERE true
+        ON CONFLICT (name) DO UPDATE SET value = excluded.value
+    """)
+
+def rebuild_counters():
+    # Повний перерахунок - для ручного відновлення, якщо дані змінювали в обхід тригерів
+    with get_db() as conn:
+        _rebuild_counters(conn.cursor())
+
+def get_counter(name: str) -> int:
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT value FROM counters WHERE name = ?", (name,))
+        row = cur.fetchone()
+        return row["value"] if row else 0
+
+def get_stats() -> Dict[str, int]:
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT name, value FROM counters WHERE name NOT LIKE '{SUBSCRIBERS_PREFIX}%'")
+        stats = {row["name"]: row["value"] for row in cur.fetchall()}
+        cur.execute("SELECT COUNT(*) AS count FROM regions")
+        stats["regions"] = cur.fetchone()["count"]
+        return stats
+
 def get_all_regions() -> List[Dict]:
     with get_db() as conn:
         cur = conn.cursor()
@@ -187,6 +830,216 @@ def update_region_status(uid: str, status: str):
             WHERE uid = ?
         """, (status, uid))
 
+def get_locations() -> List[Dict]:
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM locations")
+        return [dict(row) for row in cur.fetchall()]
+
+def upsert_locations(rows: List[Tuple[str, str, str, str, Optional[str]]]):
+    # rows: (uid, title, location_type, region_uid, parent_uid)
+    with get_db() as conn:
+        conn.executemany("""
+            INSERT INTO locations (uid, title, location_type, region_uid, parent_uid)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (uid) DO UPDATE SET
+                title = excluded.title,
+                location_type = excluded.location_type,
+                region_uid = excluded.region_uid,
+                parent_uid = COALESCE(excluded.parent_uid, locations.parent_uid)
+        """, rows)
+
+def update_location_status(uid: str, status: str):
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE locations SET alert_status = ?, last_updated = CURRENT_TIMESTAMP
+            WHERE uid = ?
+        """, (status, uid))
+
+def get_user_locations(user_id: int) -> List[Dict]:
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT l.uid, l.title, l.location_type, l.region_uid FROM user_locations ul
+            JOIN locations l ON l.uid = ul.location_uid
+            WHERE ul.user_id = ?
+            ORDER BY l.title
+        """, (user_id,))
+        return [dict(row) for row in cur.fetchall()]
+
+def toggle_user_location(user_id: int, location_uid: str) -> bool:
+    # True - підписку додано, False - знято
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM user_locations WHERE user_id = ? AND location_uid = ?", (user_id, location_uid))
+        added = cur.rowcount == 0
+        if added:
+            cur.execute("INSERT INTO user_locations (user_id, location_uid) VALUES (?, ?)", (user_id, location_uid))
+    _notify("user_locations", user_id=user_id, location_uid=location_uid, added=added)
+    return added
+
+def get_location_subscribers(location_uids: Iterable[str] = (), region_uid: Optional[str] = None) -> List[int]:
+    # Підписники конкретних локацій або (region_uid) будь-якої локації області
+    with get_db() as conn:
+        cur = conn.cursor()
+        if region_uid is not None:
+            cur.execute("""
+                SELECT DISTINCT ul.user_id FROM locations l
+                JOIN user_locations ul ON ul.location_uid = l.uid
+                WHERE l.region_uid = ?
+            """, (region_uid,))
+        else:
+            location_uids = list(location_uids)
+            if not location_uids:
+                return []
+            cur.execute(f"""
+                SELECT DISTINCT user_id FROM user_locations
+                WHERE location_uid IN ({','.join('?' * len(location_uids))})
+            """, location_uids)
+        return [row["user_id"] for row in cur.fetchall()]
+
+def _alert_day(ts: float) -> str:
+    return datetime.fromtimestamp(ts, HISTORY_TZ).strftime("%Y-%m-%d")
+
+def _history_since(days: int) -> str:
+    # Перша доба діапазону "останні days діб", включно з сьогоднішньою
+    return (datetime.now(HISTORY_TZ) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+
+def open_alert_event(region_uid: str, location_uid: Optional[str], started_at: int) -> bool:
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT OR IGNORE INTO alert_events (region_uid, location_uid, started_at)
+            VALUES (?, ?, ?)
+        """, (region_uid, location_uid, started_at))
+        if cur.rowcount == 0:
+            return False
+        if location_uid is None:
+            cur.execute("""
+                INSERT INTO alert_daily (region_uid, day, alerts) VALUES (?, ?, 1)
+                ON CONFLICT (region_uid, day) DO UPDATE SET alerts = alerts + 1
+            """, (region_uid, _alert_day(started_at)))
+        return True
+
+def close_alert_event(region_uid: str, location_uid: Optional[str], ended_at: int) -> bool:
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id, started_at FROM alert_events
+            WHERE region_uid = ? AND ifnull(location_uid, '') = ? AND ended_at IS NULL
+        """, (region_uid, location_uid or ""))
+        row = cur.fetchone()
+        if row is None:
+            return False
+        cur.execute("UPDATE alert_events SET ended_at = ? WHERE id = ?", (ended_at, row["id"]))
+        if location_uid is None:
+            cur.execute("""
+                INSERT INTO alert_daily (region_uid, day, finished, seconds) VALUES (?, ?, 1, ?)
+                ON CONFLICT (region_uid, day) DO UPDATE SET
+                    finished = finished + 1,
+                    seconds = seconds + excluded.seconds
+            """, (region_uid, _alert_day(row["started_at"]), max(0, ended_at - row["started_at"])))
+        return True
+
+def _rebuild_alert_daily(cur: sqlite3.Cursor):
+    # Доба рахується в HISTORY_TZ, якої SQLite не знає, тож групуємо в Python
+    daily: Dict[Tuple[str, str], List[int]] = {}
+    cur.execute("SELECT region_uid, started_at, ended_at FROM alert_events WHERE location_uid IS NULL")
+    for row in cur.fetchall():
+        totals = daily.setdefault((row["region_uid"], _alert_day(row["started_at"])), [0, 0, 0])
+        totals[0] += 1
+        if row["ended_at"] is not None:
+            totals[1] += 1
+            totals[2] += max(0, row["ended_at"] - row["started_at"])
+    cur.execute("DELETE FROM alert_daily")
+    cur.executemany("""
+        INSERT INTO alert_daily (region_uid, day, alerts, finished, seconds) VALUES (?, ?, ?, ?, ?)
+    """, [key + tuple(totals) for key, totals in daily.items()])
+
+def rebuild_alert_daily():
+    # Повний перерахунок підсумків з alert_events - після ручних правок історії
+    with get_db() as conn:
+        _rebuild_alert_daily(conn.cursor())
+
+def get_alert_summary(days: int = 30, region_uids: Optional[List[str]] = None) -> List[Dict]:
+    # Кількість тривог на всю область, сумарна і середня тривалість за
+    # останні days діб - з денних підсумків, O(областей × діб) рядків
+    where, params = "", [_history_since(days)]
+    if region_uids is not None:
+        where = f"WHERE r.uid IN ({','.join('?' * len(region_uids))})"
+        params += list(region_uids)
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT r.uid, r.name,
+                   COALESCE(SUM(d.alerts), 0) AS alerts,
+                   COALESCE(SUM(d.finished), 0) AS finished,
+                   COALESCE(SUM(d.seconds), 0) AS seconds
+            FROM regions r
+            LEFT JOIN alert_daily d ON d.region_uid = r.uid AND d.day >= ?
+            {where}
+            GROUP BY r.uid
+            ORDER BY alerts DESC, r.name
+        """, params)
+        rows = [dict(row) for row in cur.fetchall()]
+    for row in rows:
+        row["avg_seconds"] = row["seconds"] // row["finished"] if row["finished"] else None
+    return rows
+
+def get_alert_daily(region_uid: str, days: int = 30) -> List[Dict]:
+    # Ряд по добах для графіка: доби без тривог - нулями
+    since = _history_since(days)
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT day, alerts, finished, seconds FROM alert_daily
+            WHERE region_uid = ? AND day >= ?
+        """, (region_uid, since))
+        found = {row["day"]: dict(row) for row in cur.fetchall()}
+    start = datetime.strptime(since, "%Y-%m-%d")
+    series = []
+    for offset in range(days):
+        day = (start + timedelta(days=offset)).strftime("%Y-%m-%d")
+        series.append(found.get(day, {"day": day, "alerts": 0, "finished": 0, "seconds": 0}))
+    return series
+
+def get_alert_events(region_uid: str, since: int, until: Optional[int] = None,
+                     limit: Optional[int] = None) -> List[Dict]:
+    # Тривоги області (включно з районами і громадами), що почались у [since, until)
+    query = "SELECT * FROM alert_events WHERE region_uid = ? AND started_at >= ?"
+    params: list = [region_uid, since]
+    if until is not None:
+        query += " AND started_at < ?"
+        params.append(until)
+    query += " ORDER BY started_at DESC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        return [dict(row) for row in cur.fetchall()]
+
+def get_last_alerts(region_uids: List[str]) -> Dict[str, Dict]:
+    # Остання тривога на всю область (може бути ще незакритою) для кожної з областей
+    if not region_uids:
+        return {}
+    with get_db() as conn:
+        cur = conn.cursor()
+        # Зворотний прохід idx_alert_events_region_started до першої тривоги
+        # на всю область, а не агрегат по всій історії області
+        cur.execute(f"""
+            SELECT e.region_uid, e.started_at, e.ended_at FROM regions r
+            JOIN alert_events e ON e.id = (
+                SELECT id FROM alert_events
+                WHERE region_uid = r.uid AND location_uid IS NULL
+                ORDER BY started_at DESC LIMIT 1
+            )
+            WHERE r.uid IN ({','.join('?' * len(region_uids))})
+        """, list(region_uids))
+        return {row["region_uid"]: dict(row) for row in cur.fetchall()}
+
 def get_region_by_name(name: str) -> Optional[Dict]:
     with get_db() as conn:
         cur = conn.cursor()
@@ -194,27 +1047,96 @@ def get_region_by_name(name: str) -> Optional[Dict]:
         row = cur.fetchone()
         return dict(row) if row else None
 
+# Укриття унікальне за областю, містом, адресою і координатами
+# (idx_shelters_dedup): повторний імпорт того самого реєстру оновлює рядки,
+# а не дублює їх
+_SHELTER_UPSERT = f"""
+    INSERT INTO shelters (region, city, address, shelter_type, capacity, lat, lon, description)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT ({_SHELTER_KEY}) DO UPDATE SET
+        shelter_type = excluded.shelter_type,
+        capacity = excluded.capacity,
+        description = ifnull(excluded.description, shelters.description)
+"""
+
 def add_shelter(region: str, city: str, address: str, shelter_type: str = "укриття", 
                 capacity: int = 0, lat: float = None, lon: float = None, description: str = None):
+    upsert_shelters([(region, city, address, shelter_type, capacity, lat, lon, description)])
+
+def upsert_shelters(rows: List[Tuple]) -> int:
+    # rows: (region, city, address, shelter_type, capacity, lat, lon, description)
     with get_db() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO shelters (region, city, address, shelter_type, capacity, lat, lon, description)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (region, city, address, shelter_type, capacity, lat, lon, description))
+        conn.executemany(_SHELTER_UPSERT, rows)
+        return len(rows)
 
-def get_shelters_by_region(region: str) -> List[Dict]:
+def get_shelters_count() -> int:
+    return get_counter("shelters")
+
+def get_shelters_by_ids(ids: List[int]) -> List[Dict]:
     with get_db() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT * FROM shelters WHERE region LIKE ?", (f"%{region}%",))
+        cur.execute(f"SELECT * FROM shelters WHERE id IN ({','.join('?' * len(ids))})", ids)
         return [dict(row) for row in cur.fetchall()]
 
-def get_shelters_by_city(city: str) -> List[Dict]:
+def iter_shelter_points() -> Iterator[Tuple[int, float, float]]:
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id, lat, lon FROM shelters WHERE lat IS NOT NULL AND lon IS NOT NULL")
+        for row in cur:
+            yield row["id"], row["lat"], row["lon"]
+
+def get_data_version(name: str) -> int:
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT version FROM data_versions WHERE name = ?", (name,))
+        row = cur.fetchone()
+        return row["version"] if row else 0
+
+def _fold_sql(expr: str) -> str:
+    for src, dst in _SEARCH_FOLD.items():
+        expr = "replace({}, '{}', '{}')".format(expr, src.replace("'", "''"), dst)
+    return expr
+
+def _fold_search_text(text: str) -> str:
+    return text.translate(str.maketrans(_SEARCH_FOLD))
+
+def build_fts_query(text: str, columns: Tuple[str, ...] = SHELTER_SEARCH_COLUMNS) -> Optional[str]:
+    # Кожне слово запиту - префіксна фраза ("хрещ" -> "хрещ"*), слово з
+    # дефісом чи крапкою - фраза з кількох токенів ("івано франк"*).
+    # Лапки та оператори FTS5 з тексту користувача не потрапляють у запит.
+    terms = []
+    for word in _fold_search_text(text).split():
+        tokens = "".join(ch if ch.isalnum() else " " for ch in word).split()
+        if tokens:
+            terms.append('"' + " ".join(tokens) + '"*')
+    if not terms:
+        return None
+    return "{" + " ".join(columns) + "} : (" + " AND ".join(terms) + ")"
+
+def search_shelters(query: str, limit: Optional[int] = 20,
+                    columns: Tuple[str, ...] = SHELTER_SEARCH_COLUMNS, ranked: bool = True) -> List[Dict]:
+    # ranked: сортування за bm25 - ціна пропорційна кількості збігів,
+    # тому для вибірок за областю/містом (усі збіги рівнозначні) воно вимкнене
+    match = build_fts_query(query, columns)
+    if match is None:
+        return []
     with get_db() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT * FROM shelters WHERE city LIKE ?", (f"%{city}%",))
+        cur.execute(f"""
+            SELECT s.* FROM shelters_fts
+            JOIN shelters s ON s.id = shelters_fts.rowid
+            WHERE shelters_fts MATCH ?
+            ORDER BY {"shelters_fts.rank" if ranked else "shelters_fts.rowid"}
+            LIMIT ?
+        """, (match, -1 if limit is None else limit))
         return [dict(row) for row in cur.fetchall()]
 
+def get_shelters_by_region(region: str, limit: Optional[int] = None) -> List[Dict]:
+    return search_shelters(region, limit, columns=("region",), ranked=False)
+
+def get_shelters_by_city(city: str, limit: Optional[int] = None) -> List[Dict]:
+    return search_shelters(city, limit, columns=("city",), ranked=False)
+
 def add_broadcast(message: str, sent_by: str, recipients_count: int):
     with get_db() as conn:
         cur = conn.cursor()
@@ -223,6 +1145,152 @@ def add_broadcast(message: str, sent_by: str, recipients_count: int):
             VALUES (?, ?, ?)
         """, (message, sent_by, recipients_count))
 
+OUTBOX_PENDING = "pending"
+OUTBOX_SENDING = "sending"
+OUTBOX_SENT = "sent"
+OUTBOX_FAILED = "failed"
+# Рядок у 'sending' належить воркеру, що його взяв (claimed_by). Чужі
+# рядки повертаються в чергу лише після закінчення оренди - воркер, що
+# впав, не продовжує її (mark_outbox_many з owner)
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+
+BROADCAST_PREFIX = "📢 <b>Оголошення:</b>\n\n"
+
+def enqueue_message(idempotency_key: str, kind: str, text: str, chat_ids: List[int],
+                    broadcast_id: int = None) -> int:
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT OR IGNORE INTO outbox_messages (idempotency_key, kind, text, broadcast_id)
+            VALUES (?, ?, ?, ?)
+        """, (idempotency_key, kind, text, broadcast_id))
+        cur.execute("SELECT id FROM outbox_messages WHERE idempotency_key = ?", (idempotency_key,))
+        message_id = cur.fetchone()["id"]
+        cur.executemany("""
+            INSERT OR IGNORE INTO outbox (message_id, chat_id) VALUES (?, ?)
+        """, [(message_id, chat_id) for chat_id in chat_ids])
+        return message_id
+
+def enqueue_broadcast(message: str, sent_by: str) -> Dict:
+    # Історія, повідомлення і всі отримувачі - однією транзакцією
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) AS count FROM users")
+        recipients = cur.fetchone()["count"]
+        cur.execute("""
+            INSERT INTO broadcast_history (message, sent_by, recipients_count)
+            VALUES (?, ?, ?)
+        """, (message, sent_by, recipients))
+        broadcast_id = cur.lastrowid
+        cur.execute("""
+            INSERT INTO outbox_messages (idempotency_key, kind, text, broadcast_id)
+            VALUES (?, 'broadcast', ?, ?)
+        """, (f"broadcast:{broadcast_id}", BROADCAST_PREFIX + message, broadcast_id))
+        message_id = cur.lastrowid
+        cur.execute("""
+            INSERT INTO outbox (message_id, chat_id) SELECT ?, user_id FROM users
+        """, (message_id,))
+        return {"broadcast_id": broadcast_id, "message_id": message_id, "recipients": recipients}
+
+def _shard_filter(shard: Optional[Tuple[int, int]]) -> Tuple[str, tuple]:
+    # shard = (index, count): рядки, чий chat_id % count == index
+    if shard is None:
+        return "", ()
+    index, count = shard
+    return " AND chat_id % ? = ?", (count, index)
+
+def claim_outbox(limit: int = 200, shard: Optional[Tuple[int, int]] = None,
+                 owner: Optional[str] = None) -> List[Dict]:
+    shard_sql, shard_args = _shard_filter(shard)
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            UPDATE outbox SET status = 'sending', attempts = attempts + 1,
+                              updated_at = CURRENT_TIMESTAMP,
+                              claimed_by = ?, claimed_at = CAST(strftime('%s', 'now') AS INTEGER)
+            WHERE rowid IN (
+                SELECT rowid FROM outbox WHERE status = 'pending'{shard_sql}
+                ORDER BY message_id, chat_id LIMIT ?
+            )
+            RETURNING message_id, chat_id
+        """, (owner, *shard_args, limit))
+        rows = [dict(row) for row in cur.fetchall()]
+        ids = sorted({row["message_id"] for row in rows})
+        cur.execute(f"SELECT id, text FROM outbox_messages WHERE id IN ({','.join('?' * len(ids))})", ids)
+        texts = {row["id"]: row["text"] for row in cur.fetchall()}
+        for row in rows:
+            row["text"] = texts[row["message_id"]]
+        return rows
+
+def mark_outbox_many(results: List[Tuple[int, int, str]], owner: Optional[str] = None):
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.executemany("""
+            UPDATE outbox SET status = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE message_id = ? AND chat_id = ?
+        """, [(status, message_id, chat_id) for message_id, chat_id, status in results])
+        if owner is not None:
+            # воркер живий і просувається - продовжуємо оренду решти його рядків
+            cur.execute("""
+                UPDATE outbox SET claimed_at = CAST(strftime('%s', 'now') AS INTEGER)
+                WHERE status = 'sending' AND claimed_by = ?
+            """, (owner,))
+
+def requeue_outbox(shard: Optional[Tuple[int, int]] = None, owner: Optional[str] = None,
+                   lease: float = OUTBOX_LEASE_SECONDS, keep: List[Tuple[int, int]] = ()) -> int:
+    # Рядки у 'sending' повертаються в чергу, якщо вони власні (owner - після
+    # перезапуску воркера з тим самим OUTBOX_WORKER_ID) або оренда минула
+    # (воркер іншої репліки впав). Рядки живих воркерів не чіпаються, тож
+    # повторно можуть піти лише ті, що були "в польоті" в момент падіння.
+    # keep - пари (message_id, chat_id), уже надіслані, але ще не записані
+    # воркером: вони лишаються в 'sending', щоб не піти повторно.
+    shard_sql, shard_args = _shard_filter(shard)
+    owner_sql, owner_args = ("claimed_by = ? OR ", (owner,)) if owner is not None else ("", ())
+    keep_sql = f" AND (message_id, chat_id) NOT IN (VALUES {','.join(['(?, ?)'] * len(keep))})" if keep else ""
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            UPDATE outbox SET status = 'pending', claimed_by = NULL, claimed_at = NULL
+            WHERE status = 'sending'{shard_sql}{keep_sql}
+              AND ({owner_sql}claimed_at IS NULL
+                   OR claimed_at < CAST(strftime('%s', 'now') AS INTEGER) - ?)
+        """, (*shard_args, *(value for pair in keep for value in pair), *owner_args, lease))
+        return cur.rowcount
+
+def get_outbox_depth() -> int:
+    # Рядки, що чекають на відправку (частковий індекс idx_outbox_pending)
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) AS count FROM outbox WHERE status = 'pending'")
+        return cur.fetchone()["count"]
+
+def get_outbox_progress(message_id: int) -> Dict:
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT status, COUNT(*) AS count FROM outbox
+            WHERE message_id = ? GROUP BY status
+        """, (message_id,))
+        counts = {OUTBOX_PENDING: 0, OUTBOX_SENDING: 0, OUTBOX_SENT: 0, OUTBOX_FAILED: 0}
+        counts.update({row["status"]: row["count"] for row in cur.fetchall()})
+        return counts
+
+def purge_outbox(days: int = 7) -> int:
+    with get_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id FROM outbox_messages m
+            WHERE created_at < datetime('now', ?)
+              AND NOT EXISTS (
+                  SELECT 1 FROM outbox o
+                  WHERE o.message_id = m.id AND o.status IN ('pending', 'sending')
+              )
+        """, (f"-{days} days",))
+        ids = [(row["id"],) for row in cur.fetchall()]
+        cur.executemany("DELETE FROM outbox WHERE message_id = ?", ids)
+        cur.executemany("DELETE FROM outbox_messages WHERE id = ?", ids)
+        return len(ids)
+
 def get_broadcast_history() -> List[Dict]:
     with get_db() as conn:
         cur = conn.cursor()
@@ -246,22 +1314,34 @@ def get_admin(username: str) -> Optional[Dict]:
 
 def seed_shelters():
     shelters_data = [
-        ("Київська область", "Київ", "вул. Хрещатик, станція метро 'Хрещатик'", "метро", 5000),
-        ("Київська область", "Київ", "вул. Велика Васильківська, станція метро 'Палац Спорту'", "метро", 4000),
-        ("Київська область", "Київ", "Майдан Незалежності, станція метро 'Майдан Незалежності'", "метро", 6000),
-        ("Харківська область", "Харків", "пл. Свободи, станція метро 'Держпром'", "метро", 3000),
-        ("Харківська область", "Харків", "вул. Сумська, станція метро 'Університет'", "метро", 2500),
-        ("Дніпропетровська область", "Дніпро", "пр. Дмитра Яворницького, станція метро 'Центральна'", "метро", 2000),
-        ("Львівська область", "Львів", "пл. Ринок, підвал ратуші", "підвал", 200),
-        ("Одеська область", "Одеса", "вул. Дерибасівська, підвальні приміщення", "підвал", 500),
-        ("Сумська область", "Суми", "вул. Соборна, підвал ТЦ", "підвал", 300),
-        ("Полтавська область", "Полтава", "вул. Соборності, підвал адмінбудівлі", "підвал", 250),
+        ("Київська область", "Київ", "вул. Хрещатик, станція метро 'Хрещатик'", "метро", 5000, 50.4474, 30.5224),
+        ("Київська область", "Київ", "вул. Велика Васильківська, станція метро 'Палац Спорту'", "метро", 4000, 50.4287, 30.5167),
+        ("Київська область", "Київ", "Майдан Незалежності, станція метро 'Майдан Незалежності'", "метро", 6000, 50.4501, 30.5244),
+        ("Харківська область", "Харків", "пл. Свободи, станція метро 'Держпром'", "метро", 3000, 49.9935, 36.2358),
+        ("Харківська область", "Харків", "вул. Сумська, станція метро 'Університет'", "метро", 2500, 50.0043, 36.2311),
+        ("Дніпропетровська область", "Дніпро", "пр. Дмитра Яворницького, станція метро 'Центральна'", "метро", 2000, 48.4622, 35.0462),
+        ("Львівська область", "Львів", "пл. Ринок, підвал ратуші", "підвал", 200, 49.8419, 24.0316),
+        ("Одеська область", "Одеса", "вул. Дерибасівська, підвальні приміщення", "підвал", 500, 46.4843, 30.7369),
+        ("Сумська область", "Суми", "вул. Соборна, підвал ТЦ", "підвал", 300, 50.9077, 34.7981),
+        ("Полтавська область", "Полтава", "вул. Соборності, підвал адмінбудівлі", "підвал", 250, 49.5883, 34.5514),
     ]
     
     with get_db() as conn:
         cur = conn.cursor()
         cur.execute("SELECT COUNT(*) as count FROM shelters")
         if cur.fetchone()["count"] == 0:
-            for region, city, address, shelter_type, capacity in shelters_data:
-                add_shelter(region, city, address, shelter_type, capacity)
+            upsert_shelters([row + (None,) for row in shelters_data])
             print("✅ Додано базові укриття")
+
+# Час виконання кожної публічної функції, що працює з базою:
+# db_query_seconds{function="..."}. Генератори (iter_*) не обгортаються -
+# їхній час припадає на споживача.
+DB_QUERY_SECONDS = metrics.Histogram("db_query_seconds", "database.py function duration", ("function",))
+OUTBOX_PENDING_GAUGE = metrics.Gauge("outbox_pending", "Outbox rows waiting for delivery",
+                                     function=lambda: get_outbox_depth())
+
+for _name, _func in list(globals().items()):
+    if (inspect.isfunction(_func) and _func.__module__ == __name__ and not _name.startswith("_")
+            and _name != "get_db" and not inspect.isgeneratorfunction(_func)
+            and "get_db" in _func.__code__.co_names):
+        globals()[_name] = metrics.timed(DB_QUERY_SECONDS, function=_name)(_func)
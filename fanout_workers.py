@@ -0,0 +1,116 @@
+# fanout_workers.py - Пул процесів для розсилки тривог, шардований за user_id
+#
+# Під час масової тривоги один event loop бота стає вузьким місцем, тому
+# доставку можна винести в FANOUT_WORKERS окремих процесів. Кожен процес
+# має власний event loop, Bot і Sender, отримує частку глобального бюджету
+# відправки (SEND_RATE / N) і вичитує з outbox лише рядки свого шарду
+# (chat_id % N == index). Процес-поллер після постановки подій у outbox
+# будить воркерів через multiprocessing.Queue.
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+from typing import List, Optional
+
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", "0"))
+
+def _worker_main(index: int, count: int, queue, ready, token: str, api_url: Optional[str], rate: float,
+                 owner: str):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_worker(index, count, queue, ready, token, api_url, rate, owner))
+
+async def _worker(index: int, count: int, queue, ready, token: str, api_url: Optional[str], rate: float,
+                  owner: str):
+    import metrics
+    from sender import OutboxWorker, Sender, create_bot
+
+    bot = create_bot(token, api_url)
+    worker = OutboxWorker(Sender(bot, rate=rate), shard=(index, count), owner=owner)
+    loop = asyncio.get_running_loop()
+
+    async def listen():
+        # multiprocessing.Queue блокуючий, тому читаємо його в потоці
+        while True:
+            event = await loop.run_in_executor(None, queue.get)
+            if event is None:
+                run.cancel()
+                return
+            worker.notify()
+
+    run = asyncio.create_task(worker.run())
+    listener = asyncio.create_task(listen())
+    # кожен процес має власні лічильники доставки: порт METRICS_PORT + 1 + index
+    metrics_server = await metrics.start_server(port=metrics.METRICS_PORT + 1 + index) if metrics.METRICS_PORT else None
+    ready.set()
+    try:
+        await run
+    except asyncio.CancelledError:
+        pass
+    finally:
+        listener.cancel()
+        if metrics_server:
+            await metrics_server.cleanup()
+        await bot.session.close()
+
+class FanoutPool:
+    def __init__(self, token: str, api_url: Optional[str] = None, workers: int = FANOUT_WORKERS,
+                 rate: Optional[float] = None):
+        from sender import SEND_RATE, OUTBOX_WORKER_ID
+
+        self.token = token
+        self.api_url = api_url
+        self.count = workers
+        self.rate = (rate or SEND_RATE) / workers
+        # власник рядків шарду не змінюється при перезапуску процесу-воркера,
+        # тож новий процес одразу забирає "зависші" рядки попереднього
+        self.owner = OUTBOX_WORKER_ID
+        self._ctx = mp.get_context("spawn")
+        self._queues = [self._ctx.Queue() for _ in range(workers)]
+        self._ready = [self._ctx.Event() for _ in range(workers)]
+        self._processes: List[Optional[mp.Process]] = [None] * workers
+
+    def _spawn(self, index: int) -> mp.Process:
+        self._ready[index].clear()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(index, self.count, self._queues[index], self._ready[index], self.token, self.api_url, self.rate,
+                  f"{self.owner}:fanout{index}"),
+            name=f"fanout-{index}",
+            daemon=True,
+        )
+        process.start()
+        return process
+
+    def start(self):
+        for index in range(self.count):
+            self._processes[index] = self._spawn(index)
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return all(ready.wait(timeout) for ready in self._ready)
+
+    def notify(self, event=True):
+        for queue in self._queues:
+            queue.put(event)
+
+    def stop(self, timeout: float = 10.0):
+        for queue in self._queues:
+            queue.put(None)
+        for process in self._processes:
+            if process is not None:
+                process.join(timeout)
+                if process.is_alive():
+                    process.terminate()
+
+    async def run(self, check_interval: float = 5.0):
+        # Наглядач: процес, що впав, перезапускається і сам повертає в чергу
+        # "зависші" рядки свого шарду (requeue_outbox при старті воркера)
+        self.start()
+        try:
+            while True:
+                await asyncio.sleep(check_interval)
+                for index, process in enumerate(self._processes):
+                    if process is not None and not process.is_alive():
+                        logging.warning(f"Fanout worker {index} exited with {process.exitcode}, restarting")
+                        self._processes[index] = self._spawn(index)
+        finally:
+            await asyncio.get_running_loop().run_in_executor(None, self.stop)
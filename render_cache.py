@@ -0,0 +1,37 @@
+# render_cache.py - Кеш відрендерених повідомлень у межах одного знімка тривог
+#
+# Користувачі з однаковим набором областей отримують байт-в-байт однаковий
+# текст статусу, тож він рендериться один раз на (знімок, набір областей).
+# Коли приходить новий знімок, кеш повністю очищується; в межах знімка
+# зберігається не більше max_entries найсвіжіших наборів (LRU).
+import os
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "10000"))
+
+class SnapshotRenderCache:
+    def __init__(self, max_entries: int = RENDER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._snapshot = None
+        self._entries: "OrderedDict[Hashable, str]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, snapshot, key: Hashable, render: Callable[[], str]) -> str:
+        if snapshot is not self._snapshot:
+            self._snapshot = snapshot
+            self._entries.clear()
+        text = self._entries.get(key)
+        if text is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return text
+        self.misses += 1
+        text = self._entries[key] = render()
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return text
@@ -0,0 +1,297 @@
+# sender.py - Розсилка повідомлень з обмеженням швидкості
+#
+# Глобальний token bucket тримає загальний темп нижче ліміту Bot API
+# (~30 повідомлень/с), ChatLimiter не дає слати в один чат частіше ніж раз
+# на секунду, а пул воркерів обмежує кількість одночасних запитів.
+# TelegramRetryAfter ставить на паузу весь bucket, мережеві та серверні
+# помилки повторюються з експоненційною затримкою.
+import asyncio
+import itertools
+import logging
+import os
+import random
+import socket
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Iterable, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.enums import ParseMode
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+import async_db as adb
+import database as db
+import metrics
+
+SEND_RATE = float(os.getenv("SEND_RATE", "25"))
+SEND_CONCURRENCY = int(os.getenv("SEND_CONCURRENCY", "20"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+CHAT_INTERVAL = 1.0
+# Власник рядків outbox у 'sending'. Стабільний OUTBOX_WORKER_ID на репліку
+# дозволяє після перезапуску одразу повернути свої рядки; за замовчуванням
+# (host:pid) рядки процесу, що впав, повертаються після OUTBOX_LEASE_SECONDS
+OUTBOX_WORKER_ID = os.getenv("OUTBOX_WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+OUTBOX_REQUEUE_INTERVAL = float(os.getenv("OUTBOX_REQUEUE_INTERVAL", "60"))
+
+def create_bot(token: str, api_url: Optional[str] = None) -> Bot:
+    # api_url - власний Bot API сервер (або заглушка для бенчмарків)
+    return Bot(
+        token=token,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+        session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)) if api_url else None,
+    )
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+class ChatLimiter:
+    def __init__(self, interval: float = CHAT_INTERVAL, max_tracked: int = 10000):
+        self.interval = interval
+        self.max_tracked = max_tracked
+        self._next: dict = {}
+
+    async def wait(self, chat_id: int):
+        now = time.monotonic()
+        if len(self._next) > self.max_tracked:
+            self._next = {k: v for k, v in self._next.items() if v > now}
+        ready = self._next.get(chat_id, now)
+        self._next[chat_id] = max(ready, now) + self.interval
+        if ready > now:
+            await asyncio.sleep(ready - now)
+
+@dataclass
+class BroadcastProgress:
+    total: int
+    sent: int = 0
+    failed: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed
+
+    @property
+    def remaining(self) -> int:
+        return self.total - self.done
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        return self.remaining / self.rate if self.rate else None
+
+class Sender:
+    def __init__(self, bot: Bot, rate: float = SEND_RATE, concurrency: int = SEND_CONCURRENCY,
+                 max_retries: int = SEND_MAX_RETRIES):
+        self.bot = bot
+        self.bucket = TokenBucket(rate)
+        self.chats = ChatLimiter()
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.sent = 0
+        self.failed = 0
+        self.retry_after = 0
+
+    async def send(self, chat_id: int, text: str, **kwargs) -> bool:
+        attempt = 0
+        while True:
+            await self.chats.wait(chat_id)
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id, text, **kwargs)
+                self.sent += 1
+                metrics.SEND_TOTAL.inc(result="sent")
+                return True
+            except TelegramRetryAfter as e:
+                # ліміт перевищено для всього бота: зупиняємо bucket для всіх воркерів
+                self.retry_after += 1
+                metrics.SEND_RETRY_AFTER.inc()
+                self.bucket.pause(e.retry_after)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    logging.warning(f"Send to {chat_id} failed after {attempt} attempts: {e}")
+                    self.failed += 1
+                    metrics.SEND_TOTAL.inc(result="network_error")
+                    return False
+                await asyncio.sleep(min(30.0, 2 ** attempt) * (0.5 + random.random()))
+            except TelegramAPIError as e:
+                # заблокував бота, чат не існує тощо - повтор не допоможе
+                logging.debug(f"Send to {chat_id} rejected: {e}")
+                self.failed += 1
+                metrics.SEND_TOTAL.inc(result="rejected")
+                return False
+
+    async def broadcast(self, chat_ids: Iterable[int], text: str, total: Optional[int] = None,
+                        on_progress: Optional[Callable[[BroadcastProgress], Awaitable]] = None,
+                        on_result: Optional[Callable[[int, bool], Awaitable]] = None,
+                        progress_interval: float = 3.0, **kwargs) -> BroadcastProgress:
+        if total is None:
+            chat_ids = list(chat_ids)
+            total = len(chat_ids)
+        progress = BroadcastProgress(total)
+        queue = iter(chat_ids)
+
+        async def worker():
+            for chat_id in queue:
+                ok = await self.send(chat_id, text, **kwargs)
+                if ok:
+                    progress.sent += 1
+                else:
+                    progress.failed += 1
+                if on_result:
+                    await on_result(chat_id, ok)
+
+        async def reporter():
+            while True:
+                await asyncio.sleep(progress_interval)
+                await on_progress(progress)
+
+        reporter_task = asyncio.create_task(reporter()) if on_progress else None
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, max(total, 1)))))
+        finally:
+            if reporter_task:
+                reporter_task.cancel()
+        if on_progress:
+            await on_progress(progress)
+        return progress
+
+# Вичитує таблицю outbox і доставляє повідомлення через Sender. Результати
+# записуються пачками по MARK_BATCH рядків і після кожного повідомлення,
+# тож після перезапуску (requeue_outbox) повторно можуть піти лише
+# повідомлення, відправлені, але ще не записані в момент збою. Взяті рядки
+# позначаються owner, і воркер повертає в чергу лише свої або ті, чия
+# оренда минула, - рядки, які зараз шле інша репліка, не дублюються.
+class OutboxWorker:
+    MARK_BATCH = 50
+
+    def __init__(self, sender: Sender, batch_size: int = 200, idle_interval: float = 1.0,
+                 shard: Optional[Tuple[int, int]] = None, owner: Optional[str] = None):
+        self.sender = sender
+        self.shard = shard
+        self.owner = owner or OUTBOX_WORKER_ID
+        self.batch_size = batch_size
+        self.idle_interval = idle_interval
+        self._wakeup = asyncio.Event()
+        self._results = []
+        self._recovering = False
+
+    def notify(self):
+        self._wakeup.set()
+
+    async def _flush(self):
+        results, self._results = self._results, []
+        if results:
+            try:
+                await adb.mark_outbox_many(results, owner=self.owner)
+            except Exception:
+                # не губимо результати: наступний flush запише їх разом з новими,
+                # інакше надіслані рядки лишаться в 'sending' і підуть повторно
+                self._results = results + self._results
+                raise
+
+    async def _recover(self):
+        # Після збою доставки: записуємо вже надіслане і повертаємо в чергу
+        # решту взятих рядків, а не лишаємо їх у 'sending' до перезапуску
+        # (mark_outbox_many ще й продовжувала б їм оренду). Надіслані рядки,
+        # чиї результати записати не вдалося, лишаються в 'sending'; поки
+        # вони є, повторюємо на кожній ітерації.
+        self._recovering = True
+        try:
+            await self._flush()
+        except Exception as e:
+            logging.error(f"Outbox mark error: {e}")
+        held = [(message_id, chat_id) for message_id, chat_id, _ in self._results]
+        try:
+            await adb.requeue_outbox(self.shard, self.owner, keep=held)
+        except Exception as e:
+            logging.error(f"Outbox requeue error: {e}")
+            return
+        self._recovering = bool(self._results)
+
+    async def _deliver(self, message_id: int, chat_ids: list, text: str):
+        async def mark(chat_id: int, ok: bool):
+            self._results.append((message_id, chat_id, db.OUTBOX_SENT if ok else db.OUTBOX_FAILED))
+            if len(self._results) >= self.MARK_BATCH:
+                await self._flush()
+
+        await self.sender.broadcast(chat_ids, text, on_result=mark)
+        # кожне повідомлення пачки записується одразу після його розсилки
+        await self._flush()
+
+    async def run(self):
+        requeued = await adb.requeue_outbox(self.shard, self.owner)
+        if requeued:
+            logging.info(f"Outbox: {requeued} messages returned to the queue after restart")
+        await adb.purge_outbox()
+        next_requeue = time.monotonic() + OUTBOX_REQUEUE_INTERVAL
+
+        while True:
+            if time.monotonic() >= next_requeue:
+                # рядки воркерів, що впали в інших репліках: оренда минула
+                next_requeue = time.monotonic() + OUTBOX_REQUEUE_INTERVAL
+                try:
+                    requeued = await adb.requeue_outbox(self.shard)
+                    if requeued:
+                        logging.warning(f"Outbox: {requeued} messages with an expired lease returned to the queue")
+                except Exception as e:
+                    logging.error(f"Outbox requeue error: {e}")
+            if self._recovering:
+                await self._recover()
+            try:
+                rows = await adb.claim_outbox(self.batch_size, self.shard, self.owner)
+            except Exception as e:
+                logging.error(f"Outbox claim error: {e}")
+                rows = []
+            if not rows:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.idle_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                for message_id, group in itertools.groupby(rows, key=lambda row: row["message_id"]):
+                    group = list(group)
+                    await self._deliver(message_id, [row["chat_id"] for row in group], group[0]["text"])
+                await self._flush()
+            except Exception as e:
+                logging.error(f"Outbox delivery error: {e}")
+                await self._recover()
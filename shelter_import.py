@@ -0,0 +1,258 @@
+# shelter_import.py - Потоковий імпорт реєстрів укриттів (CSV / GeoJSON)
+#
+# Запуск: python shelter_import.py registry.csv [--format csv|geojson] [--chunk-size 1000]
+# Файл читається потоково, кожен рядок валідується і нормалізується, а валідні
+# рядки пишуться пачками по chunk_size через executemany - одна транзакція на
+# пачку. Запис іде через upsert (database.upsert_shelters), тож повторний імпорт
+# того самого реєстру оновлює укриття замість дублювання, а перерваний імпорт
+# можна просто запустити ще раз.
+import argparse
+import csv
+import io
+import itertools
+import json
+import re
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+import database as db
+
+MAX_REPORTED_ERRORS = 1000
+
+# Назви колонок/властивостей у різних реєстрах -> поле таблиці shelters
+FIELD_ALIASES = {
+    "region": ("region", "oblast", "область", "регіон"),
+    "city": ("city", "settlement", "town", "місто", "населений пункт", "нп"),
+    "address": ("address", "addr", "адреса"),
+    "shelter_type": ("shelter_type", "type", "kind", "тип", "тип укриття"),
+    "capacity": ("capacity", "місткість", "кількість місць"),
+    "lat": ("lat", "latitude", "y", "широта"),
+    "lon": ("lon", "lng", "long", "longitude", "x", "довгота"),
+    "description": ("description", "notes", "comment", "опис", "примітка"),
+}
+_ALIAS_TO_FIELD = {alias: name for name, aliases in FIELD_ALIASES.items() for alias in aliases}
+
+# Межі України з запасом: відсікають переплутані lat/lon і нулі
+LAT_RANGE = (43.0, 53.5)
+LON_RANGE = (21.0, 41.5)
+
+_SPACES = re.compile(r"\s+")
+
+@dataclass
+class ImportReport:
+    read: int = 0
+    imported: int = 0
+    inserted: int = 0
+    updated: int = 0
+    failed: int = 0
+    errors: List[Tuple[int, str]] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+    def add_error(self, row_number: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row_number, message))
+
+    def summary(self) -> str:
+        return (f"Прочитано {self.read}, імпортовано {self.imported} "
+                f"(нових {self.inserted}, оновлено {self.updated}), помилок {self.failed} "
+                f"за {self.elapsed:.1f} с ({self.rate:.0f} рядків/с)")
+
+def _clean(value) -> str:
+    return _SPACES.sub(" ", str(value)).strip() if value is not None else ""
+
+def _region_names() -> Dict[str, str]:
+    # "київська", "київська область", "Київська обл." -> "Київська область"
+    names = {}
+    for region in db.get_all_regions():
+        name = region["name"]
+        names[name.lower()] = name
+        if name.endswith(" область"):
+            base = name[:-len(" область")].lower()
+            names[base] = name
+            names[f"{base} обл."] = name
+            names[f"{base} обл"] = name
+    return names
+
+def _coordinate(value, name: str, bounds: Tuple[float, float]) -> Optional[float]:
+    value = _clean(value).replace(",", ".")
+    if not value:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"{name}: не число ({value!r})")
+    if not bounds[0] <= number <= bounds[1]:
+        raise ValueError(f"{name}: {number} поза межами України")
+    return round(number, 6)
+
+def normalize_row(raw: Dict, regions: Dict[str, str]) -> Tuple:
+    row = {}
+    for key, value in raw.items():
+        name = _ALIAS_TO_FIELD.get(_clean(key).lower()) if key is not None else None
+        if name and name not in row:
+            row[name] = value
+
+    region, city, address = (_clean(row.get(k)) for k in ("region", "city", "address"))
+    missing = [k for k, v in (("region", region), ("city", city), ("address", address)) if not v]
+    if missing:
+        raise ValueError(f"порожні обов'язкові поля: {', '.join(missing)}")
+    region = regions.get(region.lower(), region)
+
+    capacity = _clean(row.get("capacity")).replace(" ", "")
+    try:
+        capacity = int(float(capacity)) if capacity else 0
+    except (ValueError, OverflowError):
+        # OverflowError - "inf" чи "1e400": float їх приймає, int уже ні
+        raise ValueError(f"capacity: не число ({capacity!r})")
+    if capacity < 0:
+        raise ValueError(f"capacity: від'ємне значення {capacity}")
+
+    lat = _coordinate(row.get("lat"), "lat", LAT_RANGE)
+    lon = _coordinate(row.get("lon"), "lon", LON_RANGE)
+    if (lat is None) != (lon is None):
+        raise ValueError("вказана лише одна координата")
+
+    shelter_type = _clean(row.get("shelter_type")).lower() or "укриття"
+    description = _clean(row.get("description")) or None
+    return region, city, address, shelter_type, capacity, lat, lon, description
+
+def iter_csv(stream: TextIO) -> Iterator[Tuple[int, Dict]]:
+    # Роздільник (, ; або табуляція) визначається за початком файлу
+    sample = stream.read(16384)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    # дочитуємо обірваний рядок зразка і продовжуємо з того ж потоку
+    reader = csv.DictReader(itertools.chain(io.StringIO(sample + stream.readline()), stream), dialect=dialect)
+    for row in reader:
+        # номер рядка у файлі (з урахуванням заголовка) для звіту про помилки
+        yield reader.line_num, row
+
+def iter_geojson(stream: TextIO, chunk_size: int = 1 << 16) -> Iterator[Tuple[int, Dict]]:
+    # FeatureCollection розбирається потоково: шукаємо масив "features" і
+    # декодуємо його елементи по одному, не завантажуючи файл у пам'ять
+    decoder = json.JSONDecoder()
+    buf, pos = "", 0
+
+    def more() -> bool:
+        nonlocal buf, pos
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return False
+        buf, pos = buf[pos:] + chunk, 0
+        return True
+
+    start = re.compile(r'"features"\s*:\s*\[')
+    while True:
+        match = start.search(buf)
+        if match:
+            pos = match.end()
+            break
+        if not more():
+            raise ValueError("GeoJSON: не знайдено масив features")
+
+    separator = re.compile(r"[\s,]*")
+    number = 0
+    while True:
+        pos = separator.match(buf, pos).end()
+        if pos >= len(buf):
+            if not more():
+                raise ValueError("GeoJSON: файл обірвано всередині features")
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            feature, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if not more():
+                raise ValueError(f"GeoJSON: некоректний об'єкт #{number + 1}")
+            continue
+        pos = end
+        number += 1
+        yield number, _feature_row(feature)
+
+def _feature_row(feature) -> Dict:
+    if not isinstance(feature, dict):
+        return {}
+    row = dict(feature.get("properties") or {})
+    geometry = feature.get("geometry") or {}
+    if geometry.get("type") == "Point" and len(geometry.get("coordinates") or ()) >= 2:
+        # GeoJSON зберігає точку як [довгота, широта]
+        row["lon"], row["lat"] = geometry["coordinates"][:2]
+    elif geometry:
+        row["lat"] = row["lon"] = None
+    return row
+
+def detect_format(filename: str) -> str:
+    return "geojson" if filename.lower().endswith((".geojson", ".json")) else "csv"
+
+def import_shelters(stream: TextIO, fmt: str = "csv", chunk_size: int = 1000,
+                    on_progress=None) -> ImportReport:
+    report = ImportReport()
+    rows = iter_geojson(stream) if fmt == "geojson" else iter_csv(stream)
+    regions = _region_names()
+    before = db.get_shelters_count()
+    started = time.perf_counter()
+    chunk: List[Tuple] = []
+
+    def flush():
+        report.imported += db.upsert_shelters(chunk)
+        chunk.clear()
+        if on_progress:
+            on_progress(report)
+
+    try:
+        for row_number, raw in rows:
+            report.read += 1
+            try:
+                chunk.append(normalize_row(raw, regions))
+            except ValueError as e:
+                report.add_error(row_number, str(e))
+                continue
+            if len(chunk) >= chunk_size:
+                flush()
+    except (ValueError, csv.Error, UnicodeDecodeError) as e:
+        # помилка формату файлу: те, що вже прочитано, все одно зберігаємо
+        report.add_error(report.read + 1, str(e))
+    if chunk:
+        flush()
+
+    report.elapsed = time.perf_counter() - started
+    report.inserted = db.get_shelters_count() - before
+    report.updated = report.imported - report.inserted
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Імпорт реєстру укриттів з CSV або GeoJSON")
+    parser.add_argument("file")
+    parser.add_argument("--format", choices=("csv", "geojson"))
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--encoding", default="utf-8-sig")
+    args = parser.parse_args()
+
+    db.init_db()
+    fmt = args.format or detect_format(args.file)
+    progress = lambda r: print(f"\r{r.read} рядків, {r.read / (time.perf_counter() - t0):.0f}/с",
+                               end="", file=sys.stderr, flush=True)
+    t0 = time.perf_counter()
+    with open(args.file, encoding=args.encoding, newline="") as f:
+        report = import_shelters(f, fmt, args.chunk_size, on_progress=progress)
+    print(file=sys.stderr)
+
+    print(f"✅ {report.summary()}")
+    for row_number, message in report.errors[:50]:
+        print(f"   рядок {row_number}: {message}")
+    if report.failed > 50:
+        print(f"   ... і ще {report.failed - 50} помилок")
+    sys.exit(1 if report.failed and not report.imported else 0)
+
+if __name__ == "__main__":
+    main()
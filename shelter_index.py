@@ -0,0 +1,95 @@
+# shelter_index.py - Пошук найближчих укриттів за координатами
+#
+# In-memory сітка: укриття розкладені по комірках CELL_DEG × CELL_DEG
+# градусів. Пошук k найближчих обходить кільця комірок навколо точки і
+# зупиняється, щойно жодна комірка наступного кільця вже не може бути
+# ближчою за k-те знайдене укриття. Індекс перебудовується, коли змінюється
+# лічильник data_versions['shelters'] (тригери на таблиці shelters).
+import heapq
+import math
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import database as db
+
+CELL_DEG = 0.05
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = math.pi * EARTH_RADIUS_KM / 180
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+class ShelterIndex:
+    def __init__(self, cell_deg: float = CELL_DEG):
+        self.cell_deg = cell_deg
+        self.version: Optional[int] = None
+        self._cells: Dict[Tuple[int, int], List[Tuple[float, float, int]]] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def build(self, points: Iterable[Tuple[int, float, float]], version: Optional[int] = None):
+        cells: Dict[Tuple[int, int], List[Tuple[float, float, int]]] = {}
+        size = 0
+        for shelter_id, lat, lon in points:
+            cells.setdefault(self._cell(lat, lon), []).append((lat, lon, shelter_id))
+            size += 1
+        self._cells, self._size, self.version = cells, size, version
+
+    def refresh(self):
+        # O(1) перевірка версії; повна перебудова лише після змін у shelters
+        version = db.get_data_version("shelters")
+        if version != self.version:
+            with self._lock:
+                if version != self.version:
+                    self.build(db.iter_shelter_points(), version)
+
+    def nearest(self, lat: float, lon: float, k: int = 5, max_km: float = 50.0) -> List[Tuple[float, int]]:
+        cells = self._cells
+        if not cells:
+            return []
+        cy, cx = self._cell(lat, lon)
+        # мінімальна ширина комірки в км (довгота стискається до полюсів)
+        cell_km = self.cell_deg * KM_PER_DEG_LAT * min(1.0, math.cos(math.radians(min(abs(lat) + self.cell_deg, 89.0))))
+        max_ring = int(max_km / cell_km) + 1
+        best: List[Tuple[float, int]] = []
+
+        for ring in range(max_ring + 1):
+            if len(best) == k and -best[0][0] <= (ring - 1) * cell_km:
+                break
+            for dy in range(-ring, ring + 1):
+                step = 1 if abs(dy) == ring else 2 * ring
+                for dx in range(-ring, ring + 1, step):
+                    for plat, plon, shelter_id in cells.get((cy + dy, cx + dx), ()):
+                        distance = haversine_km(lat, lon, plat, plon)
+                        if distance > max_km:
+                            continue
+                        if len(best) < k:
+                            heapq.heappush(best, (-distance, shelter_id))
+                        elif distance < -best[0][0]:
+                            heapq.heapreplace(best, (-distance, shelter_id))
+
+        return sorted((-d, shelter_id) for d, shelter_id in best)
+
+    def nearest_shelters(self, lat: float, lon: float, k: int = 5, max_km: float = 50.0) -> List[Dict]:
+        self.refresh()
+        found = self.nearest(lat, lon, k, max_km)
+        if not found:
+            return []
+        shelters = {s["id"]: s for s in db.get_shelters_by_ids([shelter_id for _, shelter_id in found])}
+        return [
+            {**shelters[shelter_id], "distance_km": distance}
+            for distance, shelter_id in found
+            if shelter_id in shelters
+        ]
+
+index = ShelterIndex()
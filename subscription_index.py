@@ -0,0 +1,101 @@
+# subscription_index.py - In-memory індекс підписок для миттєвого розсилання тривог
+#
+# Областей 25, тож підписки користувача вміщуються в 32-бітну маску.
+# Індекс тримає відсортований масив user_id (int64) і паралельний масив
+# масок (uint32): ~12 байт на користувача. Пошук "усі, хто підписаний на
+# будь-яку з цих областей" - одна векторна операція numpy над масками
+# (або прохід у чистому Python, якщо numpy не встановлено).
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+import database as db
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAX_REGIONS = 32
+
+class SubscriptionIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = array("q")
+        self._masks = array("I")
+        self._bits: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def set_regions(self, region_uids: Iterable[str]):
+        # біти призначаються в порядку надходження
+        with self._lock:
+            for uid in region_uids:
+                if uid not in self._bits:
+                    if len(self._bits) >= MAX_REGIONS:
+                        raise ValueError(f"Індекс підтримує не більше {MAX_REGIONS} областей")
+                    self._bits[uid] = len(self._bits)
+
+    def load(self):
+        self.set_regions(r["uid"] for r in db.get_all_regions())
+        self.bulk_load(db.iter_user_region_uids())
+
+    def bulk_load(self, rows: Iterable[Tuple[int, str]]):
+        # rows: пари (user_id, region_uid), відсортовані за user_id
+        ids = array("q")
+        masks = array("I")
+        for user_id, uid in rows:
+            bit = self._bits.get(uid)
+            if bit is None:
+                continue
+            if ids and ids[-1] == user_id:
+                masks[-1] |= 1 << bit
+            else:
+                ids.append(user_id)
+                masks.append(1 << bit)
+        with self._lock:
+            self._ids = ids
+            self._masks = masks
+
+    def mask(self, region_uids: Iterable[str]) -> int:
+        mask = 0
+        for uid in region_uids:
+            bit = self._bits.get(uid)
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def set_user(self, user_id: int, region_uids: Iterable[str]):
+        mask = self.mask(region_uids)
+        with self._lock:
+            pos = bisect_left(self._ids, user_id)
+            if pos < len(self._ids) and self._ids[pos] == user_id:
+                self._masks[pos] = mask
+            elif mask:
+                self._ids.insert(pos, user_id)
+                self._masks.insert(pos, mask)
+
+    def users_for_regions(self, region_uids: Iterable[str]) -> List[int]:
+        mask = self.mask(region_uids)
+        if not mask:
+            return []
+        with self._lock:
+            if np is not None:
+                ids = np.frombuffer(self._ids, dtype=np.int64)
+                masks = np.frombuffer(self._masks, dtype=np.uint32)
+                result = ids[(masks & np.uint32(mask)) != 0].tolist()
+                # views тримають буфер масивів; звільняємо до виходу з-під блокування
+                del ids, masks
+                return result
+            return [user_id for user_id, m in zip(self._ids, self._masks) if m & mask]
+
+    def memory_bytes(self) -> int:
+        return self._ids.itemsize * len(self._ids) + self._masks.itemsize * len(self._masks)
+
+    def on_db_event(self, event: str, **payload):
+        if event == "user_regions":
+            self.set_user(payload["user_id"], payload["region_uids"])
+
+index = SubscriptionIndex()
@@ -0,0 +1,22 @@
+# conftest.py - Спільні фікстури тестів
+#
+# Кожен тест працює на власній тимчасовій базі: DB_FILE задається до
+# імпорту database, тож alerts_bot.db не відкривається взагалі.
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(), "tests.db"))
+
+import database as db
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_FILE", tmp_path / "test.db")
+    db.init_db()
+    yield db
+    db.close_pool()
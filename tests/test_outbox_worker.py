@@ -0,0 +1,53 @@
+# test_outbox_worker.py - OutboxWorker після збою запису результатів
+import asyncio
+import collections
+
+import async_db as adb
+from sender import OutboxWorker
+
+class RecordingSender:
+    def __init__(self):
+        self.sent = collections.Counter()
+
+    async def broadcast(self, chat_ids, text, on_result=None, **kwargs):
+        for chat_id in chat_ids:
+            self.sent[chat_id] += 1
+            await on_result(chat_id, True)
+
+def test_failed_mark_requeues_undelivered_rows_without_resending(database, monkeypatch):
+    database.enqueue_message("test:first", "alert", "перше", [1, 2])
+    database.enqueue_message("test:second", "alert", "друге", [3, 4])
+    mark_outbox_many = database.mark_outbox_many
+    failures = [RuntimeError("database is locked")] * 2
+
+    def flaky_mark_outbox_many(results, owner=None):
+        # перший запис падає і в _deliver, і в повторі після збою
+        if failures:
+            raise failures.pop()
+        return mark_outbox_many(results, owner)
+
+    flaky_mark_outbox_many.__module__ = database.__name__
+    monkeypatch.setattr(database, "mark_outbox_many", flaky_mark_outbox_many)
+    monkeypatch.setattr(adb, "_wrapped", {})
+
+    def statuses():
+        with database.get_db() as conn:
+            return dict(conn.execute("SELECT chat_id, status FROM outbox").fetchall())
+
+    async def deliver():
+        sender = RecordingSender()
+        worker = OutboxWorker(sender, idle_interval=0.01, owner="test")
+        task = asyncio.create_task(worker.run())
+        try:
+            for _ in range(500):
+                if set((await adb.run(statuses)).values()) == {database.OUTBOX_SENT}:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            task.cancel()
+        return sender
+
+    sender = asyncio.run(deliver())
+    assert not failures
+    assert statuses() == {chat_id: database.OUTBOX_SENT for chat_id in (1, 2, 3, 4)}
+    assert sender.sent == {1: 1, 2: 1, 3: 1, 4: 1}
@@ -0,0 +1,21 @@
+# test_users_page.py - Сторінки користувачів з фільтром за областю
+def seen_at(minute: int) -> str:
+    # формат CURRENT_TIMESTAMP, як у activity.utc_timestamp
+    return f"2026-01-01 12:{minute:02d}:00"
+
+def test_region_page_includes_user_subscribed_before_first_flush(database):
+    region = database.get_all_regions()[0]
+    database.touch_users([(uid, None, None, seen_at(50 - uid)) for uid in (1, 2, 3)])
+    for uid in (1, 2, 3):
+        database.update_user_regions(uid, [region["name"]])
+    # підписка раніше за рядок users: буфер активності ще не скинув користувача
+    database.update_user_regions(4, [region["name"]])
+    database.touch_users([(4, None, None, seen_at(40))])
+
+    seen, cursor = [], None
+    while True:
+        users, cursor = database.get_users_page(limit=2, cursor=cursor, region_uid=region["uid"])
+        seen.extend(user["user_id"] for user in users)
+        if cursor is None:
+            break
+    assert seen == [1, 2, 3, 4]
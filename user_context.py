@@ -0,0 +1,110 @@
+# user_context.py - Дані користувача один раз на оновлення (aiogram middleware)
+#
+# Зовнішній middleware на dp.update бере рядок користувача разом з його
+# областями (один SELECT: _USER_SELECT уже містить regions) і передає їх
+# хендлерам як аргументи user і user_regions. Рядки тримаються в
+# обмеженому LRU-кеші з TTL, тож типове оновлення взагалі не звертається
+# до бази. Записи в цьому процесі (update_user_regions, update_user_role)
+# скидають запис кешу через слухача database; зміни з інших процесів
+# (адмін-панель, інші репліки) підхоплюються після USER_CACHE_TTL секунд.
+# Там само фіксується активність: username/full_name/last_seen з кожного
+# оновлення йдуть у activity.buffer і накладаються на рядок з кешу.
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+import async_db as adb
+import activity
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+
+# події database, після яких кешований рядок користувача застарів
+INVALIDATING_EVENTS = ("user_regions", "user_role")
+
+class UserCache:
+    def __init__(self, max_entries: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # лічильник скидань: рядок, прочитаний до скидання, не кешується
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, user_id: int) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id: int, user: Dict, generation: int):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[user_id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user_id)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def on_db_event(self, event: str, **payload):
+        if event in INVALIDATING_EVENTS and "user_id" in payload:
+            self.invalidate(payload["user_id"])
+
+def user_regions(user: Optional[Dict]) -> List[str]:
+    return user["regions"].split(",") if user and user["regions"] else []
+
+class UserContextMiddleware(BaseMiddleware):
+    def __init__(self, cache: UserCache, buffer: activity.ActivityBuffer = activity.buffer):
+        self.cache = cache
+        self.buffer = buffer
+
+    async def load(self, user_id: int) -> Optional[Dict]:
+        user = self.cache.get(user_id)
+        if user is None:
+            generation = self.cache.generation
+            user = await adb.get_user(user_id)
+            # незареєстрованих не кешуємо: рядок з'явиться після скидання буфера
+            if user is not None:
+                self.cache.put(user_id, user, generation)
+        return user
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        from_user = data.get("event_from_user")
+        if from_user is not None:
+            self.buffer.record(from_user.id, from_user.username, from_user.full_name)
+            user = self.buffer.overlay(from_user.id, await self.load(from_user.id))
+            # копії: хендлери можуть змінювати список областей
+            data["user"] = dict(user) if user else None
+            data["user_regions"] = user_regions(user)
+        return await handler(event, data)
+
+cache = UserCache()
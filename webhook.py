@@ -0,0 +1,121 @@
+# webhook.py - Режим webhook: вбудований aiohttp-сервер замість long polling
+#
+# Telegram надсилає оновлення POST-запитами на WEBHOOK_URL (через reverse
+# proxy). Сервер перевіряє секретний токен (WEBHOOK_SECRET обов'язковий),
+# кладе оновлення в обмежену чергу і одразу відповідає 200, а пул воркерів
+# паралельно обробляє їх через Dispatcher. Якщо черга переповнена, повертається 503 - Telegram повторить
+# доставку пізніше. Кілька реплік можуть стояти за одним proxy: кожна з них
+# обробляє свою частину оновлень.
+import asyncio
+import hmac
+import logging
+import os
+from typing import Optional
+
+from aiogram import Bot, Dispatcher, types
+from aiohttp import web
+
+import metrics
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "32"))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+WEBHOOK_QUEUE_DEPTH = metrics.Gauge("webhook_queue_depth", "Updates waiting for a webhook worker")
+WEBHOOK_REJECTED = metrics.Counter("webhook_rejected_total", "Updates rejected with 503 (queue full)")
+
+class WebhookServer:
+    def __init__(self, dp: Dispatcher, bot: Bot, secret: Optional[str] = WEBHOOK_SECRET,
+                 path: str = WEBHOOK_PATH, queue_size: int = WEBHOOK_QUEUE_SIZE,
+                 workers: int = WEBHOOK_WORKERS):
+        if not secret:
+            raise ValueError("webhook secret token is required")
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret
+        self.path = path
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks = []
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401)
+        try:
+            update = types.Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception:
+            return web.Response(status=400)
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            WEBHOOK_REJECTED.inc()
+            return web.Response(status=503)
+        WEBHOOK_QUEUE_DEPTH.set(self.queue.qsize())
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({"queue": self.queue.qsize(), "workers": len(self._tasks)})
+
+    async def _worker(self):
+        while True:
+            update = await self.queue.get()
+            WEBHOOK_QUEUE_DEPTH.set(self.queue.qsize())
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                logging.error(f"Update {update.update_id} failed: {e}")
+            finally:
+                self.queue.task_done()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get("/healthz", self.handle_health)
+        return app
+
+    async def start(self, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logging.info(f"Webhook server listening on {host}:{port}{self.path}")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        # Спершу перестаємо приймати запити, потім дообробляємо чергу
+        if self._runner:
+            await self._runner.cleanup()
+        try:
+            await asyncio.wait_for(self.queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Webhook queue not drained: {self.queue.qsize()} updates dropped")
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    if not WEBHOOK_URL:
+        raise ValueError("WEBHOOK_URL environment variable is required in webhook mode")
+    if not WEBHOOK_SECRET:
+        # без секрету будь-хто може надіслати підроблене оновлення від імені
+        # модератора (наприклад, /broadcast усім користувачам)
+        raise ValueError("WEBHOOK_SECRET environment variable is required in webhook mode")
+    server = WebhookServer(dp, bot)
+    await server.start()
+    # set_webhook ідемпотентний, тож кожна репліка може викликати його при старті
+    await bot.set_webhook(
+        WEBHOOK_URL,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=min(100, WEBHOOK_WORKERS * 2),
+    )
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()